@@ -4,3 +4,7 @@ from django.apps import AppConfig
 
 class DjangoCloudbridgeConfig(AppConfig):
     name = 'djcloudbridge'
+
+    def ready(self):
+        # Register signal receivers
+        from . import signals  # noqa
@@ -0,0 +1,125 @@
+"""
+Folder-style listing of bucket objects. Objects are listed under a key prefix,
+and keys that contain a delimiter after the prefix are rolled up into common
+prefixes, the "subfolders" of the prefix, as S3 does. Pages are referenced by
+a marker, the last key or common prefix of the previous page.
+"""
+from cloudbridge.cloud.base.resources import ServerPagedResultList
+from cloudbridge.cloud.factory import ProviderList
+
+from . import drf_helpers
+
+
+class BucketListing(ServerPagedResultList):
+    """
+    A page of bucket objects, along with the common prefixes of the page.
+    Its length only counts the objects, while the page size limits the
+    number of objects and common prefixes combined.
+    """
+
+    def __init__(self, objects, common_prefixes, is_truncated, marker):
+        super(BucketListing, self).__init__(is_truncated, marker, False,
+                                            data=objects)
+        self.common_prefixes = common_prefixes
+
+
+def list_objects(bucket, prefix=None, delimiter=None, limit=None,
+                 marker=None):
+    """
+    Lists the objects in the given bucket whose keys start with ``prefix``
+    and follow ``marker``, rolling keys containing ``delimiter`` after the
+    prefix up into common prefixes. At most ``limit`` objects and common
+    prefixes are returned, or all of them, if there is no limit.
+
+    On AWS, the prefix, delimiter and page size are passed through to S3,
+    so that a page costs a single request. CloudBridge does not support
+    delimiters for other providers, so keys are rolled up while paging
+    through the objects under the prefix instead. A marker naming an object
+    is passed through to the provider, so that a page costs about one page
+    of objects from the provider. A common prefix is not, since providers
+    that page on the client only accept object ids as markers, so listings
+    following one resume from the start of the prefix.
+
+    :rtype: :class:`BucketListing`
+    """
+    if bucket._provider.PROVIDER_ID == ProviderList.AWS:
+        return _list_s3_objects(bucket, prefix, delimiter, limit, marker)
+    kwargs = {'prefix': prefix} if prefix else {}
+    if marker and not (delimiter and marker.endswith(delimiter)):
+        kwargs['marker'] = marker
+    return _group_objects(drf_helpers.iter_provider_objects(
+        bucket.objects, **kwargs), prefix, delimiter, limit, marker)
+
+
+def _list_s3_objects(bucket, prefix, delimiter, limit, marker):
+    s3_bucket = bucket._bucket
+    kwargs = {'Bucket': s3_bucket.name}
+    for key, value in (('Prefix', prefix), ('Delimiter', delimiter),
+                       ('MaxKeys', limit)):
+        if value:
+            kwargs[key] = value
+    objects = []
+    common_prefixes = []
+    while True:
+        if marker:
+            kwargs['Marker'] = marker
+        response = s3_bucket.meta.client.list_objects(**kwargs)
+        contents = response.get('Contents', [])
+        for content in contents:
+            obj = s3_bucket.Object(content['Key'])
+            # Populate the object from the listing, so that it is not
+            # loaded from S3 once per object when serialized
+            obj.meta.data = {'ContentLength': content['Size'],
+                             'LastModified': content['LastModified'],
+                             'ETag': content.get('ETag')}
+            objects.append(_wrap_s3_object(bucket, obj))
+        page_prefixes = [common_prefix['Prefix'] for common_prefix
+                         in response.get('CommonPrefixes', [])]
+        common_prefixes.extend(page_prefixes)
+        is_truncated = response.get('IsTruncated', False)
+        # S3 only returns the next marker when given a delimiter
+        marker = response.get('NextMarker') or max(
+            [content['Key'] for content in contents] + page_prefixes,
+            default=None)
+        if limit or not is_truncated or not marker:
+            break
+    return BucketListing(objects, common_prefixes,
+                         bool(is_truncated and marker), marker)
+
+
+def _wrap_s3_object(bucket, s3_object):
+    # Only importable where boto3 is installed, which AWS buckets imply
+    from cloudbridge.cloud.providers.aws.resources import AWSBucketObject
+
+    return AWSBucketObject(bucket._provider, s3_object)
+
+
+def _group_objects(objects, prefix, delimiter, limit, marker):
+    prefix = prefix or ''
+    listed = []
+    common_prefixes = []
+    last_entry = None
+    for obj in objects:
+        name = obj.name
+        if not name.startswith(prefix):
+            continue
+        if marker and (name <= marker or (
+                delimiter and marker.endswith(delimiter) and
+                name.startswith(marker))):
+            continue
+        index = name.find(delimiter, len(prefix)) if delimiter else -1
+        if index >= 0:
+            entry = name[:index + len(delimiter)]
+            if entry == last_entry:
+                # Further keys rolled up into the same common prefix
+                continue
+        else:
+            entry = name
+        if limit and len(listed) + len(common_prefixes) >= limit:
+            return BucketListing(listed, common_prefixes, True, last_entry)
+        if index >= 0:
+            common_prefixes.append(entry)
+        else:
+            listed.append(obj)
+        last_entry = entry
+    return BucketListing(listed, common_prefixes, False, None)
@@ -0,0 +1,250 @@
+"""
+A registry of the kinds of clouds supported by djcloudbridge, keyed by
+``Cloud.kind``. Each kind knows how to build a cloudbridge provider config
+for its clouds, how to extract credentials from request headers and what
+extra data to expose through the API. Additional kinds can be supported by
+subclassing :class:`CloudKind` and calling :func:`register_cloud_kind`.
+"""
+import json
+
+from cloudbridge.cloud.factory import ProviderList
+
+from . import models
+
+
+class CloudKind(object):
+    """
+    Base class for a kind of cloud.
+
+    :type kind: str
+    :param kind: The value of ``Cloud.kind`` for clouds of this kind. This
+                 is the model name of the ``cloud_model``.
+
+    :type provider_name: str
+    :param provider_name: The name of the cloudbridge ``ProviderList``
+                          attribute identifying the provider for the kind.
+
+    :type supports_signed_urls: bool
+    :param supports_signed_urls: Whether bucket objects of the kind can be
+                                 handed out as signed URLs. Only enable this
+                                 where the provider signs URLs without
+                                 changing any account state.
+    """
+    kind = None
+    provider_name = None
+    cloud_model = None
+    credentials_model = None
+    supports_signed_urls = False
+
+    @property
+    def provider_id(self):
+        # Resolved lazily, since not every cloudbridge release supports all
+        # providers.
+        return getattr(ProviderList, self.provider_name)
+
+    def get_provider_config(self, cloud, cred_dict):
+        """
+        Returns the cloudbridge provider config for a given cloud and
+        credentials.
+        """
+        config = self.get_cloud_config(cloud)
+        config.update(cred_dict or {})
+        return config
+
+    def get_cloud_config(self, cloud):
+        """
+        Returns the cloud specific part of the provider config.
+        """
+        return {}
+
+    def get_request_credentials(self, request):
+        """
+        Extracts and returns the credentials from the current request's
+        headers. Returns an empty dict if not available.
+        """
+        return {}
+
+    def get_region_name(self, cloud):
+        return cloud.region_name
+
+    def get_extra_data(self, cloud):
+        """
+        Returns the kind specific cloud properties to include when
+        serializing a cloud.
+        """
+        return {}
+
+
+class AWSCloudKind(CloudKind):
+    kind = 'aws'
+    provider_name = 'AWS'
+    cloud_model = models.AWS
+    credentials_model = models.AWSCredentials
+    supports_signed_urls = True
+
+    def get_cloud_config(self, cloud):
+        return {'aws_region_name': cloud.region_name,
+                'ec2_is_secure': cloud.ec2_is_secure,
+                'ec2_validate_certs': cloud.ec2_validate_certs,
+                'ec2_endpoint_url': cloud.ec2_endpoint_url,
+                's3_is_secure': cloud.s3_is_secure,
+                's3_validate_certs': cloud.s3_validate_certs,
+                's3_endpoint_url': cloud.s3_endpoint_url}
+
+    def get_request_credentials(self, request):
+        aws_access_key = request.META.get('HTTP_CL_AWS_ACCESS_KEY')
+        aws_secret_key = request.META.get('HTTP_CL_AWS_SECRET_KEY')
+        if aws_access_key or aws_secret_key:
+            return {'aws_access_key': aws_access_key,
+                    'aws_secret_key': aws_secret_key,
+                    }
+        else:
+            return {}
+
+    def get_extra_data(self, cloud):
+        return {'region_name': cloud.region_name,
+                'ec2_endpoint_url': cloud.ec2_endpoint_url,
+                'ec2_is_secure': cloud.ec2_is_secure,
+                'ec2_validate_certs': cloud.ec2_validate_certs,
+                's3_endpoint_url': cloud.s3_endpoint_url,
+                's3_is_secure': cloud.s3_is_secure,
+                's3_validate_certs': cloud.s3_validate_certs
+                }
+
+
+class OpenStackCloudKind(CloudKind):
+    kind = 'openstack'
+    provider_name = 'OPENSTACK'
+    cloud_model = models.OpenStack
+    credentials_model = models.OpenStackCredentials
+    # cloudbridge signs temp URLs with a fixed, publicly known key, which it
+    # sets on the whole Swift account, allowing anyone to forge them.
+
+    def get_cloud_config(self, cloud):
+        return {'os_auth_url': cloud.auth_url,
+                'os_region_name': cloud.region_name}
+
+    def get_request_credentials(self, request):
+        os_username = request.META.get('HTTP_CL_OS_USERNAME')
+        os_password = request.META.get('HTTP_CL_OS_PASSWORD')
+
+        if os_username or os_password:
+            os_project_name = request.META.get('HTTP_CL_OS_PROJECT_NAME')
+            os_project_domain_name = request.META.get(
+                'HTTP_CL_OS_PROJECT_DOMAIN_NAME')
+            os_user_domain_name = request.META.get(
+                'HTTP_CL_OS_USER_DOMAIN_NAME')
+
+            d = {'os_username': os_username, 'os_password': os_password}
+            if os_project_name:
+                d['os_project_name'] = os_project_name
+            if os_project_domain_name:
+                d['os_project_domain_name'] = os_project_domain_name
+            if os_user_domain_name:
+                d['os_user_domain_name'] = os_user_domain_name
+            return d
+        else:
+            return {}
+
+    def get_extra_data(self, cloud):
+        return {'auth_url': cloud.auth_url,
+                'region_name': cloud.region_name,
+                'identity_api_version': cloud.identity_api_version
+                }
+
+
+class AzureCloudKind(CloudKind):
+    kind = 'azure'
+    provider_name = 'AZURE'
+    cloud_model = models.Azure
+    credentials_model = models.AzureCredentials
+    supports_signed_urls = True
+
+    def get_cloud_config(self, cloud):
+        return {'azure_region_name': cloud.region_name}
+
+    def get_request_credentials(self, request):
+        azure_subscription_id = request.META.get(
+            'HTTP_CL_AZURE_SUBSCRIPTION_ID')
+        azure_client_id = request.META.get('HTTP_CL_AZURE_CLIENT_ID')
+        azure_secret = request.META.get('HTTP_CL_AZURE_SECRET')
+        azure_tenant = request.META.get('HTTP_CL_AZURE_TENANT')
+        azure_resource_group = request.META.get('HTTP_CL_AZURE_RESOURCE_GROUP')
+        azure_storage_account = request.META.get(
+            'HTTP_CL_AZURE_STORAGE_ACCOUNT')
+        azure_vm_default_username = request.META.get(
+            'HTTP_CL_AZURE_VM_DEFAULT_USERNAME')
+
+        if (azure_subscription_id and azure_client_id and azure_secret and
+                azure_tenant):
+            return {'azure_subscription_id': azure_subscription_id,
+                    'azure_client_id': azure_client_id,
+                    'azure_secret': azure_secret,
+                    'azure_tenant': azure_tenant,
+                    'azure_resource_group': azure_resource_group,
+                    'azure_storage_account': azure_storage_account,
+                    'azure_vm_default_username': azure_vm_default_username
+                    }
+        else:
+            return {}
+
+    def get_extra_data(self, cloud):
+        return {'region_name': cloud.region_name}
+
+
+class GCECloudKind(CloudKind):
+    kind = 'gce'
+    provider_name = 'GCE'
+    cloud_model = models.GCE
+    credentials_model = models.GCECredentials
+
+    def get_provider_config(self, cloud, cred_dict):
+        config = {'gce_service_creds_dict': cred_dict,
+                  'gce_default_zone': cloud.zone_name,
+                  'gce_region_name': cloud.region_name}
+        config.update(cred_dict or {})
+        return config
+
+    def get_request_credentials(self, request):
+        gce_credentials_json = request.META.get('HTTP_CL_GCE_CREDENTIALS_JSON')
+
+        if gce_credentials_json:
+            return json.loads(gce_credentials_json)
+        else:
+            return {}
+
+    def get_extra_data(self, cloud):
+        return {'region_name': cloud.region_name,
+                'zone_name': cloud.zone_name
+                }
+
+
+_cloud_kinds = {}
+
+
+def register_cloud_kind(cloud_kind):
+    """
+    Registers a :class:`CloudKind` instance, replacing any previously
+    registered instance for the same kind.
+    """
+    _cloud_kinds[cloud_kind.kind] = cloud_kind
+
+
+def get_cloud_kinds():
+    """
+    Returns all registered :class:`CloudKind` instances.
+    """
+    return list(_cloud_kinds.values())
+
+
+def get_cloud_kind(kind):
+    """
+    Returns the registered :class:`CloudKind` for a given ``Cloud.kind`` or
+    ``None`` if the kind is not recognised.
+    """
+    return _cloud_kinds.get(kind)
+
+
+for _cloud_kind in (AWSCloudKind(), OpenStackCloudKind(), AzureCloudKind(),
+                    GCECloudKind()):
+    register_cloud_kind(_cloud_kind)
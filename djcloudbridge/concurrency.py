@@ -0,0 +1,85 @@
+"""
+Helpers for making provider calls concurrently on a bounded pool of threads.
+Provider calls are dominated by network latency, so running independent calls
+side by side makes the total latency that of the slowest call, rather than the
+sum of all of them.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError
+from concurrent.futures import wait
+
+from django import db
+from django.conf import settings
+
+
+class TaskResult(object):
+    """
+    The outcome of calling a function for a single item. Exactly one of
+    ``value`` and ``error`` is meaningful, depending on whether the call
+    raised an exception. Calls that did not complete in time have a
+    ``TimeoutError`` as their ``error``.
+    """
+
+    def __init__(self, item, value=None, error=None):
+        self.item = item
+        self.value = value
+        self.error = error
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    @property
+    def timed_out(self):
+        return isinstance(self.error, TimeoutError)
+
+
+def get_max_workers():
+    return getattr(settings, 'DJCLOUDBRIDGE_MAX_WORKERS', 10)
+
+
+def run_concurrently(func, items, max_workers=None, timeout=None):
+    """
+    Calls ``func(item)`` for each of the given items on a pool of at most
+    ``max_workers`` threads, defaulting to the DJCLOUDBRIDGE_MAX_WORKERS
+    setting.
+
+    Calls that have not completed within ``timeout`` seconds are reported as
+    timed out. Such calls cannot be interrupted, so they are left to finish
+    in the background, without holding up the caller.
+
+    Each thread closes its database connections once done, since django
+    opens a separate connection per thread.
+
+    :rtype: ``list`` of :class:`TaskResult`
+    :return: The results, in the same order as the items.
+    """
+    items = list(items)
+    if not items:
+        return []
+    executor = ThreadPoolExecutor(
+        max_workers=min(max_workers or get_max_workers(), len(items)))
+    try:
+        futures = [executor.submit(_call, func, item) for item in items]
+        wait(futures, timeout=timeout)
+    finally:
+        executor.shutdown(wait=False)
+
+    results = []
+    for item, future in zip(items, futures):
+        if not future.done():
+            future.cancel()
+            results.append(TaskResult(item, error=TimeoutError(
+                "Timed out after {0} seconds".format(timeout))))
+        elif future.exception() is not None:
+            results.append(TaskResult(item, error=future.exception()))
+        else:
+            results.append(TaskResult(item, value=future.result()))
+    return results
+
+
+def _call(func, item):
+    try:
+        return func(item)
+    finally:
+        db.connections.close_all()
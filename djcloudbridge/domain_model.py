@@ -4,9 +4,181 @@ base model. This layer is separate from the view in that it does not deal
 with requests directly and only with model objects - thus making it
 reusable without a related web request.
 """
-from cloudbridge.cloud.factory import CloudProviderFactory, ProviderList
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from datetime import timezone
 
+from cloudbridge.cloud.factory import CloudProviderFactory
+from django.conf import settings
+
+from . import cloud_kinds
 from . import models
+from . import util
+
+
+class ProviderPool(object):
+    """
+    A bounded, thread-safe pool of provider instances, keyed by cloud slug and
+    a fingerprint of the config used to create the provider. Entries are
+    evicted in least recently used order once ``max_size`` is exceeded, and
+    are discarded if they have not been used for more than ``ttl`` seconds.
+    """
+
+    def __init__(self, max_size=100, ttl=600):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._providers = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def fingerprint(config):
+        """
+        Returns a stable hash of the given config or credentials dictionary,
+        so that any credentials it holds need not be kept as part of the key.
+        """
+        serialized = json.dumps(config or {}, sort_keys=True, default=str)
+        return hashlib.sha256(serialized.encode('utf-8')).hexdigest()
+
+    def get_or_create(self, cloud_slug, config, factory):
+        """
+        Returns the pooled provider for the given cloud and provider config,
+        calling ``factory()`` to create one if none is available.
+        """
+        if not self.max_size:
+            return factory()
+        key = (cloud_slug, self.fingerprint(config))
+        now = time.monotonic()
+        with self._lock:
+            entry = self._providers.get(key)
+            if entry and now - entry[1] <= self.ttl:
+                self._providers[key] = (entry[0], now)
+                self._providers.move_to_end(key)
+                return entry[0]
+        # Construct outside the lock, since it may involve network calls
+        provider = factory()
+        with self._lock:
+            self._providers[key] = (provider, now)
+            self._providers.move_to_end(key)
+            self._evict_expired(now)
+            while len(self._providers) > self.max_size:
+                self._providers.popitem(last=False)
+        return provider
+
+    def evict(self, cloud_slug):
+        """
+        Discards all pooled providers for the given cloud.
+        """
+        with self._lock:
+            for key in [k for k in self._providers if k[0] == cloud_slug]:
+                del self._providers[key]
+
+    def clear(self):
+        with self._lock:
+            self._providers.clear()
+
+    def __len__(self):
+        return len(self._providers)
+
+    def _evict_expired(self, now):
+        # Entries are kept in least recently used order, so stop at the
+        # first entry that is still fresh.
+        while self._providers:
+            key, (_, last_used) = next(iter(self._providers.items()))
+            if now - last_used <= self.ttl:
+                break
+            del self._providers[key]
+
+
+provider_pool = ProviderPool(
+    max_size=getattr(settings, 'DJCLOUDBRIDGE_PROVIDER_POOL_SIZE', 100),
+    ttl=getattr(settings, 'DJCLOUDBRIDGE_PROVIDER_POOL_TTL', 600))
+
+
+def _cloud_cache_key(slug):
+    return 'djcloudbridge:cloud:{0}'.format(slug)
+
+
+def get_cloud(slug):
+    """
+    Returns the concrete cloud (e.g., ``AWS``, ``OpenStack``) for a given
+    slug or ``None`` if no such cloud exists.
+
+    Clouds are cached and the cached copy is invalidated whenever the cloud
+    is saved or deleted, so repeated lookups do not hit the database. On a
+    cache miss, the ``kind`` column is used to query the relevant subclass
+    table directly, instead of joining across all subclass tables.
+    """
+    cache = util.get_cache()
+    cloud = cache.get(_cloud_cache_key(slug))
+    if cloud is not None:
+        return cloud
+
+    kind = models.Cloud.objects.filter(slug=slug).values_list(
+        'kind', flat=True).first()
+    if kind is None:
+        return None
+    cloud_kind = cloud_kinds.get_cloud_kind(kind)
+    if cloud_kind:
+        cloud = cloud_kind.cloud_model.objects.filter(slug=slug).first()
+    else:
+        # The kind has not been recorded, so fall back to a subclass join
+        cloud = models.Cloud.objects.filter(
+            slug=slug).select_subclasses().first()
+    if cloud is not None:
+        cache.set(_cloud_cache_key(slug), cloud,
+                  getattr(settings, 'DJCLOUDBRIDGE_CLOUD_CACHE_TTL', 300))
+    return cloud
+
+
+def get_concrete_cloud(cloud):
+    """
+    Returns the concrete subclass instance for a given cloud. If a base
+    ``Cloud`` instance is passed in, the subclass is retrieved through the
+    cloud cache, otherwise the cloud is returned as is.
+    """
+    if type(cloud) is models.Cloud:
+        return get_cloud(cloud.slug)
+    return cloud
+
+
+def invalidate_cloud(slug):
+    """
+    Removes the given cloud from the cloud cache.
+    """
+    util.get_cache().delete(_cloud_cache_key(slug))
+
+
+def _deletion_collection(scope):
+    return ':'.join(str(part) for part in scope)
+
+
+def record_deletion(*scope):
+    """
+    Records the time at which an object was last deleted from a collection,
+    such as ``('clouds',)`` or ``('credentials', user_profile_id)``. Since
+    deleted rows no longer contribute to a collection's latest ``updated``
+    timestamp, this is needed to work out when a collection last changed.
+    The time is stored in the database, so that it is shared by all
+    processes and survives cache evictions.
+    """
+    models.Deletion.objects.update_or_create(
+        collection=_deletion_collection(scope),
+        defaults={'deleted': datetime.now(tz=timezone.utc)})
+
+
+def get_last_deletion(*scope):
+    """
+    Returns the time at which an object was last deleted from a collection,
+    as recorded by :func:`record_deletion`, or ``None`` if nothing has been
+    deleted from it.
+    """
+    return models.Deletion.objects.filter(
+        collection=_deletion_collection(scope)).values_list(
+            'deleted', flat=True).first()
 
 
 def get_cloud_provider(cloud, cred_dict):
@@ -19,40 +191,39 @@ def get_cloud_provider(cloud, cred_dict):
 
     :rtype: ``object`` of :class:`.dict`
     :return:  A dict containing the necessary credentials for the cloud.
+
+    Providers are pooled per cloud and provider config, so repeated calls
+    reuse an existing provider instead of constructing a new one. Since the
+    config covers the cloud's settings as well as the credentials, a
+    provider is never reused once its cloud has been edited, even by
+    processes that have not evicted it.
     """
-    # In case a base class instance is sent in, attempt to retrieve the actual
-    # subclass.
-    if type(cloud) is models.Cloud:
-        cloud = models.Cloud.objects.get_subclass(slug=cloud.slug)
-
-    if isinstance(cloud, models.OpenStack):
-        config = {'os_auth_url': cloud.auth_url,
-                  'os_region_name': cloud.region_name}
-        config.update(cred_dict or {})
-        return CloudProviderFactory().create_provider(ProviderList.OPENSTACK,
-                                                      config)
-    elif isinstance(cloud, models.AWS):
-        config = {'aws_region_name': cloud.region_name,
-                  'ec2_is_secure': cloud.ec2_is_secure,
-                  'ec2_validate_certs': cloud.ec2_validate_certs,
-                  'ec2_endpoint_url': cloud.ec2_endpoint_url,
-                  's3_is_secure': cloud.s3_is_secure,
-                  's3_validate_certs': cloud.s3_validate_certs,
-                  's3_endpoint_url': cloud.s3_endpoint_url}
-        config.update(cred_dict or {})
-        return CloudProviderFactory().create_provider(ProviderList.AWS,
-                                                      config)
-    elif isinstance(cloud, models.Azure):
-        config = {'azure_region_name': cloud.region_name}
-        config.update(cred_dict or {})
-        return CloudProviderFactory().create_provider(ProviderList.AZURE,
-                                                      config)
-    elif isinstance(cloud, models.GCE):
-        config = {'gce_service_creds_dict': cred_dict,
-                  'gce_default_zone': cloud.zone_name,
-                  'gce_region_name': cloud.region_name}
-        config.update(cred_dict or {})
-        return CloudProviderFactory().create_provider(ProviderList.GCE,
-                                                      config)
-    else:
+    return provider_pool.get_or_create(
+        cloud.slug, get_provider_config(cloud, cred_dict),
+        lambda: create_cloud_provider(cloud, cred_dict))
+
+
+def create_cloud_provider(cloud, cred_dict):
+    """
+    Creates a new provider for a cloud given a cloud model and a dictionary
+    containing the relevant credentials, bypassing the provider pool.
+    """
+    return CloudProviderFactory().create_provider(
+        _get_cloud_kind(cloud).provider_id,
+        get_provider_config(cloud, cred_dict))
+
+
+def get_provider_config(cloud, cred_dict):
+    """
+    Returns the cloudbridge provider config for a cloud given a cloud model
+    and a dictionary containing the relevant credentials.
+    """
+    return _get_cloud_kind(cloud).get_provider_config(
+        get_concrete_cloud(cloud), cred_dict)
+
+
+def _get_cloud_kind(cloud):
+    cloud_kind = cloud_kinds.get_cloud_kind(cloud.kind)
+    if not cloud_kind:
         raise Exception("Unrecognised cloud provider: %s" % cloud)
+    return cloud_kind
@@ -0,0 +1,138 @@
+"""
+Helpers for serving bucket object content, in whole or in part, with support
+for HTTP range requests, so that interrupted downloads can be resumed.
+"""
+import calendar
+import logging
+import re
+
+from django.conf import settings
+from django.utils.dateparse import parse_datetime
+from django.utils.http import http_date
+from django.utils.http import parse_http_date_safe
+
+from . import cloud_kinds
+from . import upload_handlers
+
+log = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+
+# Bucket object content is streamed through the application
+PROXY = 'proxy'
+# Binary downloads through the application redirect to a signed URL
+REDIRECT = 'redirect'
+# Download URLs of bucket objects are signed URLs themselves
+URL = 'url'
+
+range_re = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def get_download_mode():
+    return getattr(settings, 'DJCLOUDBRIDGE_DOWNLOAD_MODE', PROXY)
+
+
+def get_signed_url(cloud, bucket_object):
+    """
+    Returns a short-lived URL, signed by the provider, through which the
+    given bucket object of a cloud can be downloaded directly, without
+    passing through the application. The URL expires after
+    DJCLOUDBRIDGE_DOWNLOAD_URL_EXPIRY seconds. Returns None, in which case
+    the content should be proxied, if the cloud's kind does not support
+    signed URLs or the provider fails to sign one.
+    """
+    cloud_kind = cloud_kinds.get_cloud_kind(cloud.kind)
+    if not (cloud_kind and cloud_kind.supports_signed_urls):
+        return None
+    try:
+        return bucket_object.generate_url(
+            getattr(settings, 'DJCLOUDBRIDGE_DOWNLOAD_URL_EXPIRY', 300))
+    except Exception:
+        log.debug("Could not generate a signed URL for %s, falling back to "
+                  "proxying", bucket_object.name, exc_info=True)
+        return None
+
+
+def get_last_modified(bucket_object):
+    """
+    Returns the last modified time of the given bucket object as an HTTP
+    date, or None if the provider does not report it. Providers report it
+    as an ISO 8601 string, which is taken to be in UTC unless it says
+    otherwise.
+    """
+    value = getattr(bucket_object, 'last_modified', None)
+    value = parse_datetime(str(value)) if value else None
+    if not value:
+        return None
+    return http_date(calendar.timegm(value.utctimetuple()))
+
+
+def get_range(request, size, last_modified):
+    """
+    Returns the inclusive ``(start, end)`` byte span requested by the Range
+    header of the given request, or None if the whole object should be
+    served instead. That is the case without a Range header, for multiple
+    ranges, which are not supported, and when an If-Range header does not
+    match the object's last modified time. Since bucket objects have no
+    entity tags, If-Range headers holding one never match.
+
+    :raises RangeNotSatisfiable: if the range lies beyond the object.
+    """
+    header = request.META.get('HTTP_RANGE', '').replace(' ', '')
+    match = range_re.match(header)
+    if not match or not any(match.groups()):
+        return None
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if if_range and (not last_modified or parse_http_date_safe(if_range) !=
+                     parse_http_date_safe(last_modified)):
+        return None
+    start, end = match.groups()
+    if not start:
+        # A suffix range, covering the last ``end`` bytes
+        if not int(end) or not size:
+            raise RangeNotSatisfiable()
+        return max(size - int(end), 0), size - 1
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        raise RangeNotSatisfiable()
+    return start, end
+
+
+def supports_ranged_reads(bucket_object):
+    """
+    Returns whether the provider can read a byte span of the given bucket
+    object without reading the content before it, which is only the case
+    on AWS. Other providers still serve ranges, but have to stream the
+    content from its start.
+    """
+    return upload_handlers.get_s3_object(bucket_object) is not None
+
+
+def iter_range(bucket_object, start, end):
+    """
+    Iterates over the given inclusive byte span of a bucket object's content.
+    Where the provider supports ranged reads, only the span itself is
+    fetched. Elsewhere, the content is streamed from the start, discarding
+    the bytes before the span.
+    """
+    s3_object = upload_handlers.get_s3_object(bucket_object)
+    if s3_object:
+        body = s3_object.get(Range='bytes={0}-{1}'.format(start, end))['Body']
+        return iter(lambda: body.read(CHUNK_SIZE), b'')
+    return _skip_to_range(bucket_object.iter_content(), start, end)
+
+
+def _skip_to_range(chunks, start, end):
+    offset = 0
+    for chunk in chunks:
+        chunk_end = offset + len(chunk)
+        if chunk_end > start:
+            yield chunk[max(start - offset, 0):end + 1 - offset]
+        if chunk_end > end:
+            break
+        offset = chunk_end
@@ -1,19 +1,175 @@
+import base64
+import copy
+import itertools
+import json
+import re
 from abc import ABCMeta, abstractmethod
+from collections import OrderedDict
 
 from cloudbridge.cloud.interfaces.resources import CloudResource
+from cloudbridge.cloud.interfaces.resources import ResultList
+from django.conf import settings
+from django.core import signing
 from django.core.exceptions import ObjectDoesNotExist
 from django.urls import NoReverseMatch
+from django.db.models import Max
+from django.utils.http import http_date
+from django.utils.http import parse_etags
+from django.utils.http import parse_http_date_safe
+from django.http.request import HttpRequest
 from django.http.response import Http404
+from django.http.response import StreamingHttpResponse
 from rest_framework import mixins
 from rest_framework import relations
 from rest_framework import serializers
+from rest_framework import status
 from rest_framework import viewsets
+from rest_framework.decorators import action
+from rest_framework.exceptions import NotAcceptable
+from rest_framework.exceptions import NotFound
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.request import ForcedAuthentication
+from rest_framework.request import Request
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils import encoders
+from rest_framework.utils.urls import replace_query_param
 
+from . import concurrency
+from . import provider_cache
 from . import util
 from . import view_helpers
 
 
+# ========================================
+# Django Rest Framework Pagination Helpers
+# ========================================
+class ProviderCursorPagination(BasePagination):
+    """
+    A cursor based pagination style for provider listings. When a view lists
+    objects through ``list_provider_objects()``, the page size and cursor are
+    passed through to cloudbridge's ``list(limit, marker)``, so that only the
+    requested page is fetched from the provider. The next page is referenced
+    through a signed cursor wrapping the provider's marker, so that clients
+    cannot forge cursors.
+
+    Listings that are not fetched through ``list_provider_objects()`` are
+    paged in memory instead, in which case the cursor wraps an offset.
+    """
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+    cursor_salt = 'djcloudbridge.drf_helpers.ProviderCursorPagination'
+
+    def __init__(self):
+        self.provider_paged = False
+        self.count = None
+        self.next_cursor = None
+
+    def get_page_size(self, request):
+        if self.page_size_query_param:
+            try:
+                page_size = int(
+                    request.query_params[self.page_size_query_param])
+                if page_size > 0:
+                    return min(page_size, self.max_page_size)
+            except (KeyError, ValueError):
+                pass
+        return self.page_size
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return {}
+        try:
+            payload = signing.Signer(salt=self.cursor_salt).unsign(encoded)
+            cursor = json.loads(
+                base64.urlsafe_b64decode(payload.encode('ascii')).decode())
+        except (signing.BadSignature, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(cursor, dict):
+            raise NotFound(self.invalid_cursor_message)
+        return cursor
+
+    def encode_cursor(self, cursor):
+        # Unlike signing.dumps(), the signature carries no timestamp, so that
+        # the next link, and hence the ETag, of an unchanged page is stable.
+        payload = base64.urlsafe_b64encode(json.dumps(
+            cursor, sort_keys=True, separators=(',', ':')).encode())
+        return signing.Signer(salt=self.cursor_salt).sign(
+            payload.decode('ascii'))
+
+    def get_provider_list_kwargs(self, request):
+        """
+        Returns the ``limit`` and ``marker`` arguments to pass through to a
+        cloudbridge ``list()`` method for the requested page.
+        """
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return {}
+        self.provider_paged = True
+        return {'limit': page_size,
+                'marker': self.decode_cursor(request).get('marker')}
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+
+        if self.provider_paged and isinstance(queryset, ResultList):
+            # The provider has already returned only the requested page
+            if queryset.is_truncated and queryset.marker:
+                self.next_cursor = {'marker': queryset.marker}
+            if queryset.supports_total:
+                self.count = queryset.total_results
+            return list(queryset)
+
+        objects = list(queryset)
+        offset = self.decode_cursor(request).get('offset', 0)
+        if not isinstance(offset, int) or offset < 0:
+            raise NotFound(self.invalid_cursor_message)
+        self.count = len(objects)
+        if offset + page_size < len(objects):
+            self.next_cursor = {'offset': offset + page_size}
+        return objects[offset:offset + page_size]
+
+    def get_next_link(self):
+        if not self.next_cursor:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(),
+                                   self.cursor_query_param,
+                                   self.encode_cursor(self.next_cursor))
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('count', self.count),
+            ('next', self.get_next_link()),
+            ('results', data)
+        ]))
+
+
+def iter_provider_objects(service, **kwargs):
+    """
+    Returns an iterator over all the objects in a cloudbridge service (or
+    container), fetching them from the provider one page at a time. The first
+    page is fetched immediately, so that errors are raised by this call.
+    """
+    page = service.list(**kwargs)
+    return itertools.chain(page, _iter_remaining_pages(service, page, kwargs))
+
+
+def _iter_remaining_pages(service, page, kwargs):
+    while getattr(page, 'is_truncated', False) and page.marker:
+        page = service.list(**dict(kwargs, marker=page.marker))
+        for obj in page:
+            yield obj
+
+
 # ==================================
 # Django Rest Framework View Helpers
 # ==================================
@@ -25,10 +181,209 @@ class CustomNonModelObjectMixin(object):
     DRF's serializers.
     """
     __metaclass__ = ABCMeta
+    pagination_class = ProviderCursorPagination
+    # Clients can request a streamed, unpaginated listing in one of these
+    # formats through the ``stream`` query parameter.
+    stream_query_param = 'stream'
+    streaming_formats = {'json': 'application/json',
+                         'ndjson': 'application/x-ndjson'}
+    streaming = False
+    # Listings can be filtered by these attributes through query parameters
+    # of the same name, and searched through the ``search`` query parameter.
+    # Filters on ``provider_find_fields`` are pushed down to the provider's
+    # ``find()`` where possible.
+    provider_filter_fields = ('name',)
+    provider_search_fields = ('id', 'name')
+    provider_find_fields = ('name',)
+    search_query_param = 'search'
+    # Clients can retrieve several objects at once through a comma separated
+    # list of ids in the ``ids`` query parameter.
+    ids_query_param = 'ids'
+    max_batch_size = 100
+    # Set to cache this view's listings with a stale-while-revalidate
+    # strategy, using the TTLs configured for this name in the
+    # DJCLOUDBRIDGE_LIST_CACHE_TTLS setting.
+    list_cache_name = None
 
     def get_queryset(self):
         return self.list_objects()
 
+    def list(self, request, *args, **kwargs):
+        ids = request.query_params.get(self.ids_query_param)
+        if ids is not None:
+            return self.batch_retrieve(
+                [pk for pk in OrderedDict.fromkeys(ids.split(',')) if pk])
+        stream_format = request.query_params.get(self.stream_query_param)
+        if stream_format:
+            return self.stream_list(stream_format)
+        if (self.list_cache_name and
+                provider_cache.get_list_ttls(self.list_cache_name)):
+            return self.cached_list()
+        return super(CustomNonModelObjectMixin, self).list(
+            request, *args, **kwargs)
+
+    def batch_retrieve(self, ids):
+        """
+        Retrieves the objects with the given ids concurrently, through the
+        view's ``get_object()``, and returns those found, along with the ids
+        of those that were not. Lookups share the request's provider.
+        Failed lookups are reported per id under ``errors``.
+        """
+        if len(ids) > self.max_batch_size:
+            raise ValidationError({self.ids_query_param: [
+                "At most {0} ids may be requested at a time.".format(
+                    self.max_batch_size)]})
+        if ids:
+            # Create the shared provider before fanning out
+            view_helpers.get_cloud_provider(self)
+
+        found = []
+        missing = []
+        errors = []
+        for result in concurrency.run_concurrently(self._get_object_by_id,
+                                                   ids):
+            if isinstance(result.error, (Http404, NotFound)) or (
+                    result.ok and result.value is None):
+                missing.append(result.item)
+            elif not result.ok:
+                errors.append({'id': result.item, 'error': str(result.error)})
+            else:
+                found.append(result.value)
+        return Response(OrderedDict([
+            ('results', self.get_serializer(found, many=True).data),
+            ('missing', missing),
+            ('errors', errors)
+        ]))
+
+    def _get_object_by_id(self, pk):
+        # Look the object up through a copy of the view, so that concurrent
+        # lookups do not share the kwargs identifying the object.
+        view = copy.copy(self)
+        view.kwargs = dict(self.kwargs)
+        view.kwargs[self.lookup_url_kwarg or self.lookup_field] = pk
+        return view.get_object()
+
+    def cached_list(self):
+        """
+        Returns the listing from the stale-while-revalidate cache, reporting
+        how old it is in the ``Age`` header.
+        """
+        payload, age, self.payload_digest = provider_cache.get_list_payload(
+            self, self.list_cache_name, self.get_list_payload,
+            self.get_list_refresher)
+        response = Response(payload)
+        response['Age'] = str(int(age))
+        return response
+
+    def get_list_refresher(self):
+        """
+        Returns a function that recomputes the listing of the current request
+        in the background, once the response has been returned. It runs on a
+        copy of the view with a new request, rebuilt from the current
+        request's user, headers (including any credentials) and query
+        parameters, so that it shares no state, such as the paginator or the
+        memoized providers, with the finished request.
+        """
+        request = self.request
+        http_request = HttpRequest()
+        http_request.method = 'GET'
+        http_request.path = request.path
+        http_request.path_info = request.path_info
+        # Only keep the headers and server variables, not the input streams
+        http_request.META = {key: value for key, value in request.META.items()
+                             if isinstance(value, str)}
+        http_request.GET = request.query_params.copy()
+        view = copy.copy(self)
+        view.args = tuple(self.args)
+        view.kwargs = dict(self.kwargs)
+        view.request = Request(
+            http_request, negotiator=self.get_content_negotiator(),
+            authenticators=(ForcedAuthentication(request.user,
+                                                 request.auth),))
+        return view.get_list_payload
+
+    def get_list_payload(self):
+        """
+        Returns the serialized (and paginated) listing, as returned by list().
+        """
+        return super(CustomNonModelObjectMixin, self).list(
+            self.request, *self.args, **self.kwargs).data
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        # Changes made through this view must not be hidden by the list cache
+        if (self.list_cache_name and request.method not in SAFE_METHODS and
+                status.is_success(response.status_code)):
+            provider_cache.purge_list_payloads(self.kwargs.get('cloud_pk'),
+                                               self.list_cache_name)
+        if self.action in ('list', 'retrieve'):
+            response = self.get_conditional_response(request, response)
+        return super(CustomNonModelObjectMixin, self).finalize_response(
+            request, response, *args, **kwargs)
+
+    def get_conditional_response(self, request, response):
+        """
+        Tags a successful response with an ETag derived from its serialized
+        payload and the format it is rendered in. If the client already holds
+        a matching representation, as indicated by ``If-None-Match``, a
+        ``304 Not Modified`` response is returned instead, which saves
+        rendering and transferring the payload.
+        """
+        if (request.method not in ('GET', 'HEAD') or
+                not isinstance(response, Response) or
+                response.status_code != status.HTTP_200_OK or
+                not hasattr(request, 'accepted_renderer')):
+            return response
+        digest = (getattr(self, 'payload_digest', None) or
+                  provider_cache.get_payload_digest(response.data))
+        etag = '"{0}-{1}"'.format(digest, request.accepted_renderer.format)
+        if_none_match = parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+        if '*' in if_none_match or etag in [
+                tag[2:] if tag.startswith('W/') else tag
+                for tag in if_none_match]:
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        response['ETag'] = etag
+        return response
+
+    def stream_list(self, stream_format):
+        """
+        Returns a streaming response, in which the listed objects are fetched
+        from the provider a page at a time and serialized one by one as the
+        response is written. This keeps memory use flat and the time to first
+        byte low, even for very large listings.
+        """
+        if stream_format not in self.streaming_formats:
+            raise NotAcceptable(
+                "Unsupported stream format: {0}. Must be one of: {1}".format(
+                    stream_format, ", ".join(sorted(self.streaming_formats))))
+        self.streaming = True
+        # Retrieve the first page before starting the response, so that any
+        # errors can still be reported with the appropriate status code.
+        objects = self.filter_queryset(self.get_queryset())
+        if stream_format == 'ndjson':
+            content = self._iter_ndjson(objects)
+        else:
+            content = self._iter_json_array(objects)
+        return StreamingHttpResponse(
+            content, content_type=self.streaming_formats[stream_format])
+
+    def _iter_serialized(self, objects):
+        encoder = encoders.JSONEncoder()
+        # A single serializer, whose fields and URL templates are built once
+        # and shared by all the rows of the stream
+        serializer = self.get_serializer(many=True).child
+        for obj in objects:
+            yield encoder.encode(serializer.to_representation(obj))
+
+    def _iter_json_array(self, objects):
+        yield '['
+        for i, serialized in enumerate(self._iter_serialized(objects)):
+            yield ',' + serialized if i else serialized
+        yield ']'
+
+    def _iter_ndjson(self, objects):
+        for serialized in self._iter_serialized(objects):
+            yield serialized + '\n'
+
     def get_object(self):
         obj = self.retrieve_object()
         if obj is None:
@@ -38,6 +393,120 @@ class CustomNonModelObjectMixin(object):
         self.check_object_permissions(self.request, obj)
         return obj
 
+    def list_provider_objects(self, service, **kwargs):
+        """
+        Lists the objects in a cloudbridge service (or container), passing
+        the requested page size and cursor through to the provider, so that
+        only the requested page is fetched. When streaming, an iterator over
+        the entire listing is returned instead. When filtering, the filters
+        are pushed down to the service's ``find()`` if possible, otherwise
+        the entire listing is returned, to be filtered by
+        ``filter_queryset()``.
+        """
+        paginator = self.paginator
+        filtered = self.has_provider_filters()
+        if filtered and not kwargs and hasattr(service, 'find'):
+            find_kwargs = self.get_provider_find_kwargs()
+            if find_kwargs:
+                try:
+                    return service.find(**find_kwargs)
+                except (TypeError, NotImplementedError):
+                    # The provider does not support these filters
+                    pass
+        if self.streaming:
+            # Stream the entire listing, using the page size to determine
+            # how many objects to fetch from the provider at a time.
+            if isinstance(paginator, ProviderCursorPagination):
+                kwargs['limit'] = paginator.get_page_size(self.request)
+            return iter_provider_objects(service, **kwargs)
+        if filtered:
+            # Filtered listings are paged in memory, after filtering
+            return iter_provider_objects(service, **kwargs)
+        if isinstance(paginator, ProviderCursorPagination):
+            kwargs.update(paginator.get_provider_list_kwargs(self.request))
+        return service.list(**kwargs)
+
+    def get_provider_filters(self):
+        """
+        Returns the requested ``provider_filter_fields`` filters, as a dict
+        mapping each field to the set of accepted values.
+        """
+        query_params = self.request.query_params
+        return {field: set(query_params.getlist(field))
+                for field in self.provider_filter_fields
+                if query_params.getlist(field)}
+
+    def get_provider_search(self):
+        return self.request.query_params.get(
+            self.search_query_param, '').strip().lower()
+
+    def has_provider_filters(self):
+        return bool(self.get_provider_filters() or self.get_provider_search())
+
+    def get_provider_find_kwargs(self):
+        """
+        Returns the arguments with which to push the requested filters down
+        to the provider's ``find()``, or an empty dict if there are none.
+        """
+        return {field: next(iter(values)) for field, values
+                in self.get_provider_filters().items()
+                if field in self.provider_find_fields and len(values) == 1}
+
+    def filter_queryset(self, queryset):
+        """
+        Filters the listed objects by the requested ``provider_filter_fields``
+        and ``search`` query parameters, so that only matching objects are
+        serialized. Filters that were pushed down to the provider are checked
+        again, since providers may match more loosely.
+        """
+        queryset = super(CustomNonModelObjectMixin, self).filter_queryset(
+            queryset)
+        filters = self.get_provider_filters()
+        search = self.get_provider_search()
+        if not filters and not search:
+            return queryset
+        return (obj for obj in queryset
+                if self._matches_provider_filters(obj, filters, search))
+
+    def _matches_provider_filters(self, obj, filters, search):
+        for field, values in filters.items():
+            # Objects without a value for the field never match, rather than
+            # matching the string "None"
+            value = getattr(obj, field, None)
+            if value is None or "{0}".format(value) not in values:
+                return False
+        return not search or any(
+            search in "{0}".format(getattr(obj, field, None) or '').lower()
+            for field in self.provider_search_fields)
+
+    def list_catalog_objects(self, resource_type, get_service, variant=None):
+        """
+        Lists the objects in a slow-changing provider catalog, such as the
+        available VM types, through the catalog cache. ``get_service()`` is
+        only called on a cache miss, in which case the entire catalog is
+        fetched. If caching is disabled for the catalog, this behaves like
+        ``list_provider_objects()``.
+        """
+        if not provider_cache.get_catalog_ttl(resource_type):
+            return self.list_provider_objects(get_service())
+        return provider_cache.get_catalog(
+            self, resource_type,
+            lambda: iter_provider_objects(get_service()), variant)
+
+    def retrieve_catalog_object(self, resource_type, pk, get_service,
+                                variant=None):
+        """
+        Returns an object from a provider catalog, looking it up in the
+        catalog cache first. Falls back to ``get_service().get(pk)`` if
+        caching is disabled or the object is not part of the cached catalog.
+        """
+        if provider_cache.get_catalog_ttl(resource_type):
+            for obj in self.list_catalog_objects(resource_type, get_service,
+                                                 variant):
+                if obj.id == pk:
+                    return obj
+        return get_service().get(pk)
+
     @abstractmethod
     def list_objects(self):
         """
@@ -59,6 +528,84 @@ class CustomModelViewSet(CustomNonModelObjectMixin, viewsets.ModelViewSet):
     pass
 
 
+class BulkOperationsMixin(object):
+    """
+    A mixin for ``CustomModelViewSet`` subclasses, adding ``bulk_create``
+    and ``bulk_delete`` actions, which create or delete several objects at
+    once. The operations run concurrently, on at most
+    DJCLOUDBRIDGE_BULK_MAX_WORKERS threads, and share the request's
+    provider. A result is returned for each item, so that partial failures
+    can be told apart.
+    """
+    max_bulk_size = 100
+
+    @action(detail=False, methods=['post'])
+    def bulk_create(self, request, *args, **kwargs):
+        """
+        Creates an object for each item in the posted list.
+        """
+        items = self._get_bulk_items(request.data)
+        results = []
+        for index, result in enumerate(self._run_bulk(self._create_item,
+                                                      items)):
+            if not result.ok:
+                results.append({'index': index, 'status': 'error',
+                                'error': str(result.error)})
+            elif result.value.errors:
+                results.append({'index': index, 'status': 'invalid',
+                                'errors': result.value.errors})
+            else:
+                results.append({'index': index, 'status': 'created',
+                                'data': result.value.data})
+        return Response({'results': results})
+
+    @action(detail=False, methods=['post'])
+    def bulk_delete(self, request, *args, **kwargs):
+        """
+        Deletes the objects whose ids are posted as ``{"ids": [...]}``.
+        """
+        data = request.data if isinstance(request.data, dict) else {}
+        ids = self._get_bulk_items(data.get('ids'))
+        results = []
+        for result in self._run_bulk(self._delete_item, ids):
+            if isinstance(result.error, (Http404, NotFound)):
+                results.append({'id': result.item, 'status': 'not_found'})
+            elif not result.ok:
+                results.append({'id': result.item, 'status': 'error',
+                                'error': str(result.error)})
+            else:
+                results.append({'id': result.item, 'status': 'deleted'})
+        return Response({'results': results})
+
+    def _get_bulk_items(self, items):
+        if not isinstance(items, list) or not items:
+            raise ValidationError("Expected a non-empty list.")
+        if len(items) > self.max_bulk_size:
+            raise ValidationError(
+                "At most {0} items may be processed at a time.".format(
+                    self.max_bulk_size))
+        return items
+
+    def _run_bulk(self, func, items):
+        # Create the shared provider before fanning out
+        view_helpers.get_cloud_provider(self)
+        return concurrency.run_concurrently(
+            func, items, max_workers=getattr(
+                settings, 'DJCLOUDBRIDGE_BULK_MAX_WORKERS', None))
+
+    def _create_item(self, item):
+        serializer = self.get_serializer(data=item)
+        if serializer.is_valid():
+            self.perform_create(serializer)
+        return serializer
+
+    def _delete_item(self, pk):
+        obj = self._get_object_by_id(pk)
+        if obj is None:
+            raise Http404
+        self.perform_destroy(obj)
+
+
 class CustomReadOnlyModelViewSet(CustomNonModelObjectMixin,
                                  viewsets.ReadOnlyModelViewSet):
     pass
@@ -77,11 +624,128 @@ class CustomReadOnlySingleViewSet(CustomNonModelObjectMixin,
         # return an empty data row so that the serializer can emit fields
         return {}
 
+
+class LastModifiedMixin(object):
+    """
+    A mixin for django model viewsets, which adds a ``Last-Modified`` header
+    to list and retrieve responses and answers ``If-Modified-Since`` requests
+    with a ``304 Not Modified``, without serializing any objects. The last
+    modification time is the latest value of any of the
+    ``last_modified_fields`` amongst the listed objects, computed through a
+    single aggregate query. Include the fields of related objects that are
+    serialized along with them, such as ``'cloud__updated'``. Since
+    deletions cannot be derived from the remaining rows, override
+    ``get_last_deletion()`` to account for them in listings.
+    """
+    last_modified_fields = ('updated',)
+
+    def list(self, request, *args, **kwargs):
+        return self.get_conditional_response(
+            request, self.filter_queryset(self.get_queryset()),
+            self.get_last_deletion(),
+            lambda: super(LastModifiedMixin, self).list(
+                request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        queryset = self.filter_queryset(self.get_queryset()).filter(
+            **{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+        return self.get_conditional_response(
+            request, queryset, None,
+            lambda: super(LastModifiedMixin, self).retrieve(
+                request, *args, **kwargs))
+
+    def get_last_deletion(self):
+        """
+        Returns the time at which an object was last deleted from this
+        view's listing, or ``None`` if not known.
+        """
+        return None
+
+    def get_conditional_response(self, request, queryset, last_deletion,
+                                 get_response):
+        aggregates = queryset.order_by().aggregate(
+            *[Max(field) for field in self.last_modified_fields])
+        timestamps = [value for value in aggregates.values() if value]
+        if last_deletion:
+            timestamps.append(last_deletion)
+        last_modified = max(timestamps, default=None)
+        if not last_modified:
+            return get_response()
+
+        timestamp = int(last_modified.timestamp())
+        if_modified_since = parse_http_date_safe(
+            request.META.get('HTTP_IF_MODIFIED_SINCE'))
+        if if_modified_since is not None and timestamp <= if_modified_since:
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = get_response()
+        response['Last-Modified'] = http_date(timestamp)
+        return response
+
 # ===========================================
 # Django Rest Framework Serialization Helpers
 # ===========================================
 
 
+class SparseFieldsetMixin(object):
+    """
+    A serializer mixin that lets clients choose which fields to serialize
+    through the ``fields`` and ``omit`` query parameters, given as comma
+    separated field names. For example, ``?fields=id,name,state`` or
+    ``?omit=url``. Unrequested fields are dropped before serialization
+    starts, so no work is done to compute them, which matters for hyperlink
+    and provider related fields.
+
+    Only fields of the root serializer are affected, and only for reads.
+    Unknown field names are ignored. Serializers built while serializing,
+    such as in a ``SerializerMethodField``, have no parent, so they must be
+    given ``get_nested_context()`` to leave their fields alone.
+    """
+    fields_query_param = 'fields'
+    omit_query_param = 'omit'
+    nested_context_key = 'sparse_fieldset_nested'
+
+    def get_fields(self):
+        fields = super(SparseFieldsetMixin, self).get_fields()
+        request = self.context.get('request')
+        if (request is None or request.method not in SAFE_METHODS or
+                not self._is_root_serializer()):
+            return fields
+        query_params = getattr(request, 'query_params', request.GET)
+        only = self._parse_field_names(
+            query_params.get(self.fields_query_param))
+        omit = self._parse_field_names(
+            query_params.get(self.omit_query_param))
+        if only:
+            fields = OrderedDict((name, field) for name, field
+                                 in fields.items() if name in only)
+        for name in omit:
+            fields.pop(name, None)
+        return fields
+
+    def get_nested_context(self):
+        """
+        Returns this serializer's context, marked so that serializers given
+        it do not apply the requested field selection to their own fields.
+        """
+        context = dict(self.context)
+        context[self.nested_context_key] = True
+        return context
+
+    def _is_root_serializer(self):
+        if self.context.get(self.nested_context_key):
+            return False
+        parent = self.parent
+        if isinstance(parent, serializers.ListSerializer):
+            parent = parent.parent
+        return parent is None
+
+    def _parse_field_names(self, value):
+        return set(name.strip() for name in (value or '').split(',')
+                   if name.strip())
+
+
 class CustomHyperlinkedRelatedField(relations.HyperlinkedRelatedField):
     """
     This custom hyperlink field builds up the arguments required to link to a
@@ -92,10 +756,15 @@ class CustomHyperlinkedRelatedField(relations.HyperlinkedRelatedField):
     after drf-nested-routers' ``NestedHyperlinkedRelatedField``.
     """
     lookup_field = 'pk'
+    # Lookup values made up of these characters are left as is by reverse(),
+    # so they can be substituted into a precompiled URL template.
+    template_safe_lookup_value = re.compile(r'^[A-Za-z0-9_\-~]+$')
+    template_placeholder = 'djcloudbridgeLookupPlaceholder'
 
     def __init__(self, *args, **kwargs):
         self.parent_url_kwargs = kwargs.pop('parent_url_kwargs', [])
         super(CustomHyperlinkedRelatedField, self).__init__(*args, **kwargs)
+        self._url_templates = {}
 
     def get_url(self, obj, view_name, request, content_format):
         """
@@ -119,8 +788,16 @@ class CustomHyperlinkedRelatedField(relations.HyperlinkedRelatedField):
         # Let serializer context values override view kwargs
         reverse_kwargs.update({key: val for key, val in self.context.items()
                                if key in self.parent_url_kwargs})
+        lookup_value = None
         if self.lookup_field:
             lookup_value = util.getattrd(obj, self.lookup_field)
+            if (isinstance(lookup_value, str) and
+                    self.template_safe_lookup_value.match(lookup_value)):
+                template = self.get_url_template(
+                    view_name, reverse_kwargs, request, content_format)
+                if template:
+                    return template.replace(self.template_placeholder,
+                                            lookup_value, 1)
             if lookup_value:
                 reverse_kwargs.update({self.lookup_url_kwarg: lookup_value})
         try:
@@ -133,6 +810,32 @@ class CustomHyperlinkedRelatedField(relations.HyperlinkedRelatedField):
                 raise e
             return ""
 
+    def get_url_template(self, view_name, reverse_kwargs, request,
+                         content_format):
+        """
+        Returns a URL for the given view with a placeholder in place of the
+        lookup value, so that URLs for a whole listing can be generated with
+        a single call to ``reverse()``. Templates are kept for the lifetime
+        of the field, which is bound to a single serializer and therefore a
+        single request. Returns ``None`` if no template can be built, in
+        which case ``reverse()`` must be used.
+        """
+        key = (view_name, content_format,
+               tuple(sorted(reverse_kwargs.items())))
+        if key not in self._url_templates:
+            template_kwargs = dict(reverse_kwargs)
+            template_kwargs[self.lookup_url_kwarg] = self.template_placeholder
+            try:
+                template = self.reverse(view_name, kwargs=template_kwargs,
+                                        request=request,
+                                        format=content_format)
+            except NoReverseMatch:
+                template = None
+            if template and template.count(self.template_placeholder) != 1:
+                template = None
+            self._url_templates[key] = template
+        return self._url_templates[key]
+
 
 class CustomHyperlinkedIdentityField(CustomHyperlinkedRelatedField):
     """
@@ -207,7 +910,14 @@ class ProviderFieldMixin(object):
         super(ProviderFieldMixin, self).__init__(*args, **kwargs)
 
     def get_queryset(self):
-        provider = view_helpers.get_cloud_provider(self.context.get('view'))
+        view = self.context.get('view')
+        resource_type = provider_cache.CATALOG_SERVICES.get(self.queryset)
+        if resource_type and provider_cache.get_catalog_ttl(resource_type):
+            return provider_cache.get_catalog(
+                view, resource_type,
+                lambda: iter_provider_objects(util.getattrd(
+                    view_helpers.get_cloud_provider(view), self.queryset)))
+        provider = view_helpers.get_cloud_provider(view)
         return util.getattrd(provider, self.queryset + '.list')()
 
     def get_provider_object(self, pk):
@@ -303,7 +1013,7 @@ class ProviderPKRelatedField(
         <option value='$to_representation(instance)'>#display_value(instance)
         </option>).
         """
-        if isinstance(value, CloudResource):
+        if isinstance(value, (CloudResource, provider_cache.CachedResource)):
             return value.id
         else:
             return value
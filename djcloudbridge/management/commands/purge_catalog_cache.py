@@ -0,0 +1,37 @@
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand
+
+from djcloudbridge import provider_cache
+from djcloudbridge import util
+
+
+class Command(BaseCommand):
+    help = ("Purges the cached provider catalogs (regions, zones, VM types "
+            "and images) and reports the catalog cache's hit and miss counts.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--cloud', help="Only purge the catalogs of the cloud with this "
+                            "slug.")
+        parser.add_argument(
+            '--stats-only', action='store_true',
+            help="Report the hit and miss counts without purging anything.")
+
+    def handle(self, *args, **options):
+        if isinstance(util.get_cache(), (DummyCache, LocMemCache)):
+            self.stderr.write(self.style.WARNING(
+                "The DJCLOUDBRIDGE_CACHE cache is local to this process, so "
+                "the counts below and any purge do not reflect or affect "
+                "running servers. Use a shared cache backend instead."))
+        for resource_type, stats in sorted(
+                provider_cache.get_catalog_stats().items()):
+            self.stdout.write("{0}: {1} hits, {2} misses".format(
+                resource_type, stats['hits'], stats['misses']))
+        if options['stats_only']:
+            return
+        provider_cache.purge_catalogs(options['cloud'])
+        self.stdout.write(self.style.SUCCESS(
+            "Purged the catalogs of {0}.".format(
+                "cloud '{0}'".format(options['cloud']) if options['cloud']
+                else "all clouds")))
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+CLOUD_KIND_MODELS = ('aws', 'openstack', 'gce', 'azure')
+
+
+def populate_cloud_kind(apps, schema_editor):
+    Cloud = apps.get_model('djcloudbridge', 'Cloud')
+    for kind in CLOUD_KIND_MODELS:
+        child_model = apps.get_model('djcloudbridge', kind)
+        Cloud.objects.filter(
+            slug__in=child_model.objects.values('cloud_ptr_id')).update(
+                kind=kind)
+
+
+def reset_cloud_kind(apps, schema_editor):
+    Cloud = apps.get_model('djcloudbridge', 'Cloud')
+    Cloud.objects.update(kind='cloud')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('djcloudbridge', '0003_move_azure_cloud_fields_to_creds'),
+    ]
+
+    operations = [
+        migrations.RunPython(populate_cloud_kind, reset_cloud_kind),
+    ]
@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('djcloudbridge', '0004_populate_cloud_kind'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Deletion',
+            fields=[
+                ('collection', models.CharField(max_length=255,
+                                                primary_key=True,
+                                                serialize=False)),
+                ('deleted', models.DateTimeField()),
+            ],
+        ),
+    ]
@@ -5,6 +5,7 @@ from django.contrib.auth.models import User
 from django.db import models
 from django.template.defaultfilters import slugify
 from fernet_fields import EncryptedCharField
+from fernet_fields import EncryptedField
 from fernet_fields import EncryptedTextField
 from model_utils.managers import InheritanceManager
 
@@ -40,6 +41,10 @@ class Cloud(DateNameAwareModel):
         if not self.slug:
             # Newly created object, so set slug
             self.slug = slugify(self.name)
+        if type(self) is not Cloud:
+            # Record the concrete subclass, so that it can be loaded directly
+            # without joining across all subclass tables.
+            self.kind = self._meta.model_name
         super(Cloud, self).save(*args, **kwargs)
 
     class Meta:
@@ -122,6 +127,16 @@ class Credentials(DateNameAwareModel):
                 previous_default.save()
         return super(Credentials, self).save()
 
+    @classmethod
+    def get_secret_fields(cls):
+        """
+        Returns the names of the encrypted fields of this model. These can
+        be deferred when the secrets themselves are not required, avoiding
+        the cost of loading and decrypting them.
+        """
+        return [field.name for field in cls._meta.concrete_fields
+                if isinstance(field, EncryptedField)]
+
     def as_dict(self):
         return {'id': self.id,
                 'name': self.name,
@@ -140,8 +155,9 @@ class AWSCredentials(Credentials):
 
     def as_dict(self):
         d = super(AWSCredentials, self).as_dict()
-        d['aws_access_key'] = self.access_key,
+        d['aws_access_key'] = self.access_key
         d['aws_secret_key'] = self.secret_key
+        return d
 
 
 class OpenStackCredentials(Credentials):
@@ -173,7 +189,10 @@ class GCECredentials(Credentials):
     credentials = EncryptedTextField(blank=False, null=False)
 
     def save(self, *args, **kwargs):
-        if self.credentials:
+        # Only validate the credentials if they were loaded or assigned, to
+        # avoid fetching and decrypting deferred credentials.
+        if ('credentials' not in self.get_deferred_fields() and
+                self.credentials):
             try:
                 json.loads(self.credentials)
             except Exception as e:
@@ -191,7 +210,7 @@ class GCECredentials(Credentials):
         gce_creds = json.loads(self.credentials)
         # Overwrite with super values in case gce_creds also has an id property
         gce_creds.update(d)
-        return d
+        return gce_creds
 
 
 class AzureCredentials(Credentials):
@@ -239,3 +258,17 @@ class UserProfile(models.Model):
         if not self.slug:
             self.slug = slugify(self.user.username)
         super(UserProfile, self).save(*args, **kwargs)
+
+
+class Deletion(models.Model):
+    """
+    Records when an object was last deleted from a collection, such as the
+    clouds or a user's credentials. Deleted rows no longer contribute to a
+    collection's latest ``updated`` time, so this is needed to tell when the
+    collection last changed.
+    """
+    collection = models.CharField(max_length=255, primary_key=True)
+    deleted = models.DateTimeField()
+
+    def __str__(self):
+        return "{0} ({1})".format(self.collection, self.deleted)
@@ -0,0 +1,281 @@
+"""
+Caches for provider data, built on django's cache framework.
+
+A read-through cache holds slow-changing provider catalogs, such as regions,
+zones, VM types and images. Catalogs are cached per cloud, credential scope
+and resource type. Since provider resources cannot be pickled, a catalog is
+cached as a list of :class:`CachedResource` snapshots, holding only the
+attributes listed in ``CATALOG_ATTRIBUTES``.
+
+A stale-while-revalidate cache holds the serialized responses of volatile
+provider listings, such as instances and volumes.
+"""
+import hashlib
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django import db
+from django.conf import settings
+from rest_framework.utils import encoders
+
+from . import util
+from . import view_helpers
+
+log = logging.getLogger(__name__)
+
+
+# The attributes to retain for each kind of catalog resource
+CATALOG_ATTRIBUTES = {
+    'regions': ('id', 'name'),
+    'zones': ('id', 'name'),
+    'vm_types': ('id', 'name', 'family', 'vcpus', 'ram', 'size_root_disk',
+                 'size_ephemeral_disks', 'num_ephemeral_disks',
+                 'size_total_disk', 'extra_data'),
+    'images': ('id', 'name', 'description'),
+}
+
+# Maps the provider services backing a catalog to the catalog's resource type
+CATALOG_SERVICES = {
+    'compute.regions': 'regions',
+    'compute.vm_types': 'vm_types',
+    'compute.images': 'images',
+}
+
+CACHE_KEY_PREFIX = 'djcloudbridge'
+
+
+class CachedResource(object):
+    """
+    A picklable snapshot of a provider resource's attributes.
+    """
+
+    def __init__(self, **attributes):
+        self.__dict__.update(attributes)
+
+    def __str__(self):
+        return "{0}".format(getattr(self, 'name', None) or self.id)
+
+    @classmethod
+    def from_resource(cls, resource, attributes):
+        return cls(**{attr: getattr(resource, attr, None)
+                      for attr in attributes})
+
+
+def get_catalog_ttl(resource_type):
+    """
+    Returns the number of seconds a given catalog should be cached for. A
+    falsy value means that the catalog should not be cached. Catalog caching
+    is opt-in, since cached catalogs are always fetched in full from the
+    provider.
+    """
+    return getattr(settings, 'DJCLOUDBRIDGE_CATALOG_CACHE_TTLS',
+                   {}).get(resource_type)
+
+
+def get_catalog(view, resource_type, loader, variant=None):
+    """
+    Returns the catalog of the given resource type for the cloud and
+    credentials of the current request. On a cache miss, the catalog is
+    retrieved by calling ``loader()``, which must return all of the
+    catalog's resources.
+
+    :type variant: str
+    :param variant: Distinguishes multiple catalogs of the same resource
+                    type, for example, the zones of different regions.
+
+    :rtype: ``list`` of :class:`CachedResource`
+    :return: The cached catalog resources.
+    """
+    cache = util.get_cache()
+    key = _get_catalog_key(view, resource_type, variant)
+    resources = cache.get(key)
+    if resources is None:
+        _incr_stat(resource_type, 'misses')
+        attributes = CATALOG_ATTRIBUTES[resource_type]
+        resources = [CachedResource.from_resource(resource, attributes)
+                     for resource in loader()]
+        cache.set(key, resources, get_catalog_ttl(resource_type))
+    else:
+        _incr_stat(resource_type, 'hits')
+    return resources
+
+
+def purge_catalogs(cloud_slug=None):
+    """
+    Purges the cached catalogs of a given cloud or, if no cloud is specified,
+    of all clouds. Cache backends do not generally support deleting keys by
+    prefix, so catalogs are purged by bumping a generation number that is
+    part of their cache keys.
+    """
+    _incr(_get_generation_key(cloud_slug))
+
+
+def get_catalog_stats():
+    """
+    Returns the number of cache hits and misses for each resource type.
+    """
+    cache = util.get_cache()
+    return {resource_type: {stat: cache.get(_get_stat_key(resource_type,
+                                                          stat), 0)
+                            for stat in ('hits', 'misses')}
+            for resource_type in CATALOG_ATTRIBUTES}
+
+
+def get_list_ttls(list_name):
+    """
+    Returns the ``(soft_ttl, hard_ttl)`` in seconds for caching a provider
+    listing, as configured through the DJCLOUDBRIDGE_LIST_CACHE_TTLS setting,
+    or ``None`` if the listing should not be cached.
+    """
+    ttls = getattr(settings, 'DJCLOUDBRIDGE_LIST_CACHE_TTLS', {})
+    return ttls.get(list_name)
+
+
+def get_list_payload(view, list_name, compute, get_refresher):
+    """
+    Returns the serialized listing for the current request using a
+    stale-while-revalidate strategy. A cached payload younger than the soft
+    TTL is returned as is. A payload between the soft and hard TTLs is also
+    returned, but a refresh is started in the background. Otherwise, the
+    payload is computed by calling ``compute()`` before returning.
+
+    Background refreshes outlive the current request, so they call the
+    function returned by ``get_refresher()`` instead, which must not depend
+    on the state of the current request or view.
+
+    The payload is keyed by the full request URI, so that the host, query
+    parameters and cursor all form part of the key.
+
+    :rtype: ``tuple``
+    :return: The payload, its age in seconds and its digest, as returned by
+             :func:`get_payload_digest`.
+    """
+    soft_ttl, hard_ttl = get_list_ttls(list_name)
+    cache = util.get_cache()
+    key = _get_list_key(view, list_name)
+    entry = cache.get(key)
+    if entry is not None:
+        payload, created, digest = entry
+        age = max(time.time() - created, 0)
+        if age <= soft_ttl:
+            return payload, age, digest
+        if age <= hard_ttl:
+            _refresh_in_background(key, get_refresher, hard_ttl)
+            return payload, age, digest
+    entry = _make_list_entry(compute())
+    cache.set(key, entry, hard_ttl)
+    return entry[0], 0, entry[2]
+
+
+def get_payload_digest(payload):
+    """
+    Returns a stable hash of a serialized payload, suitable for use in an
+    ETag. The digest is stored alongside cached payloads, so that conditional
+    requests can be answered without hashing the payload again.
+    """
+    serialized = json.dumps(payload, cls=encoders.JSONEncoder,
+                            sort_keys=True)
+    return hashlib.sha256(serialized.encode('utf-8')).hexdigest()
+
+
+def _make_list_entry(payload):
+    return payload, time.time(), get_payload_digest(payload)
+
+
+def purge_list_payloads(cloud_slug, list_name):
+    """
+    Purges the cached payloads of a given listing, for example, after the
+    listed resources have been modified.
+    """
+    _incr(_get_generation_key(cloud_slug, list_name))
+
+
+# Runs background refreshes of stale list payloads
+refresh_executor = ThreadPoolExecutor(
+    max_workers=getattr(settings, 'DJCLOUDBRIDGE_REFRESH_WORKERS', 4))
+
+
+def _refresh_in_background(key, get_refresher, hard_ttl):
+    # Only one refresh of a given payload may be in progress, across all
+    # processes sharing the cache.
+    lock_key = key + ':refreshing'
+    if not util.get_cache().add(lock_key, True, hard_ttl):
+        return
+    refresh_executor.submit(_refresh, key, lock_key, get_refresher(),
+                            hard_ttl)
+
+
+def _refresh(key, lock_key, compute, hard_ttl):
+    cache = util.get_cache()
+    try:
+        cache.set(key, _make_list_entry(compute()), hard_ttl)
+    except Exception:
+        # The stale payload remains in place until the hard TTL expires
+        log.exception("Failed to refresh cached provider listing")
+    finally:
+        cache.delete(lock_key)
+        db.connections.close_all()
+
+
+def _get_list_key(view, list_name):
+    cloud_slug = view.kwargs.get('cloud_pk')
+    return _get_scoped_key(
+        'list', view,
+        _get_generations((), (cloud_slug,), (cloud_slug, list_name)) +
+        [list_name, view.request.build_absolute_uri()])
+
+
+def _get_catalog_key(view, resource_type, variant):
+    cloud_slug = view.kwargs.get('cloud_pk')
+    return _get_scoped_key(
+        'catalog', view,
+        _get_generations((), (cloud_slug,)) + [resource_type, variant])
+
+
+def _get_scoped_key(kind, view, components):
+    """
+    Returns a cache key for data scoped to the cloud and credentials of the
+    current request, hashing the given components to keep the key short and
+    free of characters that some cache backends reject.
+    """
+    cloud_slug = view.kwargs.get('cloud_pk')
+    components = [cloud_slug, view_helpers.get_credentials_scope(view)
+                  ] + list(components)
+    digest = hashlib.sha256(repr(components).encode('utf-8')).hexdigest()
+    return '{0}:{1}:{2}'.format(CACHE_KEY_PREFIX, kind, digest)
+
+
+def _get_generations(*scopes):
+    keys = [_get_generation_key(*scope) for scope in scopes]
+    generations = util.get_cache().get_many(keys)
+    return [generations.get(key, 0) for key in keys]
+
+
+def _get_generation_key(*scope):
+    if any(scope):
+        return '{0}:generation:{1}'.format(
+            CACHE_KEY_PREFIX,
+            hashlib.sha256(repr(scope).encode('utf-8')).hexdigest())
+    return '{0}:generation'.format(CACHE_KEY_PREFIX)
+
+
+def _get_stat_key(resource_type, stat):
+    return '{0}:catalog:stats:{1}:{2}'.format(
+        CACHE_KEY_PREFIX, resource_type, stat)
+
+
+def _incr_stat(resource_type, stat):
+    _incr(_get_stat_key(resource_type, stat))
+
+
+def _incr(key):
+    cache = util.get_cache()
+    # add() is a no-op if the key already exists
+    cache.add(key, 0, None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # The key was evicted in the meantime
+        cache.set(key, 1, None)
@@ -5,19 +5,24 @@ from rest_auth.serializers import UserDetailsSerializer
 from rest_framework import serializers
 from rest_framework.reverse import reverse
 
+from . import cloud_kinds
+from . import domain_model
+from . import downloads
 from . import models
+from . import upload_handlers
 from . import view_helpers
 from .drf_helpers import CustomHyperlinkedIdentityField
 from .drf_helpers import PlacementZonePKRelatedField
 from .drf_helpers import ProviderPKRelatedField
+from .drf_helpers import SparseFieldsetMixin
 
 
-class ZoneSerializer(serializers.Serializer):
+class ZoneSerializer(SparseFieldsetMixin, serializers.Serializer):
     id = serializers.CharField()
     name = serializers.CharField()
 
 
-class RegionSerializer(serializers.Serializer):
+class RegionSerializer(SparseFieldsetMixin, serializers.Serializer):
     id = serializers.CharField(read_only=True)
     url = CustomHyperlinkedIdentityField(
         view_name='djcloudbridge:region-detail',
@@ -32,7 +37,7 @@ class RegionSerializer(serializers.Serializer):
         parent_url_kwargs=['cloud_pk'])
 
 
-class MachineImageSerializer(serializers.Serializer):
+class MachineImageSerializer(SparseFieldsetMixin, serializers.Serializer):
     id = serializers.CharField(read_only=True)
     url = CustomHyperlinkedIdentityField(
         view_name='djcloudbridge:machine_image-detail',
@@ -43,7 +48,7 @@ class MachineImageSerializer(serializers.Serializer):
     description = serializers.CharField()
 
 
-class KeyPairSerializer(serializers.Serializer):
+class KeyPairSerializer(SparseFieldsetMixin, serializers.Serializer):
     id = serializers.CharField(read_only=True)
     url = CustomHyperlinkedIdentityField(
         view_name='djcloudbridge:keypair-detail',
@@ -58,7 +63,7 @@ class KeyPairSerializer(serializers.Serializer):
         return provider.security.key_pairs.create(validated_data.get('name'))
 
 
-class VMFirewallRuleSerializer(serializers.Serializer):
+class VMFirewallRuleSerializer(SparseFieldsetMixin, serializers.Serializer):
     protocol = serializers.CharField(allow_blank=True)
     from_port = serializers.CharField(allow_blank=True)
     to_port = serializers.CharField(allow_blank=True)
@@ -115,7 +120,7 @@ class VMFirewallRuleSerializer(serializers.Serializer):
         return None
 
 
-class VMFirewallSerializer(serializers.Serializer):
+class VMFirewallSerializer(SparseFieldsetMixin, serializers.Serializer):
     id = serializers.CharField(read_only=True)
     url = CustomHyperlinkedIdentityField(
         view_name='djcloudbridge:vm_firewall-detail',
@@ -144,7 +149,7 @@ class VMFirewallSerializer(serializers.Serializer):
             validated_data.get('network_id').id)
 
 
-class NetworkingSerializer(serializers.Serializer):
+class NetworkingSerializer(SparseFieldsetMixin, serializers.Serializer):
     networks = CustomHyperlinkedIdentityField(
         view_name='djcloudbridge:network-list',
         parent_url_kwargs=['cloud_pk'])
@@ -153,7 +158,7 @@ class NetworkingSerializer(serializers.Serializer):
         parent_url_kwargs=['cloud_pk'])
 
 
-class NetworkSerializer(serializers.Serializer):
+class NetworkSerializer(SparseFieldsetMixin, serializers.Serializer):
     id = serializers.CharField(read_only=True)
     url = CustomHyperlinkedIdentityField(
         view_name='djcloudbridge:network-detail',
@@ -191,7 +196,7 @@ class NetworkSerializer(serializers.Serializer):
             raise serializers.ValidationError("{0}".format(e))
 
 
-class SubnetSerializer(serializers.Serializer):
+class SubnetSerializer(SparseFieldsetMixin, serializers.Serializer):
     id = serializers.CharField(read_only=True)
     url = CustomHyperlinkedIdentityField(
         view_name='djcloudbridge:subnet-detail',
@@ -222,7 +227,7 @@ class SubnetSerializerUpdate(SubnetSerializer):
             raise serializers.ValidationError("{0}".format(e))
 
 
-class RouterSerializer(serializers.Serializer):
+class RouterSerializer(SparseFieldsetMixin, serializers.Serializer):
     id = serializers.CharField(read_only=True)
     url = CustomHyperlinkedIdentityField(
         view_name='djcloudbridge:router-detail',
@@ -251,7 +256,7 @@ class RouterSerializer(serializers.Serializer):
             raise serializers.ValidationError("{0}".format(e))
 
 
-class GatewaySerializer(serializers.Serializer):
+class GatewaySerializer(SparseFieldsetMixin, serializers.Serializer):
     id = serializers.CharField(read_only=True)
     url = CustomHyperlinkedIdentityField(
         view_name='djcloudbridge:gateway-detail',
@@ -275,13 +280,13 @@ class GatewaySerializer(serializers.Serializer):
             name=validated_data.get('name'))
 
 
-class FloatingIPSerializer(serializers.Serializer):
+class FloatingIPSerializer(SparseFieldsetMixin, serializers.Serializer):
     id = serializers.CharField(read_only=True)
     ip = serializers.CharField(read_only=True)
     state = serializers.CharField(read_only=True)
 
 
-class VMTypeSerializer(serializers.Serializer):
+class VMTypeSerializer(SparseFieldsetMixin, serializers.Serializer):
     id = serializers.CharField(read_only=True)
     url = CustomHyperlinkedIdentityField(
         view_name='djcloudbridge:vm_type-detail',
@@ -298,7 +303,7 @@ class VMTypeSerializer(serializers.Serializer):
     extra_data = serializers.DictField(serializers.CharField())
 
 
-class AttachmentInfoSerializer(serializers.Serializer):
+class AttachmentInfoSerializer(SparseFieldsetMixin, serializers.Serializer):
     device = serializers.CharField(read_only=True)
     instance_id = ProviderPKRelatedField(
         label="Instance ID",
@@ -315,7 +320,7 @@ class AttachmentInfoSerializer(serializers.Serializer):
         parent_url_kwargs=['cloud_pk'])
 
 
-class VolumeSerializer(serializers.Serializer):
+class VolumeSerializer(SparseFieldsetMixin, serializers.Serializer):
     id = serializers.CharField(read_only=True)
     url = CustomHyperlinkedIdentityField(
         view_name='djcloudbridge:volume-detail',
@@ -367,7 +372,7 @@ class VolumeSerializer(serializers.Serializer):
             raise serializers.ValidationError("{0}".format(e))
 
 
-class SnapshotSerializer(serializers.Serializer):
+class SnapshotSerializer(SparseFieldsetMixin, serializers.Serializer):
     id = serializers.CharField(read_only=True)
     url = CustomHyperlinkedIdentityField(
         view_name='djcloudbridge:snapshot-detail',
@@ -407,7 +412,7 @@ class SnapshotSerializer(serializers.Serializer):
             raise serializers.ValidationError("{0}".format(e))
 
 
-class InstanceSerializer(serializers.Serializer):
+class InstanceSerializer(SparseFieldsetMixin, serializers.Serializer):
     id = serializers.CharField(read_only=True)
     url = CustomHyperlinkedIdentityField(
         view_name='djcloudbridge:instance-detail',
@@ -486,7 +491,7 @@ class InstanceSerializer(serializers.Serializer):
             raise serializers.ValidationError("{0}".format(e))
 
 
-class BucketSerializer(serializers.Serializer):
+class BucketSerializer(SparseFieldsetMixin, serializers.Serializer):
     id = serializers.CharField(read_only=True)
     url = CustomHyperlinkedIdentityField(
         view_name='djcloudbridge:bucket-detail',
@@ -508,7 +513,7 @@ class BucketSerializer(serializers.Serializer):
             raise serializers.ValidationError("{0}".format(e))
 
 
-class BucketObjectSerializer(serializers.Serializer):
+class BucketObjectSerializer(SparseFieldsetMixin, serializers.Serializer):
     id = serializers.CharField(read_only=True)
     name = serializers.CharField(allow_blank=True)
     size = serializers.IntegerField(read_only=True)
@@ -523,6 +528,12 @@ class BucketObjectSerializer(serializers.Serializer):
 
     def get_download_url(self, obj):
         """Create a URL for accessing a single instance."""
+        if downloads.get_download_mode() == downloads.URL:
+            signed_url = downloads.get_signed_url(
+                domain_model.get_cloud(self.context['view'].kwargs['cloud_pk']),
+                obj)
+            if signed_url:
+                return signed_url
         kwargs = self.context['view'].kwargs.copy()
         kwargs.update({'pk': obj.id})
         obj_url = reverse('djcloudbridge:bucketobject-detail',
@@ -542,21 +553,21 @@ class BucketObjectSerializer(serializers.Serializer):
             else:
                 obj = bucket.objects.create(content.name)
             if content:
-                obj.upload(content.file.getvalue())
+                upload_handlers.upload_content(obj, content)
             return obj
         except Exception as e:
             raise serializers.ValidationError("{0}".format(e))
 
     def update(self, instance, validated_data):
         try:
-            instance.upload(
-                validated_data.get('upload_content').file.getvalue())
+            upload_handlers.upload_content(
+                instance, validated_data.get('upload_content'))
             return instance
         except Exception as e:
             raise serializers.ValidationError("{0}".format(e))
 
 
-class CloudSerializer(serializers.ModelSerializer):
+class CloudSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     slug = serializers.CharField(read_only=True)
     compute = CustomHyperlinkedIdentityField(
         view_name='djcloudbridge:compute-list',
@@ -579,54 +590,24 @@ class CloudSerializer(serializers.ModelSerializer):
     extra_data = serializers.SerializerMethodField()
 
     def get_region_name(self, obj):
-        if hasattr(obj, 'aws'):
-            return obj.aws.region_name
-        elif hasattr(obj, 'openstack'):
-            return obj.openstack.region_name
-        elif hasattr(obj, 'azure'):
-            return obj.azure.region_name
-        elif hasattr(obj, 'gce'):
-            return obj.gce.region_name
+        cloud_kind = cloud_kinds.get_cloud_kind(obj.kind)
+        if cloud_kind:
+            return cloud_kind.get_region_name(
+                domain_model.get_concrete_cloud(obj))
         else:
             return "Cloud provider not recognized"
 
     def get_cloud_type(self, obj):
-        if hasattr(obj, 'aws'):
-            return 'aws'
-        elif hasattr(obj, 'openstack'):
-            return 'openstack'
-        elif hasattr(obj, 'azure'):
-            return 'azure'
-        elif hasattr(obj, 'gce'):
-            return 'gce'
+        if cloud_kinds.get_cloud_kind(obj.kind):
+            return obj.kind
         else:
             return 'unknown'
 
     def get_extra_data(self, obj):
-        if hasattr(obj, 'aws'):
-            aws = obj.aws
-            return {'region_name': aws.region_name,
-                    'ec2_endpoint_url': aws.ec2_endpoint_url,
-                    'ec2_is_secure': aws.ec2_is_secure,
-                    'ec2_validate_certs': aws.ec2_validate_certs,
-                    's3_endpoint_url': aws.s3_endpoint_url,
-                    's3_is_secure': aws.s3_is_secure,
-                    's3_validate_certs': aws.s3_validate_certs
-                    }
-        elif hasattr(obj, 'openstack'):
-            os = obj.openstack
-            return {'auth_url': os.auth_url,
-                    'region_name': os.region_name,
-                    'identity_api_version': os.identity_api_version
-                    }
-        elif hasattr(obj, 'azure'):
-            azure = obj.azure
-            return {'region_name': azure.region_name}
-        elif hasattr(obj, 'gce'):
-            gce = obj.gce
-            return {'region_name': gce.region_name,
-                    'zone_name': gce.zone_name
-                    }
+        cloud_kind = cloud_kinds.get_cloud_kind(obj.kind)
+        if cloud_kind:
+            return cloud_kind.get_extra_data(
+                domain_model.get_concrete_cloud(obj))
         else:
             return {}
 
@@ -635,7 +616,7 @@ class CloudSerializer(serializers.ModelSerializer):
         exclude = ('kind',)
 
 
-class ComputeSerializer(serializers.Serializer):
+class ComputeSerializer(SparseFieldsetMixin, serializers.Serializer):
     instances = CustomHyperlinkedIdentityField(
         view_name='djcloudbridge:instance-list',
         parent_url_kwargs=['cloud_pk'])
@@ -650,7 +631,7 @@ class ComputeSerializer(serializers.Serializer):
         parent_url_kwargs=['cloud_pk'])
 
 
-class SecuritySerializer(serializers.Serializer):
+class SecuritySerializer(SparseFieldsetMixin, serializers.Serializer):
     keypairs = CustomHyperlinkedIdentityField(
         view_name='djcloudbridge:keypair-list',
         parent_url_kwargs=['cloud_pk'])
@@ -659,7 +640,7 @@ class SecuritySerializer(serializers.Serializer):
         parent_url_kwargs=['cloud_pk'])
 
 
-class StorageSerializer(serializers.Serializer):
+class StorageSerializer(SparseFieldsetMixin, serializers.Serializer):
     volumes = CustomHyperlinkedIdentityField(
         view_name='djcloudbridge:volume-list',
         parent_url_kwargs=['cloud_pk'])
@@ -676,7 +657,7 @@ User Profile and Credentials related serializers
 """
 
 
-class CredentialsSerializer(serializers.Serializer):
+class CredentialsSerializer(SparseFieldsetMixin, serializers.Serializer):
     aws = CustomHyperlinkedIdentityField(
         view_name='djcloudbridge:awscredentials-list')
     openstack = CustomHyperlinkedIdentityField(
@@ -687,7 +668,8 @@ class CredentialsSerializer(serializers.Serializer):
         view_name='djcloudbridge:gcecredentials-list')
 
 
-class AWSCredsSerializer(serializers.HyperlinkedModelSerializer):
+class AWSCredsSerializer(SparseFieldsetMixin,
+                         serializers.HyperlinkedModelSerializer):
     id = serializers.IntegerField(read_only=True)
     secret_key = serializers.CharField(
         style={'input_type': 'password'},
@@ -699,10 +681,11 @@ class AWSCredsSerializer(serializers.HyperlinkedModelSerializer):
 
     class Meta:
         model = models.AWSCredentials
-        exclude = ('secret_key', 'user_profile')
+        exclude = ('user_profile',)
 
 
-class OpenstackCredsSerializer(serializers.HyperlinkedModelSerializer):
+class OpenstackCredsSerializer(SparseFieldsetMixin,
+                               serializers.HyperlinkedModelSerializer):
     id = serializers.IntegerField(read_only=True)
     password = serializers.CharField(
         style={'input_type': 'password'},
@@ -714,10 +697,11 @@ class OpenstackCredsSerializer(serializers.HyperlinkedModelSerializer):
 
     class Meta:
         model = models.OpenStackCredentials
-        exclude = ('password', 'user_profile')
+        exclude = ('user_profile',)
 
 
-class AzureCredsSerializer(serializers.HyperlinkedModelSerializer):
+class AzureCredsSerializer(SparseFieldsetMixin,
+                           serializers.HyperlinkedModelSerializer):
     id = serializers.IntegerField(read_only=True)
     secret = serializers.CharField(
         style={'input_type': 'password'},
@@ -729,10 +713,11 @@ class AzureCredsSerializer(serializers.HyperlinkedModelSerializer):
 
     class Meta:
         model = models.AzureCredentials
-        exclude = ('secret', 'user_profile')
+        exclude = ('user_profile',)
 
 
-class GCECredsSerializer(serializers.HyperlinkedModelSerializer):
+class GCECredsSerializer(SparseFieldsetMixin,
+                         serializers.HyperlinkedModelSerializer):
     id = serializers.IntegerField(read_only=True)
     credentials = serializers.CharField(
         write_only=True,
@@ -746,7 +731,8 @@ class GCECredsSerializer(serializers.HyperlinkedModelSerializer):
         exclude = ('user_profile',)
 
 
-class CloudConnectionAuthSerializer(serializers.Serializer):
+class CloudConnectionAuthSerializer(SparseFieldsetMixin,
+                                    serializers.Serializer):
     aws_creds = AWSCredsSerializer(write_only=True, required=False)
     openstack_creds = OpenstackCredsSerializer(write_only=True, required=False)
     azure_creds = AzureCredsSerializer(write_only=True, required=False)
@@ -763,7 +749,7 @@ class CloudConnectionAuthSerializer(serializers.Serializer):
             return {'result': 'FAILURE', 'details': str(e)}
 
 
-class UserSerializer(UserDetailsSerializer):
+class UserSerializer(SparseFieldsetMixin, UserDetailsSerializer):
     credentials = CustomHyperlinkedIdentityField(
         view_name='djcloudbridge:credentialsroute-list', lookup_field=None)
     aws_creds = serializers.SerializerMethodField()
@@ -771,53 +757,74 @@ class UserSerializer(UserDetailsSerializer):
     azure_creds = serializers.SerializerMethodField()
     gce_creds = serializers.SerializerMethodField()
 
+    def __init__(self, *args, **kwargs):
+        super(UserSerializer, self).__init__(*args, **kwargs)
+        # The credentials of each serialized user, keyed by user id
+        self._user_credentials = {}
+
     def get_aws_creds(self, obj):
         """
-        Include a URL for listing this bucket's contents
+        Include the user's AWS credentials
         """
-        try:
-            creds = obj.userprofile.credentials.filter(
-                awscredentials__isnull=False).select_subclasses()
-            return AWSCredsSerializer(instance=creds, many=True,
-                                      context=self.context).data
-        except models.UserProfile.DoesNotExist:
-            return ""
+        return self._get_kind_credentials(obj, 'aws', AWSCredsSerializer)
 
     def get_openstack_creds(self, obj):
         """
-        Include a URL for listing this bucket's contents
+        Include the user's OpenStack credentials
         """
-        try:
-            creds = obj.userprofile.credentials.filter(
-                openstackcredentials__isnull=False).select_subclasses()
-            return OpenstackCredsSerializer(instance=creds, many=True,
-                                            context=self.context).data
-        except models.UserProfile.DoesNotExist:
-            return ""
+        return self._get_kind_credentials(obj, 'openstack',
+                                          OpenstackCredsSerializer)
 
     def get_azure_creds(self, obj):
         """
-        Include a URL for listing this bucket's contents
+        Include the user's Azure credentials
         """
-        try:
-            creds = obj.userprofile.credentials.filter(
-                azurecredentials__isnull=False).select_subclasses()
-            return AzureCredsSerializer(instance=creds, many=True,
-                                        context=self.context).data
-        except models.UserProfile.DoesNotExist:
-            return ""
+        return self._get_kind_credentials(obj, 'azure', AzureCredsSerializer)
 
     def get_gce_creds(self, obj):
         """
-        Include a URL for listing this bucket's contents
+        Include the user's GCE credentials
         """
+        return self._get_kind_credentials(obj, 'gce', GCECredsSerializer)
+
+    def _get_kind_credentials(self, obj, kind, serializer_class):
         try:
-            creds = obj.userprofile.credentials.filter(
-                gcecredentials__isnull=False).select_subclasses()
-            return GCECredsSerializer(instance=creds, many=True,
-                                      context=self.context).data
+            creds = self._get_user_credentials(obj)
         except models.UserProfile.DoesNotExist:
             return ""
+        cloud_kind = cloud_kinds.get_cloud_kind(kind)
+        creds = [cred for cred in creds
+                 if type(cred) is cloud_kind.credentials_model]
+        return serializer_class(instance=creds, many=True,
+                                context=self.get_nested_context()).data
+
+    def _get_user_credentials(self, obj):
+        """
+        Returns all of the user's credentials, with their concrete clouds
+        attached. The credentials and the clouds are each fetched in a single
+        query, which are shared by all kinds of credentials, so the number of
+        queries does not grow with the number of credentials. Encrypted
+        secrets are deferred, since they are never serialized.
+        """
+        if obj.pk not in self._user_credentials:
+            deferred_fields = [
+                '{0}__{1}'.format(
+                    cloud_kind.credentials_model._meta.model_name, field)
+                for cloud_kind in cloud_kinds.get_cloud_kinds()
+                for field in cloud_kind.credentials_model.get_secret_fields()]
+            creds = list(models.Credentials.objects
+                         .filter(user_profile=obj.userprofile)
+                         .select_subclasses()
+                         .defer(*deferred_fields))
+            if creds:
+                clouds = {cloud.slug: cloud for cloud in
+                          models.Cloud.objects.filter(
+                              slug__in={cred.cloud_id for cred in creds})
+                          .select_subclasses()}
+                for cred in creds:
+                    cred.cloud = clouds[cred.cloud_id]
+            self._user_credentials[obj.pk] = creds
+        return self._user_credentials[obj.pk]
 
     class Meta(UserDetailsSerializer.Meta):
         fields = UserDetailsSerializer.Meta.fields + \
@@ -0,0 +1,69 @@
+"""
+Signal receivers that keep djcloudbridge's caches consistent with the
+database.
+"""
+from django.db.models.signals import post_delete
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from . import domain_model
+from . import models
+from . import provider_cache
+from . import view_helpers
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def evict_cloud_providers(sender, instance, **kwargs):
+    """
+    Discard pooled providers when the cloud they were created for, or any
+    credentials for that cloud, are changed or removed.
+    """
+    if isinstance(instance, models.Cloud):
+        domain_model.provider_pool.evict(instance.slug)
+    elif isinstance(instance, models.Credentials):
+        domain_model.provider_pool.evict(instance.cloud_id)
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def invalidate_cloud_cache(sender, instance, **kwargs):
+    """
+    Drop cached clouds when they are changed or removed.
+    """
+    if isinstance(instance, models.Cloud):
+        domain_model.invalidate_cloud(instance.slug)
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def invalidate_credentials_cache(sender, instance, **kwargs):
+    """
+    Drop cached credential dicts for a cloud when any of its credentials are
+    changed or removed.
+    """
+    if isinstance(instance, models.Credentials):
+        view_helpers.credentials_cache.evict(instance.cloud_id)
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def purge_cloud_catalogs(sender, instance, **kwargs):
+    """
+    Drop a cloud's cached catalogs when the cloud is changed or removed, since
+    its region or endpoints may have changed.
+    """
+    if isinstance(instance, models.Cloud):
+        provider_cache.purge_catalogs(instance.slug)
+
+
+@receiver(post_delete)
+def record_deletion(sender, instance, **kwargs):
+    """
+    Record when clouds and credentials are deleted, so that their listings
+    can report an accurate Last-Modified time.
+    """
+    if isinstance(instance, models.Cloud):
+        domain_model.record_deletion('clouds')
+    elif isinstance(instance, models.Credentials):
+        domain_model.record_deletion('credentials', instance.user_profile_id)
@@ -0,0 +1,156 @@
+"""
+Upload handlers for streaming large uploads through to cloud providers.
+"""
+import logging
+import os
+import random
+import time
+
+from cloudbridge.cloud.factory import ProviderList
+from django.conf import settings
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+
+from . import concurrency
+
+log = logging.getLogger(__name__)
+
+# S3 rejects parts, other than the last, smaller than this
+MIN_PART_SIZE = 5 * 1024 * 1024
+# S3 rejects multipart uploads made up of more parts than this
+MAX_PARTS = 10000
+
+
+class ChunkedTemporaryFileUploadHandler(TemporaryFileUploadHandler):
+    """
+    Spools every uploaded file to a temporary file on disk, a chunk of
+    DJCLOUDBRIDGE_UPLOAD_CHUNK_SIZE bytes at a time, regardless of its size.
+    Unlike django's default handlers, no upload is ever held in memory in its
+    entirety, so that uploads of any size use a constant amount of memory.
+    The resulting file can then be streamed to the provider from disk.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(ChunkedTemporaryFileUploadHandler, self).__init__(
+            *args, **kwargs)
+        self.chunk_size = getattr(settings, 'DJCLOUDBRIDGE_UPLOAD_CHUNK_SIZE',
+                                  1024 * 1024)
+
+
+def get_multipart_threshold():
+    return getattr(settings, 'DJCLOUDBRIDGE_MULTIPART_THRESHOLD',
+                   64 * 1024 * 1024)
+
+
+def get_multipart_part_size(size):
+    """
+    Returns the size of the parts in which a file of ``size`` bytes is
+    uploaded. That is DJCLOUDBRIDGE_MULTIPART_PART_SIZE, raised to S3's
+    minimum part size if below it, and to the size needed to stay within
+    S3's maximum number of parts for larger files.
+    """
+    part_size = max(getattr(settings, 'DJCLOUDBRIDGE_MULTIPART_PART_SIZE',
+                            8 * 1024 * 1024), MIN_PART_SIZE)
+    return max(part_size, -(-size // MAX_PARTS))
+
+
+def get_retry_delay(attempt):
+    """
+    Returns the number of seconds to wait before retrying a part after the
+    given number of failed retries. The delay doubles with each attempt,
+    starting at DJCLOUDBRIDGE_MULTIPART_RETRY_BACKOFF seconds, and is
+    jittered, so that throttled parts are not all retried at once.
+    """
+    backoff = getattr(settings, 'DJCLOUDBRIDGE_MULTIPART_RETRY_BACKOFF', 0.5)
+    return random.uniform(0.5, 1) * backoff * 2 ** attempt
+
+
+def upload_content(bucket_object, content):
+    """
+    Uploads the content of an uploaded file to a bucket object, without
+    reading the file into memory. Files spooled to disk are uploaded from
+    their path, which lets providers stream them in parts. Files of at
+    least DJCLOUDBRIDGE_MULTIPART_THRESHOLD bytes are uploaded as concurrent
+    parts, where the provider supports it. Files held in memory, which are
+    small by definition, are uploaded as bytes, which every provider's
+    ``upload()`` accepts.
+    """
+    if hasattr(content, 'temporary_file_path'):
+        path = content.temporary_file_path()
+        s3_object = get_s3_object(bucket_object)
+        if s3_object and os.path.getsize(path) >= get_multipart_threshold():
+            multipart_upload(s3_object, path)
+        else:
+            bucket_object.upload_from_file(path)
+    else:
+        content.seek(0)
+        bucket_object.upload(content.read())
+
+
+def get_s3_object(bucket_object):
+    """
+    Returns the boto3 S3 object wrapped by a bucket object on AWS, the only
+    provider with a multipart upload API, or None on other providers, whose
+    objects are uploaded in a single transfer instead.
+    """
+    if bucket_object._provider.PROVIDER_ID != ProviderList.AWS:
+        return None
+    return bucket_object._obj
+
+
+def multipart_upload(s3_object, path):
+    """
+    Uploads the file at the given path to a boto3 S3 object as a multipart
+    upload, with parts of DJCLOUDBRIDGE_MULTIPART_PART_SIZE bytes uploaded
+    concurrently by at most DJCLOUDBRIDGE_MULTIPART_MAX_WORKERS threads.
+    Each thread reads its own part from disk, so at most one part per thread
+    is held in memory. Failed parts are retried up to
+    DJCLOUDBRIDGE_MULTIPART_RETRIES times, backing off exponentially between
+    attempts. If a part still fails, or the upload cannot be completed, it
+    is aborted, so that no orphaned parts are left behind.
+    """
+    client = s3_object.meta.client
+    bucket = s3_object.bucket_name
+    key = s3_object.key
+    size = os.path.getsize(path)
+    part_size = get_multipart_part_size(size)
+    # Part numbers start at 1
+    parts = [(number + 1, offset, min(part_size, size - offset))
+             for number, offset in enumerate(range(0, size, part_size))]
+
+    upload_id = client.create_multipart_upload(
+        Bucket=bucket, Key=key)['UploadId']
+
+    def upload_part(part):
+        number, offset, length = part
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            data = f.read(length)
+        retries = getattr(settings, 'DJCLOUDBRIDGE_MULTIPART_RETRIES', 3)
+        for attempt in range(retries + 1):
+            try:
+                response = client.upload_part(
+                    Bucket=bucket, Key=key, UploadId=upload_id,
+                    PartNumber=number, Body=data)
+                return {'PartNumber': number, 'ETag': response['ETag']}
+            except Exception:
+                if attempt == retries:
+                    raise
+                log.warning("Retrying part %s of upload %s of %s/%s",
+                            number, upload_id, bucket, key, exc_info=True)
+                time.sleep(get_retry_delay(attempt))
+
+    results = concurrency.run_concurrently(
+        upload_part, parts,
+        max_workers=getattr(settings, 'DJCLOUDBRIDGE_MULTIPART_MAX_WORKERS',
+                            None))
+    try:
+        for result in results:
+            if not result.ok:
+                raise result.error
+        client.complete_multipart_upload(
+            Bucket=bucket, Key=key, UploadId=upload_id,
+            MultipartUpload={'Parts': [result.value for result in results]})
+    except Exception:
+        client.abort_multipart_upload(
+            Bucket=bucket, Key=key, UploadId=upload_id)
+        raise
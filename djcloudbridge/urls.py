@@ -81,6 +81,8 @@ infrastructure_regex_pattern = r''
 app_name = "djcloudbridge"
 
 urlpatterns = [
+    url(r'^aggregate/(?P<resource_type>\w+)/$',
+        views.AggregateListView.as_view(), name='aggregate-list'),
     url(infrastructure_regex_pattern, include(infra_router.urls)),
     url(infrastructure_regex_pattern, include(cloud_router.urls)),
     url(infrastructure_regex_pattern, include(region_router.urls)),
@@ -1,6 +1,9 @@
 """A set of utility functions used by the framework."""
 import operator
 
+from django.conf import settings
+from django.core.cache import caches
+
 
 def getattrd(obj, name):
     """Same as ``getattr()``, but allow dot notation lookup."""
@@ -8,3 +11,11 @@ def getattrd(obj, name):
         return operator.attrgetter(name)(obj)
     except AttributeError:
         return None
+
+
+def get_cache():
+    """
+    Return the django cache used by djcloudbridge, as configured through the
+    ``DJCLOUDBRIDGE_CACHE`` setting.
+    """
+    return caches[getattr(settings, 'DJCLOUDBRIDGE_CACHE', 'default')]
@@ -1,22 +1,137 @@
-import json
+import threading
+import time
+from collections import OrderedDict
 
+from django.conf import settings
+
+from . import cloud_kinds
 from . import domain_model
 from . import models
 
 
+class RequestProviderCache(object):
+    """
+    Holds the providers created during a single request, keyed by cloud slug.
+    Since the credentials are always derived from the request itself, the
+    cloud slug is sufficient to identify a provider within a request.
+    ``hits`` counts the number of provider constructions that were avoided.
+    """
+
+    def __init__(self):
+        self.providers = {}
+        self.scopes = {}
+        self.hits = 0
+
+    def get(self, cloud_pk):
+        provider = self.providers.get(cloud_pk)
+        if provider is not None:
+            self.hits += 1
+        return provider
+
+    def put(self, cloud_pk, provider):
+        self.providers[cloud_pk] = provider
+
+
+def get_request_provider_cache(request):
+    """
+    Returns the provider cache attached to the given request, creating it if
+    necessary. The cache is stored on the underlying django request so that it
+    is shared by every DRF request object wrapping it.
+    """
+    request = getattr(request, '_request', request)
+    cache = getattr(request, '_cloudbridge_provider_cache', None)
+    if cache is None:
+        cache = RequestProviderCache()
+        request._cloudbridge_provider_cache = cache
+    return cache
+
+
+class CredentialsCache(object):
+    """
+    A short-lived cache of resolved credential dicts, keyed by user, cloud
+    slug and credentials id. Since the cached dicts contain decrypted
+    secrets, they are only ever kept in process memory and never in a shared
+    cache backend. Entries for a cloud are evicted whenever any credentials
+    for that cloud are saved or deleted. Once ``max_size`` is reached, the
+    oldest entries are evicted first.
+    """
+
+    def __init__(self, ttl=30, max_size=1000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry and time.monotonic() - entry[1] <= self.ttl:
+            return entry[0]
+        return None
+
+    def set(self, key, cred_dict):
+        if not self.max_size:
+            return
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (cred_dict, time.monotonic())
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def evict(self, cloud_slug):
+        with self._lock:
+            for key in [k for k in self._entries if k[1] == cloud_slug]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+credentials_cache = CredentialsCache(
+    ttl=getattr(settings, 'DJCLOUDBRIDGE_CREDENTIALS_CACHE_TTL', 30))
+
+
 def get_cloud_provider(view, cloud_id=None):
     """
     Returns a cloud provider for the current user. The relevant
     cloud is discovered from the view and the credentials are retrieved
     from the request or user profile. Return ``None`` if no credentials were
     retrieved.
+
+    The provider is memoized on the request, so the view, its serializers and
+    any provider related fields all share a single provider instance.
     """
     cloud_pk = cloud_id or view.kwargs.get("cloud_pk")
-    cloud = models.Cloud.objects.filter(
-        slug=cloud_pk).select_subclasses().first()
+    provider_cache = get_request_provider_cache(view.request)
+    provider = provider_cache.get(cloud_pk)
+    if provider is not None:
+        return provider
+
+    cloud = domain_model.get_cloud(cloud_pk)
 
     request_creds = get_credentials(cloud, view.request)
-    return domain_model.get_cloud_provider(cloud, request_creds)
+    provider = domain_model.get_cloud_provider(cloud, request_creds)
+    provider_cache.put(cloud_pk, provider)
+    return provider
+
+
+def get_credentials_scope(view, cloud_id=None):
+    """
+    Returns an opaque fingerprint of the current user's credentials for the
+    cloud discovered from the view. Requests made with the same credentials
+    share a scope, so it can be used to key data cached per account, without
+    exposing the credentials themselves.
+    """
+    cloud_pk = cloud_id or view.kwargs.get("cloud_pk")
+    provider_cache = get_request_provider_cache(view.request)
+    scope = provider_cache.scopes.get(cloud_pk)
+    if scope is None:
+        cloud = domain_model.get_cloud(cloud_pk)
+        scope = domain_model.ProviderPool.fingerprint(
+            get_credentials(cloud, view.request))
+        provider_cache.scopes[cloud_pk] = scope
+    return scope
 
 
 def get_credentials(cloud, request):
@@ -41,73 +156,10 @@ def get_credentials_from_request(cloud, request):
         return get_credentials_by_id(
             cloud, request, request.META.get('HTTP_CL_CREDENTIALS_ID'))
 
-    # In case a base class instance is sent in, attempt to retrieve the actual
-    # subclass.
-    if type(cloud) is models.Cloud:
-        cloud = models.Cloud.objects.get_subclass(slug=cloud.slug)
-    if isinstance(cloud, models.OpenStack):
-        os_username = request.META.get('HTTP_CL_OS_USERNAME')
-        os_password = request.META.get('HTTP_CL_OS_PASSWORD')
-
-        if os_username or os_password:
-            os_project_name = request.META.get('HTTP_CL_OS_PROJECT_NAME')
-            os_project_domain_name = request.META.get(
-                'HTTP_CL_OS_PROJECT_DOMAIN_NAME')
-            os_user_domain_name = request.META.get(
-                'HTTP_CL_OS_USER_DOMAIN_NAME')
-
-            d = {'os_username': os_username, 'os_password': os_password}
-            if os_project_name:
-                d['os_project_name'] = os_project_name
-            if os_project_domain_name:
-                d['os_project_domain_name'] = os_project_domain_name
-            if os_user_domain_name:
-                d['os_user_domain_name'] = os_user_domain_name
-            return d
-        else:
-            return {}
-    elif isinstance(cloud, models.AWS):
-        aws_access_key = request.META.get('HTTP_CL_AWS_ACCESS_KEY')
-        aws_secret_key = request.META.get('HTTP_CL_AWS_SECRET_KEY')
-        if aws_access_key or aws_secret_key:
-            return {'aws_access_key': aws_access_key,
-                    'aws_secret_key': aws_secret_key,
-                    }
-        else:
-            return {}
-    elif isinstance(cloud, models.Azure):
-        azure_subscription_id = request.META.get(
-            'HTTP_CL_AZURE_SUBSCRIPTION_ID')
-        azure_client_id = request.META.get('HTTP_CL_AZURE_CLIENT_ID')
-        azure_secret = request.META.get('HTTP_CL_AZURE_SECRET')
-        azure_tenant = request.META.get('HTTP_CL_AZURE_TENANT')
-        azure_resource_group = request.META.get('HTTP_CL_AZURE_RESOURCE_GROUP')
-        azure_storage_account = request.META.get(
-            'HTTP_CL_AZURE_STORAGE_ACCOUNT')
-        azure_vm_default_username = request.META.get(
-            'HTTP_CL_AZURE_VM_DEFAULT_USERNAME')
-
-        if (azure_subscription_id and azure_client_id and azure_secret and
-                azure_tenant):
-            return {'azure_subscription_id': azure_subscription_id,
-                    'azure_client_id': azure_client_id,
-                    'azure_secret': azure_secret,
-                    'azure_tenant': azure_tenant,
-                    'azure_resource_group': azure_resource_group,
-                    'azure_storage_account': azure_storage_account,
-                    'azure_vm_default_username': azure_vm_default_username
-                    }
-        else:
-            return {}
-    elif isinstance(cloud, models.GCE):
-        gce_credentials_json = request.META.get('HTTP_CL_GCE_CREDENTIALS_JSON')
-
-        if gce_credentials_json:
-            return json.loads(gce_credentials_json)
-        else:
-            return {}
-    else:
+    cloud_kind = cloud_kinds.get_cloud_kind(cloud.kind)
+    if not cloud_kind:
         raise Exception("Unrecognised cloud provider: %s" % cloud)
+    return cloud_kind.get_request_credentials(request)
 
 
 def get_credentials_by_id(cloud, request, credentials_id):
@@ -116,17 +168,17 @@ def get_credentials_by_id(cloud, request, credentials_id):
     current user's profile. If the user is not logged in or no credentials
     are found, returns an empty dict.
     """
-    if request.user.is_anonymous:
+    if request.user.is_anonymous or not credentials_id:
         return {}
-    profile = request.user.userprofile
 
-    if credentials_id:
-        credentials = (profile.credentials
-                       .filter(cloud=cloud, id=credentials_id)
-                       .select_subclasses().first())
-        if credentials:
-            return credentials.as_dict()
-    return {}
+    cache_key = (request.user.pk, cloud.slug, str(credentials_id))
+    cred_dict = credentials_cache.get(cache_key)
+    if cred_dict is None:
+        credentials = _get_user_credentials(cloud, request).filter(
+            id=credentials_id).first()
+        cred_dict = credentials.as_dict() if credentials else {}
+        credentials_cache.set(cache_key, cred_dict)
+    return dict(cred_dict)
 
 
 def get_credentials_from_profile(cloud, request):
@@ -141,18 +193,32 @@ def get_credentials_from_profile(cloud, request):
     """
     if request.user.is_anonymous:
         return {}
-    profile = request.user.userprofile
-
-    # Check for default credentials
-    credentials = profile.credentials.filter(cloud=cloud, default=True). \
-        select_subclasses().first()
-    if credentials:
-        return credentials.as_dict()
-    # Check for a set of credentials for the given cloud
-    credentials = profile.credentials.filter(cloud=cloud).select_subclasses()
-    if not credentials:
-        return {}
-    if credentials.count() == 1:
-        return credentials[0].as_dict()
-    else:
-        raise ValueError("Too many credentials to choose from.")
+
+    cache_key = (request.user.pk, cloud.slug, None)
+    cred_dict = credentials_cache.get(cache_key)
+    if cred_dict is None:
+        # Fetch at most two sets of credentials, default first, which is
+        # sufficient to tell whether there is a usable set.
+        credentials = list(
+            _get_user_credentials(cloud, request).order_by('-default')[:2])
+        if not credentials:
+            cred_dict = {}
+        elif credentials[0].default or len(credentials) == 1:
+            cred_dict = credentials[0].as_dict()
+        else:
+            raise ValueError("Too many credentials to choose from.")
+        credentials_cache.set(cache_key, cred_dict)
+    return dict(cred_dict)
+
+
+def _get_user_credentials(cloud, request):
+    """
+    Returns a queryset of the current user's credentials for the given cloud,
+    joined only against the credentials table matching the cloud's kind.
+    """
+    credentials = models.Credentials.objects.filter(
+        user_profile__user=request.user, cloud=cloud)
+    cloud_kind = cloud_kinds.get_cloud_kind(cloud.kind)
+    if cloud_kind:
+        return credentials.select_subclasses(cloud_kind.credentials_model)
+    return credentials.select_subclasses()
@@ -1,16 +1,26 @@
+from django.conf import settings
 from django.http.response import FileResponse
 from django.http.response import Http404
+from django.http.response import HttpResponse
+from django.http.response import HttpResponseRedirect
 from rest_framework import mixins
 from rest_framework import renderers
+from rest_framework import status
 from rest_framework import viewsets
-from rest_framework.pagination import PageNumberPagination
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from . import bucket_listing
+from . import concurrency
+from . import domain_model
+from . import downloads
 from . import drf_helpers
 from . import models
+from . import provider_cache
 from . import serializers
+from . import upload_handlers
+from . import util
 from . import view_helpers
 
 
@@ -25,13 +35,100 @@ class InfrastructureView(APIView):
         return Response(response)
 
 
-class CloudViewSet(viewsets.ModelViewSet):
+class AggregateListView(APIView):
+    """
+    List a kind of resource across every cloud the current user has
+    credentials for, optionally restricted to a comma separated list of
+    cloud slugs through the ``clouds`` query parameter. The clouds are
+    queried concurrently and each result is tagged with its cloud's slug.
+    Clouds that fail or time out are reported under ``errors``, instead of
+    failing the whole request.
+    """
+    permission_classes = (IsAuthenticated,)
+    # Maps each resource type to its serializer and provider service
+    resources = {
+        'instances': (serializers.InstanceSerializer, 'compute.instances'),
+        'machine_images': (serializers.MachineImageSerializer,
+                           'compute.images'),
+        'keypairs': (serializers.KeyPairSerializer, 'security.key_pairs'),
+        'vm_firewalls': (serializers.VMFirewallSerializer,
+                         'security.vm_firewalls'),
+        'networks': (serializers.NetworkSerializer, 'networking.networks'),
+        'routers': (serializers.RouterSerializer, 'networking.routers'),
+        'volumes': (serializers.VolumeSerializer, 'storage.volumes'),
+        'snapshots': (serializers.SnapshotSerializer, 'storage.snapshots'),
+        'buckets': (serializers.BucketSerializer, 'storage.buckets'),
+    }
+
+    def get(self, request, resource_type, content_format=None):
+        if resource_type not in self.resources:
+            raise Http404
+        targets = []
+        errors = []
+        for cloud in self.get_clouds():
+            try:
+                targets.append(
+                    (cloud, view_helpers.get_credentials(cloud, request)))
+            except ValueError as e:
+                errors.append({'cloud': cloud.slug, 'error': str(e),
+                               'timed_out': False})
+
+        results = []
+        for result in concurrency.run_concurrently(
+                lambda target: self.list_cloud(resource_type, *target),
+                targets, timeout=getattr(
+                    settings, 'DJCLOUDBRIDGE_AGGREGATE_TIMEOUT', 30)):
+            if result.ok:
+                results.extend(result.value)
+            else:
+                errors.append({'cloud': result.item[0].slug,
+                               'error': str(result.error),
+                               'timed_out': result.timed_out})
+        return Response({'count': len(results),
+                         'results': results,
+                         'errors': errors})
+
+    def get_clouds(self):
+        """
+        Returns the clouds the current user has credentials for.
+        """
+        slugs = set(models.Credentials.objects.filter(
+            user_profile__user=self.request.user).values_list(
+                'cloud_id', flat=True))
+        requested = self.request.query_params.get('clouds')
+        if requested:
+            slugs &= set(requested.split(','))
+        clouds = [domain_model.get_cloud(slug) for slug in sorted(slugs)]
+        return [cloud for cloud in clouds if cloud]
+
+    def list_cloud(self, resource_type, cloud, cred_dict):
+        serializer_class, service = self.resources[resource_type]
+        provider = domain_model.get_cloud_provider(cloud, cred_dict)
+        objects = list(drf_helpers.iter_provider_objects(
+            util.getattrd(provider, service)))
+        # Hyperlinks are resolved through the cloud slug in the context
+        data = serializer_class(
+            objects, many=True,
+            context={'request': self.request, 'view': self,
+                     'format': self.format_kwarg,
+                     'cloud_pk': cloud.slug}).data
+        for item in data:
+            item['cloud'] = cloud.slug
+        return data
+
+
+class CloudViewSet(drf_helpers.LastModifiedMixin, viewsets.ModelViewSet):
     """
     API endpoint to view and or edit cloud infrastructure info.
     """
-    queryset = models.Cloud.objects.all()
+    # Load the concrete clouds up front, so that serializing kind specific
+    # properties does not require a query per cloud.
+    queryset = models.Cloud.objects.select_subclasses()
     serializer_class = serializers.CloudSerializer
 
+    def get_last_deletion(self):
+        return domain_model.get_last_deletion('clouds')
+
 
 class ComputeViewSet(drf_helpers.CustomReadOnlySingleViewSet):
     """
@@ -50,13 +147,14 @@ class RegionViewSet(drf_helpers.CustomReadOnlyModelViewSet):
     serializer_class = serializers.RegionSerializer
 
     def list_objects(self):
-        provider = view_helpers.get_cloud_provider(self)
-        return provider.compute.regions.list()
+        return self.list_catalog_objects('regions', self._get_service)
 
     def get_object(self):
-        provider = view_helpers.get_cloud_provider(self)
-        obj = provider.compute.regions.get(self.kwargs["pk"])
-        return obj
+        return self.retrieve_catalog_object(
+            'regions', self.kwargs["pk"], self._get_service)
+
+    def _get_service(self):
+        return view_helpers.get_cloud_provider(self).compute.regions
 
 
 class MachineImageViewSet(drf_helpers.CustomModelViewSet):
@@ -66,15 +164,24 @@ class MachineImageViewSet(drf_helpers.CustomModelViewSet):
     permission_classes = (IsAuthenticated,)
     # Required for the Browsable API renderer to have a nice form.
     serializer_class = serializers.MachineImageSerializer
+    provider_search_fields = ('id', 'name', 'description')
 
     def list_objects(self):
-        provider = view_helpers.get_cloud_provider(self)
-        return provider.compute.images.list()
+        return self.list_catalog_objects('images', self._get_service)
 
     def get_object(self):
-        provider = view_helpers.get_cloud_provider(self)
-        obj = provider.compute.images.get(self.kwargs["pk"])
-        return obj
+        if self.action == 'retrieve':
+            return self.retrieve_catalog_object(
+                'images', self.kwargs["pk"], self._get_service)
+        # Modifications require the provider's own object
+        return self._get_service().get(self.kwargs["pk"])
+
+    def perform_destroy(self, instance):
+        instance.delete()
+        provider_cache.purge_catalogs(self.kwargs.get("cloud_pk"))
+
+    def _get_service(self):
+        return view_helpers.get_cloud_provider(self).compute.images
 
 
 class ZoneViewSet(drf_helpers.CustomReadOnlyModelViewSet):
@@ -86,8 +193,15 @@ class ZoneViewSet(drf_helpers.CustomReadOnlyModelViewSet):
     serializer_class = serializers.ZoneSerializer
 
     def list_objects(self):
-        provider = view_helpers.get_cloud_provider(self)
         region_pk = self.kwargs.get("region_pk")
+        if not provider_cache.get_catalog_ttl('zones'):
+            return self._get_zones(region_pk)
+        return provider_cache.get_catalog(
+            self, 'zones', lambda: self._get_zones(region_pk),
+            variant=region_pk)
+
+    def _get_zones(self, region_pk):
+        provider = view_helpers.get_cloud_provider(self)
         region = provider.compute.regions.get(region_pk)
         if region:
             return region.zones
@@ -125,7 +239,7 @@ class KeyPairViewSet(drf_helpers.CustomModelViewSet):
 
     def list_objects(self):
         provider = view_helpers.get_cloud_provider(self)
-        return provider.security.key_pairs.list()
+        return self.list_provider_objects(provider.security.key_pairs)
 
     def get_object(self):
         provider = view_helpers.get_cloud_provider(self)
@@ -143,7 +257,8 @@ class VMFirewallViewSet(drf_helpers.CustomModelViewSet):
 
     def list_objects(self):
         provider = view_helpers.get_cloud_provider(self)
-        return provider.security.vm_firewalls.list()
+        return self.list_provider_objects(
+            provider.security.vm_firewalls)
 
     def get_object(self):
         provider = view_helpers.get_cloud_provider(self)
@@ -163,7 +278,7 @@ class VMFirewallRuleViewSet(drf_helpers.CustomModelViewSet):
         vmf_pk = self.kwargs.get("vm_firewall_pk")
         vmf = provider.security.vm_firewalls.get(vmf_pk)
         if vmf:
-            return vmf.rules.list()
+            return self.list_provider_objects(vmf.rules)
         else:
             raise Http404
 
@@ -199,7 +314,7 @@ class NetworkViewSet(drf_helpers.CustomModelViewSet):
 
     def list_objects(self):
         provider = view_helpers.get_cloud_provider(self)
-        return provider.networking.networks.list()
+        return self.list_provider_objects(provider.networking.networks)
 
     def get_object(self):
         provider = view_helpers.get_cloud_provider(self)
@@ -215,8 +330,8 @@ class SubnetViewSet(drf_helpers.CustomModelViewSet):
 
     def list_objects(self):
         provider = view_helpers.get_cloud_provider(self)
-        return provider.networking.subnets.list(
-            network=self.kwargs["network_pk"])
+        return self.list_provider_objects(provider.networking.subnets,
+                                          network=self.kwargs["network_pk"])
 
     def get_object(self):
         provider = view_helpers.get_cloud_provider(self)
@@ -239,7 +354,7 @@ class GatewayViewSet(drf_helpers.CustomModelViewSet):
     def list_objects(self):
         provider = view_helpers.get_cloud_provider(self)
         net = provider.networking.networks.get(self.kwargs['network_pk'])
-        return net.gateways.list()
+        return self.list_provider_objects(net.gateways)
 
     def get_object(self):
         provider = view_helpers.get_cloud_provider(self)
@@ -258,7 +373,7 @@ class RouterViewSet(drf_helpers.CustomModelViewSet):
 
     def list_objects(self):
         provider = view_helpers.get_cloud_provider(self)
-        return provider.networking.routers.list()
+        return self.list_provider_objects(provider.networking.routers)
 
     def get_object(self):
         provider = view_helpers.get_cloud_provider(self)
@@ -285,7 +400,7 @@ class FloatingIPViewSet(drf_helpers.CustomModelViewSet):
         return ips
 
 
-class LargeResultsSetPagination(PageNumberPagination):
+class LargeResultsSetPagination(drf_helpers.ProviderCursorPagination):
     """Modify aspects of the pagination style, primarily page size."""
 
     page_size = 500
@@ -303,25 +418,30 @@ class VMTypeViewSet(drf_helpers.CustomReadOnlyModelViewSet):
     lookup_value_regex = '[^/]+'
 
     def list_objects(self):
-        provider = view_helpers.get_cloud_provider(self)
-        return provider.compute.vm_types.list(limit=500)
+        return self.list_catalog_objects('vm_types', self._get_service)
 
     def get_object(self):
-        provider = view_helpers.get_cloud_provider(self)
-        return provider.compute.vm_types.get(self.kwargs.get('pk'))
+        return self.retrieve_catalog_object(
+            'vm_types', self.kwargs.get('pk'), self._get_service)
+
+    def _get_service(self):
+        return view_helpers.get_cloud_provider(self).compute.vm_types
 
 
-class InstanceViewSet(drf_helpers.CustomModelViewSet):
+class InstanceViewSet(drf_helpers.BulkOperationsMixin,
+                      drf_helpers.CustomModelViewSet):
     """
     List compute instances in a given cloud.
     """
     permission_classes = (IsAuthenticated,)
     # Required for the Browsable API renderer to have a nice form.
     serializer_class = serializers.InstanceSerializer
+    provider_filter_fields = ('name', 'state')
+    list_cache_name = 'instances'
 
     def list_objects(self):
         provider = view_helpers.get_cloud_provider(self)
-        return provider.compute.instances.list()
+        return self.list_provider_objects(provider.compute.instances)
 
     def get_object(self):
         provider = view_helpers.get_cloud_provider(self)
@@ -340,17 +460,20 @@ class StorageViewSet(drf_helpers.CustomReadOnlySingleViewSet):
     serializer_class = serializers.StorageSerializer
 
 
-class VolumeViewSet(drf_helpers.CustomModelViewSet):
+class VolumeViewSet(drf_helpers.BulkOperationsMixin,
+                    drf_helpers.CustomModelViewSet):
     """
     List volumes in a given cloud.
     """
     permission_classes = (IsAuthenticated,)
     # Required for the Browsable API renderer to have a nice form.
     serializer_class = serializers.VolumeSerializer
+    provider_filter_fields = ('name', 'state')
+    list_cache_name = 'volumes'
 
     def list_objects(self):
         provider = view_helpers.get_cloud_provider(self)
-        return provider.storage.volumes.list()
+        return self.list_provider_objects(provider.storage.volumes)
 
     def get_object(self):
         provider = view_helpers.get_cloud_provider(self)
@@ -358,16 +481,19 @@ class VolumeViewSet(drf_helpers.CustomModelViewSet):
         return obj
 
 
-class SnapshotViewSet(drf_helpers.CustomModelViewSet):
+class SnapshotViewSet(drf_helpers.BulkOperationsMixin,
+                      drf_helpers.CustomModelViewSet):
     """
     List snapshots in a given cloud.
     """
     permission_classes = (IsAuthenticated,)
     serializer_class = serializers.SnapshotSerializer
+    provider_filter_fields = ('name', 'state')
+    list_cache_name = 'snapshots'
 
     def list_objects(self):
         provider = view_helpers.get_cloud_provider(self)
-        return provider.storage.snapshots.list()
+        return self.list_provider_objects(provider.storage.snapshots)
 
     def get_object(self):
         provider = view_helpers.get_cloud_provider(self)
@@ -392,7 +518,7 @@ class BucketViewSet(drf_helpers.CustomModelViewSet):
 
     def list_objects(self):
         provider = view_helpers.get_cloud_provider(self)
-        return provider.storage.buckets.list()
+        return self.list_provider_objects(provider.storage.buckets)
 
     def get_object(self):
         provider = view_helpers.get_cloud_provider(self)
@@ -421,15 +547,51 @@ class BucketObjectViewSet(drf_helpers.CustomModelViewSet):
     lookup_value_regex = '.*'
     renderer_classes = drf_helpers.CustomModelViewSet.renderer_classes + \
         [BucketObjectBinaryRenderer]
+    prefix_query_param = 'prefix'
+    delimiter_query_param = 'delimiter'
+
+    def initialize_request(self, request, *args, **kwargs):
+        # Spool uploads to disk in chunks, instead of buffering them in
+        # memory, so that they can be streamed to the provider.
+        request.upload_handlers = [
+            upload_handlers.ChunkedTemporaryFileUploadHandler(request)]
+        return super(BucketObjectViewSet, self).initialize_request(
+            request, *args, **kwargs)
 
     def list_objects(self):
+        """
+        Lists the objects under the requested ``prefix``. Given a
+        ``delimiter``, keys that contain it after the prefix are returned as
+        ``common_prefixes`` instead, which allows browsing buckets folder by
+        folder. Each page is fetched from the provider separately, unless the
+        listing is filtered. Streamed listings are not grouped by delimiter.
+        """
         provider = view_helpers.get_cloud_provider(self)
         bucket_pk = self.kwargs.get("bucket_pk")
         bucket = provider.storage.buckets.get(bucket_pk)
-        if bucket:
-            return bucket.objects.list()
-        else:
+        if not bucket:
             raise Http404
+        prefix = self.request.query_params.get(self.prefix_query_param)
+        if self.streaming:
+            kwargs = {'prefix': prefix} if prefix else {}
+            return self.list_provider_objects(bucket.objects, **kwargs)
+        kwargs = {}
+        if (not self.has_provider_filters() and isinstance(
+                self.paginator, drf_helpers.ProviderCursorPagination)):
+            kwargs = self.paginator.get_provider_list_kwargs(self.request)
+        delimiter = self.request.query_params.get(self.delimiter_query_param)
+        listing = bucket_listing.list_objects(
+            bucket, prefix=prefix, delimiter=delimiter, **kwargs)
+        if delimiter:
+            self.common_prefixes = listing.common_prefixes
+        return listing
+
+    def get_paginated_response(self, data):
+        response = super(BucketObjectViewSet, self).get_paginated_response(
+            data)
+        if getattr(self, 'common_prefixes', None) is not None:
+            response.data['common_prefixes'] = self.common_prefixes
+        return response
 
     def retrieve(self, request, *args, **kwargs):
         bucket_object = self.get_object()
@@ -437,16 +599,67 @@ class BucketObjectViewSet(drf_helpers.CustomModelViewSet):
         # TODO: This is a bit ugly, since ideally, only the renderer
         # should be aware of the format
         if content_format == "binary":
-            response = FileResponse(
-                streaming_content=bucket_object.iter_content(),
-                content_type='application/octet-stream')
-            response['Content-Disposition'] = ('attachment; filename="%s"'
-                                               % bucket_object.name)
-            return response
+            return self.download(request, bucket_object)
         else:
             serializer = self.get_serializer(bucket_object)
             return Response(serializer.data)
 
+    def download(self, request, bucket_object):
+        """
+        Streams the object's content, or the byte span requested by a Range
+        header, so that interrupted downloads can be resumed. Ranges are only
+        advertised where the provider supports ranged reads. HEAD requests
+        only get the headers. Unless DJCLOUDBRIDGE_DOWNLOAD_MODE is 'proxy',
+        downloads are redirected to a signed provider URL instead, where the
+        cloud's kind supports it.
+        """
+        if not bucket_object:
+            raise Http404
+        if (request.method == 'GET' and
+                downloads.get_download_mode() != downloads.PROXY):
+            signed_url = downloads.get_signed_url(
+                domain_model.get_cloud(self.kwargs['cloud_pk']),
+                bucket_object)
+            if signed_url:
+                return HttpResponseRedirect(signed_url)
+        size = bucket_object.size
+        last_modified = downloads.get_last_modified(bucket_object)
+        if request.method == 'HEAD':
+            response = HttpResponse(content_type='application/octet-stream')
+            response['Content-Length'] = size
+        else:
+            try:
+                byte_range = downloads.get_range(request, size, last_modified)
+            except downloads.RangeNotSatisfiable:
+                response = HttpResponse(
+                    status=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+                response['Content-Range'] = 'bytes */{0}'.format(size)
+                return response
+            if byte_range:
+                start, end = byte_range
+                response = FileResponse(
+                    streaming_content=downloads.iter_range(
+                        bucket_object, start, end),
+                    content_type='application/octet-stream',
+                    status=status.HTTP_206_PARTIAL_CONTENT)
+                response['Content-Range'] = 'bytes {0}-{1}/{2}'.format(
+                    start, end, size)
+                response['Content-Length'] = end - start + 1
+            else:
+                response = FileResponse(
+                    streaming_content=bucket_object.iter_content(),
+                    content_type='application/octet-stream')
+                response['Content-Length'] = size
+        if downloads.supports_ranged_reads(bucket_object):
+            # Ranges are served elsewhere too, but without saving any of the
+            # transfer from the provider, so they are not advertised
+            response['Accept-Ranges'] = 'bytes'
+        if last_modified:
+            response['Last-Modified'] = last_modified
+        response['Content-Disposition'] = ('attachment; filename="%s"'
+                                           % bucket_object.name)
+        return response
+
     def get_object(self):
         provider = view_helpers.get_cloud_provider(self)
         bucket_pk = self.kwargs.get("bucket_pk")
@@ -465,7 +678,31 @@ class CredentialsRouteViewSet(drf_helpers.CustomReadOnlySingleViewSet):
     serializer_class = serializers.CredentialsSerializer
 
 
-class CredentialsViewSet(viewsets.ModelViewSet):
+class CredentialsViewSet(drf_helpers.LastModifiedMixin,
+                         viewsets.ModelViewSet):
+    """
+    Base viewset for the current user's credentials. Encrypted secrets are
+    write-only, so they are deferred to avoid loading and decrypting them.
+    Credentials are serialized along with their cloud, so edits to the cloud
+    modify them too.
+    """
+    last_modified_fields = ('updated', 'cloud__updated')
+
+    def get_queryset(self):
+        user = self.request.user
+        model = self.queryset.model
+        if hasattr(user, 'userprofile'):
+            return model.objects.filter(
+                user_profile=user.userprofile).select_related('cloud').defer(
+                *model.get_secret_fields())
+        return model.objects.none()
+
+    def get_last_deletion(self):
+        user = self.request.user
+        if hasattr(user, 'userprofile'):
+            return domain_model.get_last_deletion('credentials',
+                                                  user.userprofile.pk)
+        return None
 
     def perform_create(self, serializer):
         if not hasattr(self.request.user, 'userprofile'):
@@ -482,13 +719,6 @@ class AWSCredentialsViewSet(CredentialsViewSet):
     serializer_class = serializers.AWSCredsSerializer
     # permission_classes = [permissions.DjangoModelPermissions]
 
-    def get_queryset(self):
-        user = self.request.user
-        if hasattr(user, 'userprofile'):
-            return user.userprofile.credentials.filter(
-                awscredentials__isnull=False).select_subclasses()
-        return models.AWSCredentials.objects.none()
-
 
 class OpenstackCredentialsViewSet(CredentialsViewSet):
     """
@@ -498,13 +728,6 @@ class OpenstackCredentialsViewSet(CredentialsViewSet):
     serializer_class = serializers.OpenstackCredsSerializer
     # permission_classes = [permissions.DjangoModelPermissions]
 
-    def get_queryset(self):
-        user = self.request.user
-        if hasattr(user, 'userprofile'):
-            return user.userprofile.credentials.filter(
-                openstackcredentials__isnull=False).select_subclasses()
-        return models.OpenStackCredentials.objects.none()
-
 
 class AzureCredentialsViewSet(CredentialsViewSet):
     """
@@ -514,13 +737,6 @@ class AzureCredentialsViewSet(CredentialsViewSet):
     serializer_class = serializers.AzureCredsSerializer
     # permission_classes = [permissions.DjangoModelPermissions]
 
-    def get_queryset(self):
-        user = self.request.user
-        if hasattr(user, 'userprofile'):
-            return user.userprofile.credentials.filter(
-                azurecredentials__isnull=False).select_subclasses()
-        return models.AzureCredentials.objects.none()
-
 
 class GCECredentialsViewSet(CredentialsViewSet):
     """
@@ -529,10 +745,3 @@ class GCECredentialsViewSet(CredentialsViewSet):
     queryset = models.GCECredentials.objects.all()
     serializer_class = serializers.GCECredsSerializer
     # permission_classes = [permissions.DjangoModelPermissions]
-
-    def get_queryset(self):
-        user = self.request.user
-        if hasattr(user, 'userprofile'):
-            return user.userprofile.credentials.filter(
-                gcecredentials__isnull=False).select_subclasses()
-        return models.GCECredentials.objects.none()
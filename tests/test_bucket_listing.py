@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_bucket_listing
+------------
+
+Tests for `djcloudbridge` bucket_listing module.
+"""
+from unittest import mock
+
+from django.test import TestCase
+
+from djcloudbridge import bucket_listing
+
+
+class FakeObject(object):
+
+    def __init__(self, name):
+        self.id = name
+        self.name = name
+
+
+class FakeObjectService(object):
+
+    def __init__(self, names):
+        self.names = sorted(names)
+        self.prefixes = []
+        self.markers = []
+
+    def list(self, prefix='', marker=None):
+        # Like Swift, the marker may be any key, not just an object's
+        self.prefixes.append(prefix)
+        self.markers.append(marker)
+        return [FakeObject(name) for name in self.names
+                if name.startswith(prefix) and name > (marker or '')]
+
+
+class FakeS3Client(object):
+    """
+    Mimics S3's ListObjects API, returning at most ``page_size`` keys and
+    common prefixes per request.
+    """
+
+    def __init__(self, keys, page_size=1000):
+        self.keys = sorted(keys)
+        self.page_size = page_size
+        self.requests = []
+
+    def list_objects(self, Bucket, Prefix='', Delimiter=None, MaxKeys=1000,
+                     Marker=''):
+        self.requests.append(
+            {'Prefix': Prefix, 'Delimiter': Delimiter, 'MaxKeys': MaxKeys,
+             'Marker': Marker})
+        max_keys = min(MaxKeys, self.page_size)
+        contents = []
+        common_prefixes = []
+        is_truncated = False
+        for key in self.keys:
+            # Keys rolled up into a common prefix used as the marker are
+            # skipped
+            if (not key.startswith(Prefix) or key <= Marker or (
+                    Delimiter and Marker.endswith(Delimiter) and
+                    key.startswith(Marker))):
+                continue
+            index = key.find(Delimiter, len(Prefix)) if Delimiter else -1
+            common_prefix = key[:index + 1] if index >= 0 else None
+            if common_prefix and common_prefix in common_prefixes:
+                continue
+            if len(contents) + len(common_prefixes) == max_keys:
+                is_truncated = True
+                break
+            if common_prefix:
+                common_prefixes.append(common_prefix)
+            else:
+                contents.append({'Key': key, 'Size': len(key),
+                                 'LastModified': '2018-01-01T00:00:00',
+                                 'ETag': '"%s"' % key})
+        response = {'IsTruncated': is_truncated}
+        if contents:
+            response['Contents'] = contents
+        if common_prefixes:
+            response['CommonPrefixes'] = [{'Prefix': common_prefix}
+                                          for common_prefix in common_prefixes]
+        # S3 only returns the next marker when given a delimiter
+        if is_truncated and Delimiter:
+            response['NextMarker'] = max(
+                [content['Key'] for content in contents] + common_prefixes)
+        return response
+
+
+class FakeS3Bucket(object):
+
+    def __init__(self, client):
+        self.name = 'bucket-1'
+        self.meta = mock.Mock(client=client)
+
+    def Object(self, key):
+        return mock.Mock(key=key)
+
+
+class ListObjectsTestCase(TestCase):
+
+    def setUp(self):
+        self.bucket = mock.Mock(spec=['_provider', 'objects'])
+        self.bucket._provider.PROVIDER_ID = 'openstack'
+        self.bucket.objects = FakeObjectService([
+            'a.txt', 'docs/a', 'docs/b', 'docs/sub/c', 'img/x', 'z.txt'])
+
+    def list_objects(self, **kwargs):
+        listing = bucket_listing.list_objects(self.bucket, **kwargs)
+        return ([obj.name for obj in listing], listing.common_prefixes,
+                listing.is_truncated, listing.marker)
+
+    def test_without_delimiter(self):
+        self.assertEqual(self.list_objects(prefix='docs/'),
+                         (['docs/a', 'docs/b', 'docs/sub/c'], [], False,
+                          None))
+        # The prefix is pushed down to the provider
+        self.assertEqual(self.bucket.objects.prefixes, ['docs/'])
+
+    def test_delimiter(self):
+        self.assertEqual(self.list_objects(delimiter='/'),
+                         (['a.txt', 'z.txt'], ['docs/', 'img/'], False, None))
+        self.assertEqual(self.list_objects(prefix='docs/', delimiter='/'),
+                         (['docs/a', 'docs/b'], ['docs/sub/'], False, None))
+
+    def test_paging(self):
+        self.assertEqual(self.list_objects(delimiter='/', limit=2),
+                         (['a.txt'], ['docs/'], True, 'docs/'))
+        # Keys rolled up into the marker are skipped
+        self.assertEqual(self.list_objects(delimiter='/', limit=2,
+                                           marker='docs/'),
+                         (['z.txt'], ['img/'], False, None))
+        self.assertEqual(self.list_objects(prefix='docs/', limit=1,
+                                           marker='docs/a'),
+                         (['docs/b'], [], True, 'docs/b'))
+
+    def test_object_marker_passed_through(self):
+        self.assertEqual(self.list_objects(delimiter='/', limit=2,
+                                           marker='a.txt'),
+                         ([], ['docs/', 'img/'], True, 'img/'))
+        self.assertEqual(self.list_objects(prefix='docs/', limit=1,
+                                           marker='docs/a'),
+                         (['docs/b'], [], True, 'docs/b'))
+        # Common prefixes are skipped past on the client
+        self.list_objects(delimiter='/', limit=2, marker='docs/')
+        self.assertEqual(self.bucket.objects.markers,
+                         ['a.txt', 'docs/a', None])
+
+
+class ListS3ObjectsTestCase(TestCase):
+
+    def setUp(self):
+        self.client = FakeS3Client([
+            'a.txt', 'docs/a', 'docs/b', 'docs/sub/c', 'img/x', 'z.txt'])
+        self.bucket = mock.Mock(spec=['_provider', '_bucket'])
+        self.bucket._provider.PROVIDER_ID = 'aws'
+        self.bucket._bucket = FakeS3Bucket(self.client)
+        patcher = mock.patch('djcloudbridge.bucket_listing._wrap_s3_object',
+                             side_effect=lambda bucket, obj: obj)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def list_objects(self, **kwargs):
+        listing = bucket_listing.list_objects(self.bucket, **kwargs)
+        return ([obj.key for obj in listing], listing.common_prefixes,
+                listing.is_truncated, listing.marker)
+
+    def test_page_fetched_in_one_request(self):
+        self.assertEqual(self.list_objects(prefix='docs/', delimiter='/',
+                                           limit=2),
+                         (['docs/a', 'docs/b'], [], True, 'docs/b'))
+        self.assertEqual(self.client.requests, [
+            {'Prefix': 'docs/', 'Delimiter': '/', 'MaxKeys': 2,
+             'Marker': ''}])
+
+    def test_common_prefix_as_marker(self):
+        self.assertEqual(self.list_objects(delimiter='/', limit=2),
+                         (['a.txt'], ['docs/'], True, 'docs/'))
+        self.assertEqual(self.list_objects(delimiter='/', limit=2,
+                                           marker='docs/'),
+                         (['z.txt'], ['img/'], False, 'z.txt'))
+        self.assertEqual(self.client.requests[1]['Marker'], 'docs/')
+
+    def test_marker_without_delimiter(self):
+        # Without a delimiter, S3 returns no NextMarker, so the last key is
+        # used instead
+        self.assertEqual(self.list_objects(limit=2),
+                         (['a.txt', 'docs/a'], [], True, 'docs/a'))
+        self.assertEqual(self.list_objects(limit=2, marker='docs/a'),
+                         (['docs/b', 'docs/sub/c'], [], True, 'docs/sub/c'))
+
+    def test_all_pages_fetched_without_limit(self):
+        self.client.page_size = 2
+        self.assertEqual(
+            self.list_objects(delimiter='/'),
+            (['a.txt', 'z.txt'], ['docs/', 'img/'], False, 'z.txt'))
+        self.assertEqual([request['Marker'] for request
+                          in self.client.requests], ['', 'docs/'])
+        self.assertEqual(self.client.requests[0]['MaxKeys'], 1000)
+
+    def test_objects_populated_from_listing(self):
+        objects = bucket_listing.list_objects(self.bucket, prefix='img/')
+        self.assertEqual(objects[0].meta.data, {
+            'ContentLength': 5, 'LastModified': '2018-01-01T00:00:00',
+            'ETag': '"img/x"'})
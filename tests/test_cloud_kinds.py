@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_cloud_kinds
+------------
+
+Tests for `djcloudbridge` cloud_kinds module.
+"""
+from unittest import mock
+
+from django.test import RequestFactory
+from django.test import TestCase
+
+from djcloudbridge import cloud_kinds
+from djcloudbridge import domain_model
+from djcloudbridge import models
+
+
+class CloudKindTestCase(TestCase):
+
+    def setUp(self):
+        self.cloud = models.OpenStack.objects.create(
+            name='Jetstream', slug='jetstream', auth_url='http://keystone',
+            region_name='RegionOne')
+
+    def tearDown(self):
+        domain_model.invalidate_cloud('jetstream')
+
+    def test_registered_kinds(self):
+        for kind in ('aws', 'openstack', 'azure', 'gce'):
+            self.assertEqual(cloud_kinds.get_cloud_kind(kind).kind, kind)
+        self.assertIsNone(cloud_kinds.get_cloud_kind('cloud'))
+
+    def test_request_credentials(self):
+        request = RequestFactory().get('/', HTTP_CL_OS_USERNAME='alice',
+                                       HTTP_CL_OS_PASSWORD='secret')
+        self.assertEqual(
+            cloud_kinds.get_cloud_kind('openstack').get_request_credentials(
+                request),
+            {'os_username': 'alice', 'os_password': 'secret'})
+
+    @mock.patch('djcloudbridge.domain_model.CloudProviderFactory')
+    def test_create_provider_from_base_cloud(self, mock_factory):
+        base_cloud = models.Cloud.objects.get(slug='jetstream')
+        domain_model.create_cloud_provider(base_cloud, {'os_username': 'a'})
+        mock_factory.return_value.create_provider.assert_called_once_with(
+            'openstack', {'os_auth_url': 'http://keystone',
+                          'os_region_name': 'RegionOne',
+                          'os_username': 'a'})
+
+    def test_unrecognised_kind(self):
+        with self.assertRaises(Exception):
+            domain_model.create_cloud_provider(
+                models.Cloud(name='Other', slug='other'), {})
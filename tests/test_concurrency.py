@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_concurrency
+------------
+
+Tests for `djcloudbridge` concurrency module.
+"""
+import threading
+
+from django.test import SimpleTestCase
+
+from djcloudbridge import concurrency
+
+
+class RunConcurrentlyTestCase(SimpleTestCase):
+
+    def test_results_in_order(self):
+        results = concurrency.run_concurrently(lambda i: i * 2, range(5),
+                                               max_workers=2)
+        self.assertEqual([r.item for r in results], [0, 1, 2, 3, 4])
+        self.assertEqual([r.value for r in results], [0, 2, 4, 6, 8])
+        self.assertTrue(all(r.ok for r in results))
+
+    def test_runs_concurrently(self):
+        barrier = threading.Barrier(3, timeout=5)
+        results = concurrency.run_concurrently(
+            lambda i: barrier.wait() is not None, range(3), max_workers=3)
+        self.assertEqual([r.value for r in results], [True] * 3)
+
+    def test_errors_reported_per_item(self):
+        def func(i):
+            if i == 1:
+                raise ValueError("bad item")
+            return i
+        results = concurrency.run_concurrently(func, range(3))
+        self.assertEqual([r.ok for r in results], [True, False, True])
+        self.assertEqual(str(results[1].error), "bad item")
+        self.assertFalse(results[1].timed_out)
+
+    def test_timeout(self):
+        release = threading.Event()
+        results = concurrency.run_concurrently(
+            lambda i: i or release.wait(5), range(2), timeout=0.05)
+        release.set()
+        self.assertTrue(results[0].timed_out)
+        self.assertEqual(results[1].value, 1)
+
+    def test_no_items(self):
+        self.assertEqual(concurrency.run_concurrently(lambda i: i, []), [])
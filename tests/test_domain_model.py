@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_domain_model
+------------
+
+Tests for `djcloudbridge` domain_model module.
+"""
+from unittest import mock
+
+from django.test import TestCase
+
+from djcloudbridge import domain_model
+from djcloudbridge import models
+
+
+class ProviderPoolTestCase(TestCase):
+
+    def setUp(self):
+        self.pool = domain_model.ProviderPool(max_size=2, ttl=60)
+
+    def test_same_credentials_reuse_provider(self):
+        provider = self.pool.get_or_create('aws', {'a': 1}, object)
+        self.assertIs(provider,
+                      self.pool.get_or_create('aws', {'a': 1}, object))
+        self.assertIsNot(provider,
+                         self.pool.get_or_create('aws', {'a': 2}, object))
+
+    def test_lru_eviction(self):
+        first = self.pool.get_or_create('c1', {}, object)
+        self.pool.get_or_create('c2', {}, object)
+        self.pool.get_or_create('c3', {}, object)
+        self.assertEqual(len(self.pool), 2)
+        self.assertIsNot(first, self.pool.get_or_create('c1', {}, object))
+
+    @mock.patch('djcloudbridge.domain_model.time.monotonic')
+    def test_ttl_expiry(self, mock_time):
+        mock_time.return_value = 0
+        provider = self.pool.get_or_create('c1', {}, object)
+        mock_time.return_value = 61
+        self.assertIsNot(provider, self.pool.get_or_create('c1', {}, object))
+
+    @mock.patch('djcloudbridge.domain_model.create_cloud_provider')
+    def test_evicted_on_cloud_save(self, mock_create):
+        mock_create.side_effect = lambda cloud, creds: object()
+        cloud = models.AWS.objects.create(name='Amazon', slug='amazon',
+                                          region_name='us-east-1')
+        provider = domain_model.get_cloud_provider(cloud, {})
+        self.assertIs(provider, domain_model.get_cloud_provider(cloud, {}))
+        cloud.save()
+        self.assertIsNot(provider, domain_model.get_cloud_provider(cloud, {}))
+
+    @mock.patch('djcloudbridge.domain_model.create_cloud_provider')
+    def test_not_reused_once_cloud_edited_elsewhere(self, mock_create):
+        mock_create.side_effect = lambda cloud, creds: object()
+        models.AWS.objects.create(name='Amazon', slug='amazon',
+                                  region_name='us-east-1')
+        provider = domain_model.get_cloud_provider(
+            models.AWS.objects.get(slug='amazon'), {})
+        self.assertIs(provider, domain_model.get_cloud_provider(
+            models.AWS.objects.get(slug='amazon'), {}))
+        # An edit made by another process, which does not evict the
+        # provider from this process's pool
+        models.AWS.objects.filter(slug='amazon').update(
+            region_name='us-west-2')
+        self.assertIsNot(provider, domain_model.get_cloud_provider(
+            models.AWS.objects.get(slug='amazon'), {}))
+
+
+class GetCloudTestCase(TestCase):
+
+    def setUp(self):
+        models.OpenStack.objects.create(
+            name='Jetstream', slug='jetstream', auth_url='http://keystone',
+            region_name='RegionOne')
+
+    def tearDown(self):
+        domain_model.invalidate_cloud('jetstream')
+
+    def test_kind_recorded(self):
+        self.assertEqual(models.Cloud.objects.get(slug='jetstream').kind,
+                         'openstack')
+
+    def test_cloud_resolved_to_subclass_and_cached(self):
+        cloud = domain_model.get_cloud('jetstream')
+        self.assertIsInstance(cloud, models.OpenStack)
+        with self.assertNumQueries(0):
+            cloud = domain_model.get_cloud('jetstream')
+        self.assertEqual(cloud.auth_url, 'http://keystone')
+
+    def test_cache_invalidated_on_save(self):
+        cloud = domain_model.get_cloud('jetstream')
+        cloud.auth_url = 'http://keystone2'
+        cloud.save()
+        self.assertEqual(domain_model.get_cloud('jetstream').auth_url,
+                         'http://keystone2')
+
+    def test_missing_cloud(self):
+        self.assertIsNone(domain_model.get_cloud('missing'))
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_downloads
+------------
+
+Tests for `djcloudbridge` downloads module.
+"""
+import io
+from unittest import mock
+
+from django.test import RequestFactory
+from django.test import TestCase
+
+from djcloudbridge import downloads
+
+
+class FakeObject(object):
+
+    def __init__(self, content):
+        self.content = content
+        self.last_modified = '2018-01-02T03:04:05.000000'
+        self._provider = mock.Mock(PROVIDER_ID='openstack')
+
+    def iter_content(self):
+        return (self.content[i:i + 3] for i in range(0, len(self.content), 3))
+
+
+class GetRangeTestCase(TestCase):
+
+    last_modified = 'Tue, 02 Jan 2018 03:04:05 GMT'
+
+    def get_range(self, size=10, **headers):
+        request = RequestFactory().get('/', **headers)
+        return downloads.get_range(request, size, self.last_modified)
+
+    def test_last_modified(self):
+        self.assertEqual(downloads.get_last_modified(FakeObject(b'')),
+                         self.last_modified)
+
+    def test_ranges(self):
+        self.assertIsNone(self.get_range())
+        self.assertEqual(self.get_range(HTTP_RANGE='bytes=2-5'), (2, 5))
+        self.assertEqual(self.get_range(HTTP_RANGE='bytes=2-'), (2, 9))
+        self.assertEqual(self.get_range(HTTP_RANGE='bytes=2-50'), (2, 9))
+        self.assertEqual(self.get_range(HTTP_RANGE='bytes=-3'), (7, 9))
+        self.assertEqual(self.get_range(HTTP_RANGE='bytes=-30'), (0, 9))
+
+    def test_unsupported_ranges_ignored(self):
+        self.assertIsNone(self.get_range(HTTP_RANGE='bytes=0-1,4-5'))
+        self.assertIsNone(self.get_range(HTTP_RANGE='items=0-1'))
+        self.assertIsNone(self.get_range(HTTP_RANGE='bytes=-'))
+
+    def test_unsatisfiable(self):
+        for header in ('bytes=10-', 'bytes=5-2', 'bytes=-0'):
+            with self.assertRaises(downloads.RangeNotSatisfiable):
+                self.get_range(HTTP_RANGE=header)
+
+    def test_empty_object_unsatisfiable(self):
+        for header in ('bytes=0-', 'bytes=-1'):
+            with self.assertRaises(downloads.RangeNotSatisfiable):
+                self.get_range(size=0, HTTP_RANGE=header)
+
+    def test_if_range(self):
+        self.assertEqual(self.get_range(HTTP_RANGE='bytes=2-5',
+                                        HTTP_IF_RANGE=self.last_modified),
+                         (2, 5))
+        self.assertIsNone(self.get_range(
+            HTTP_RANGE='bytes=2-5',
+            HTTP_IF_RANGE='Wed, 03 Jan 2018 03:04:05 GMT'))
+        self.assertIsNone(self.get_range(HTTP_RANGE='bytes=2-5',
+                                         HTTP_IF_RANGE='"some-etag"'))
+
+
+class IterRangeTestCase(TestCase):
+
+    def test_skips_to_range(self):
+        obj = FakeObject(b'0123456789')
+        self.assertEqual(b''.join(downloads.iter_range(obj, 4, 7)), b'4567')
+        self.assertEqual(b''.join(downloads.iter_range(obj, 0, 0)), b'0')
+        self.assertEqual(b''.join(downloads.iter_range(obj, 8, 9)), b'89')
+
+    def test_range_fetched_from_s3(self):
+        obj = FakeObject(b'0123456789')
+        self.assertFalse(downloads.supports_ranged_reads(obj))
+        obj._provider.PROVIDER_ID = 'aws'
+        obj._obj = mock.Mock()
+        self.assertTrue(downloads.supports_ranged_reads(obj))
+        obj._obj.get.return_value = {'Body': io.BytesIO(b'4567')}
+        self.assertEqual(b''.join(downloads.iter_range(obj, 4, 7)), b'4567')
+        obj._obj.get.assert_called_once_with(Range='bytes=4-7')
@@ -0,0 +1,561 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_drf_helpers
+------------
+
+Tests for `djcloudbridge` drf_helpers module.
+"""
+import json
+import os
+import re
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+from urllib.parse import parse_qs
+from urllib.parse import urlparse
+
+from cloudbridge.cloud.base.resources import ServerPagedResultList
+from django.contrib.auth.models import User
+from django.core import signing
+from django.test import TestCase
+from django.test import override_settings
+from django.urls import NoReverseMatch
+from rest_framework import serializers as rest_serializers
+from rest_framework.request import Request
+from rest_framework.reverse import reverse
+from rest_framework.test import APIRequestFactory
+from rest_framework.test import force_authenticate
+
+from djcloudbridge import drf_helpers
+from djcloudbridge import models
+from djcloudbridge import serializers
+from djcloudbridge import util
+
+
+class FakeObject(object):
+
+    def __init__(self, id):
+        self.id = id
+        self.name = 'object-%s' % id
+
+
+class FakeService(object):
+    """
+    Mimics a cloudbridge service supporting server side paging.
+    """
+
+    def __init__(self, count):
+        self.objects = [FakeObject(str(i)) for i in range(count)]
+        self.calls = []
+
+    def list(self, limit=None, marker=None):
+        self.calls.append((limit, marker))
+        start = int(marker) + 1 if marker else 0
+        limit = limit or len(self.objects)
+        page = self.objects[start:start + limit]
+        is_truncated = start + limit < len(self.objects)
+        return ServerPagedResultList(
+            is_truncated, page[-1].id if is_truncated else None, False,
+            data=page)
+
+
+class FakeViewSet(drf_helpers.CustomReadOnlyModelViewSet):
+    serializer_class = serializers.ZoneSerializer
+    service = None
+    objects = None
+
+    def list_objects(self):
+        if self.objects is not None:
+            return self.objects
+        return self.list_provider_objects(self.service)
+
+
+class ProviderCursorPaginationTestCase(TestCase):
+
+    def list(self, url, **initkwargs):
+        view = FakeViewSet.as_view({'get': 'list'}, **initkwargs)
+        return view(APIRequestFactory().get(url)).data
+
+    def test_marker_passed_through_to_provider(self):
+        service = FakeService(5)
+        data = self.list('/objects/?page_size=2', service=service)
+        self.assertEqual([o['id'] for o in data['results']], ['0', '1'])
+        self.assertIsNone(data['count'])
+        data = self.list(data['next'], service=service)
+        self.assertEqual([o['id'] for o in data['results']], ['2', '3'])
+        data = self.list(data['next'], service=service)
+        self.assertEqual([o['id'] for o in data['results']], ['4'])
+        self.assertIsNone(data['next'])
+        self.assertEqual(service.calls, [(2, None), (2, '1'), (2, '3')])
+
+    def test_in_memory_paging(self):
+        objects = [FakeObject(str(i)) for i in range(3)]
+        data = self.list('/objects/?page_size=2', objects=objects)
+        self.assertEqual(data['count'], 3)
+        self.assertEqual([o['id'] for o in data['results']], ['0', '1'])
+        data = self.list(data['next'], objects=objects)
+        self.assertEqual([o['id'] for o in data['results']], ['2'])
+        self.assertIsNone(data['next'])
+
+    def test_invalid_cursor(self):
+        view = FakeViewSet.as_view({'get': 'list'}, service=FakeService(1))
+        response = view(APIRequestFactory().get('/objects/?cursor=abc'))
+        self.assertEqual(response.status_code, 404)
+
+    def test_forged_cursor_rejected(self):
+        data = self.list('/objects/?page_size=1', service=FakeService(3))
+        cursor = parse_qs(urlparse(data['next']).query)['cursor'][0]
+        paginator = drf_helpers.ProviderCursorPagination()
+        self.assertEqual(paginator.decode_cursor(
+            Request(APIRequestFactory().get('/', {'cursor': cursor}))),
+            {'marker': '0'})
+        forged = signing.dumps({'marker': '1'}, salt='other')
+        view = FakeViewSet.as_view({'get': 'list'}, service=FakeService(3))
+        response = view(APIRequestFactory().get('/objects/',
+                                                {'cursor': forged}))
+        self.assertEqual(response.status_code, 404)
+
+
+class StreamingListTestCase(TestCase):
+
+    def stream(self, url, **initkwargs):
+        view = FakeViewSet.as_view({'get': 'list'}, **initkwargs)
+        return view(APIRequestFactory().get(url))
+
+    def test_ndjson_streams_all_pages(self):
+        service = FakeService(5)
+        response = self.stream('/objects/?stream=ndjson&page_size=2',
+                               service=service)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        # Only the first page is fetched before the response is consumed
+        self.assertEqual(len(service.calls), 1)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line)['id'] for line in lines],
+                         ['0', '1', '2', '3', '4'])
+        self.assertEqual(len(service.calls), 3)
+
+    def test_json_array(self):
+        response = self.stream('/objects/?stream=json',
+                               objects=[FakeObject('a'), FakeObject('b')])
+        self.assertEqual(
+            json.loads(b''.join(response.streaming_content).decode()),
+            [{'id': 'a', 'name': 'object-a'}, {'id': 'b', 'name': 'object-b'}])
+
+    def test_serializer_shared_by_rows(self):
+        calls = []
+        get_serializer = FakeViewSet.get_serializer
+
+        def counting_get_serializer(view, *args, **kwargs):
+            calls.append(args)
+            return get_serializer(view, *args, **kwargs)
+
+        with mock.patch.object(FakeViewSet, 'get_serializer',
+                               counting_get_serializer):
+            response = self.stream('/objects/?stream=ndjson',
+                                   service=FakeService(3))
+            lines = b''.join(response.streaming_content).splitlines()
+        self.assertEqual(len(lines), 3)
+        self.assertEqual(len(calls), 1)
+
+    def test_empty_json_array(self):
+        response = self.stream('/objects/?stream=json', objects=[])
+        self.assertEqual(b''.join(response.streaming_content), b'[]')
+
+    def test_unsupported_format(self):
+        response = self.stream('/objects/?stream=xml', objects=[])
+        self.assertEqual(response.status_code, 406)
+
+
+@override_settings(DJCLOUDBRIDGE_LIST_CACHE_TTLS={'objects': (10, 60)})
+class CachedListTestCase(TestCase):
+
+    def setUp(self):
+        models.AWS.objects.create(name='Amazon', slug='amazon',
+                                  region_name='us-east-1')
+        util.get_cache().clear()
+        self.service = FakeService(3)
+
+    def list(self):
+        view = FakeViewSet.as_view({'get': 'list'}, service=self.service,
+                                   list_cache_name='objects')
+        return view(APIRequestFactory().get('/objects/'), cloud_pk='amazon')
+
+    def test_list_served_from_cache(self):
+        response = self.list()
+        self.assertEqual(response['Age'], '0')
+        self.assertEqual(self.list().data, response.data)
+        self.assertEqual(len(self.service.calls), 1)
+
+    def test_stale_list_refreshed_on_new_view_and_request(self):
+        views = []
+        listings = []
+
+        class RecordingViewSet(FakeViewSet):
+
+            def initial(self, request, *args, **kwargs):
+                views.append(self)
+                super(RecordingViewSet, self).initial(
+                    request, *args, **kwargs)
+
+            def list_objects(self):
+                listings.append((self, self.request))
+                return super(RecordingViewSet, self).list_objects()
+
+        user = User.objects.create(username='alice')
+        view = RecordingViewSet.as_view(
+            {'get': 'list'}, service=self.service, list_cache_name='objects')
+        for now in (1000, 1020):
+            executor = ThreadPoolExecutor(max_workers=1)
+            request = APIRequestFactory().get('/objects/?page_size=2')
+            force_authenticate(request, user=user)
+            with mock.patch('djcloudbridge.provider_cache.refresh_executor',
+                            executor), \
+                    mock.patch('djcloudbridge.provider_cache.time') as time:
+                time.time.return_value = now
+                view(request, cloud_pk='amazon')
+                executor.shutdown(wait=True)
+        self.assertEqual(len(listings), 2)
+        refresh_view, refresh_request = listings[1]
+        self.assertNotIn(refresh_view, views)
+        self.assertIsNot(refresh_request, views[1].request)
+        self.assertEqual(refresh_request.user, user)
+        self.assertEqual(refresh_request.query_params['page_size'], '2')
+        self.assertEqual(self.service.calls, [(2, None), (2, None)])
+
+
+class CatalogViewSet(FakeViewSet):
+
+    def list_objects(self):
+        return self.list_catalog_objects('vm_types', lambda: self.service)
+
+
+class CatalogListTestCase(TestCase):
+
+    def setUp(self):
+        models.AWS.objects.create(name='Amazon', slug='amazon',
+                                  region_name='us-east-1')
+        util.get_cache().clear()
+        self.service = FakeService(3)
+
+    def list(self):
+        view = CatalogViewSet.as_view({'get': 'list'}, service=self.service)
+        return view(APIRequestFactory().get('/objects/?page_size=2'),
+                    cloud_pk='amazon').data
+
+    def test_paged_by_provider_when_not_cached(self):
+        self.assertEqual([o['id'] for o in self.list()['results']],
+                         ['0', '1'])
+        self.assertEqual(self.service.calls, [(2, None)])
+
+    @override_settings(DJCLOUDBRIDGE_CATALOG_CACHE_TTLS={'vm_types': 60})
+    def test_fetched_in_full_when_cached(self):
+        self.assertEqual(self.list()['count'], 3)
+        self.assertEqual(self.list()['count'], 3)
+        self.assertEqual(self.service.calls, [(None, None)])
+
+
+class ConditionalGetTestCase(TestCase):
+
+    def list(self, **headers):
+        view = FakeViewSet.as_view({'get': 'list'},
+                                   objects=[FakeObject('a')])
+        return view(APIRequestFactory().get('/objects/?format=json',
+                                            **headers))
+
+    def test_etag(self):
+        etag = self.list()['ETag']
+        self.assertEqual(etag, self.list()['ETag'])
+        response = self.list(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(response.rendered_content, b'')
+        self.assertEqual(
+            self.list(HTTP_IF_NONE_MATCH='W/' + etag).status_code, 304)
+
+    def test_etag_of_paged_listing_stable_over_time(self):
+        view = FakeViewSet.as_view({'get': 'list'}, service=FakeService(3))
+        url = '/objects/?format=json&page_size=2'
+        response = view(APIRequestFactory().get(url))
+        self.assertIsNotNone(response.data['next'])
+        # Timestamped signatures would change the next link every second
+        with mock.patch('django.core.signing.time.time',
+                        return_value=time.time() + 5):
+            response = view(APIRequestFactory().get(
+                url, HTTP_IF_NONE_MATCH=response['ETag']))
+        self.assertEqual(response.status_code, 304)
+
+    def test_etag_mismatch(self):
+        response = self.list(HTTP_IF_NONE_MATCH='"other"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'], [
+            {'id': 'a', 'name': 'object-a'}])
+
+
+class SparseFieldsetTestCase(TestCase):
+
+    def list(self, url):
+        view = FakeViewSet.as_view({'get': 'list'},
+                                   objects=[FakeObject('a')])
+        return view(APIRequestFactory().get(url)).data['results']
+
+    def test_fields(self):
+        self.assertEqual(self.list('/objects/?fields=id, unknown'),
+                         [{'id': 'a'}])
+
+    def test_omit(self):
+        self.assertEqual(self.list('/objects/?omit=id'),
+                         [{'name': 'object-a'}])
+
+    def test_nested_serializers_unaffected(self):
+        class ParentSerializer(drf_helpers.SparseFieldsetMixin,
+                               rest_serializers.Serializer):
+            id = rest_serializers.CharField()
+            zone = serializers.ZoneSerializer(source='*')
+
+        request = Request(APIRequestFactory().get('/?fields=zone'))
+        self.assertEqual(
+            ParentSerializer(FakeObject('a'),
+                             context={'request': request}).data,
+            {'zone': {'id': 'a', 'name': 'object-a'}})
+
+    def test_method_field_serializers_unaffected(self):
+        class ParentSerializer(drf_helpers.SparseFieldsetMixin,
+                               rest_serializers.Serializer):
+            id = rest_serializers.CharField()
+            zones = rest_serializers.SerializerMethodField()
+
+            def get_zones(self, obj):
+                return serializers.ZoneSerializer(
+                    [obj], many=True, context=self.get_nested_context()).data
+
+        request = Request(APIRequestFactory().get('/?fields=zones'))
+        self.assertEqual(
+            ParentSerializer(FakeObject('a'),
+                             context={'request': request}).data,
+            {'zones': [{'id': 'a', 'name': 'object-a'}]})
+
+    def test_writes_unaffected(self):
+        request = Request(APIRequestFactory().post('/objects/?fields=id'))
+        serializer = serializers.ZoneSerializer(context={'request': request})
+        self.assertEqual(list(serializer.fields), ['id', 'name'])
+
+
+class DummyView(object):
+
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+
+
+class URLTemplateTestCase(TestCase):
+
+    ids = ['ami-123', 'a_b~c', 'a b', 'ünïcode', '%41', 'a:b@c', '']
+
+    def get_urls(self, ids):
+        request = Request(APIRequestFactory().get(
+            '/', HTTP_HOST='testserver:8000'))
+        context = {'request': request, 'view': DummyView(cloud_pk='amazon')}
+        serializer = serializers.RegionSerializer(
+            [FakeObject(id) for id in ids], many=True, context=context)
+        return [region['url'] for region in serializer.data]
+
+    def test_urls_identical_to_reverse(self):
+        request = Request(APIRequestFactory().get(
+            '/', HTTP_HOST='testserver:8000'))
+        expected = []
+        for id in self.ids:
+            try:
+                expected.append(reverse(
+                    'djcloudbridge:region-detail',
+                    kwargs={'cloud_pk': 'amazon', 'pk': id}, request=request))
+            except NoReverseMatch:
+                expected.append('')
+        self.assertEqual(self.get_urls(self.ids), expected)
+
+    def test_reverse_called_once_per_field(self):
+        with mock.patch('rest_framework.relations.reverse',
+                        wraps=reverse) as mock_reverse:
+            urls = self.get_urls(['a', 'b', 'c'])
+        # Once each for the url and zones fields
+        self.assertEqual(mock_reverse.call_count, 2)
+        self.assertTrue(urls[2].endswith('/clouds/amazon/compute/'
+                                         'regions/c/'))
+
+    def test_falls_back_to_reverse_without_template(self):
+        placeholder = drf_helpers.CustomHyperlinkedRelatedField.\
+            template_placeholder
+
+        def reverse_without_template(view_name, kwargs=None, **extra):
+            if placeholder in kwargs.values():
+                raise NoReverseMatch()
+            return reverse(view_name, kwargs=kwargs, **extra)
+
+        expected = self.get_urls(self.ids)
+        with mock.patch('rest_framework.relations.reverse',
+                        side_effect=reverse_without_template) as mock_reverse:
+            self.assertEqual(self.get_urls(self.ids), expected)
+        # The template and every URL for both fields are reversed
+        self.assertEqual(mock_reverse.call_count, 2 * (len(self.ids) + 1))
+
+    def test_unmatched_view_as_reverse(self):
+        request = Request(APIRequestFactory().get('/'))
+        # Without the parent cloud, neither the template nor the URL reverse
+        field = serializers.RegionSerializer(
+            context={'request': request, 'view': DummyView()}).fields['url']
+        with self.assertRaises(NoReverseMatch):
+            field.get_url(FakeObject('a'), field.view_name, request, None)
+        # Empty lookup values are taken to be null values
+        self.assertEqual(field.get_url(FakeObject(''), field.view_name,
+                                       request, None), '')
+        self.assertEqual(field._url_templates, {
+            ('djcloudbridge:region-detail', None, ()): None})
+
+
+class BenchmarkSerializer(rest_serializers.Serializer):
+    region = drf_helpers.CustomHyperlinkedIdentityField(
+        view_name='djcloudbridge:region-detail', lookup_field='id',
+        lookup_url_kwarg='pk', parent_url_kwargs=['cloud_pk'])
+    keypair = drf_helpers.CustomHyperlinkedIdentityField(
+        view_name='djcloudbridge:keypair-detail', lookup_field='id',
+        lookup_url_kwarg='pk', parent_url_kwargs=['cloud_pk'])
+    volume = drf_helpers.CustomHyperlinkedIdentityField(
+        view_name='djcloudbridge:volume-detail', lookup_field='id',
+        lookup_url_kwarg='pk', parent_url_kwargs=['cloud_pk'])
+    snapshot = drf_helpers.CustomHyperlinkedIdentityField(
+        view_name='djcloudbridge:snapshot-detail', lookup_field='id',
+        lookup_url_kwarg='pk', parent_url_kwargs=['cloud_pk'])
+
+
+@unittest.skipUnless(os.environ.get('DJCLOUDBRIDGE_BENCHMARK'),
+                     "Set DJCLOUDBRIDGE_BENCHMARK=1 to run benchmarks")
+class URLTemplateBenchmarkTestCase(TestCase):
+    """
+    Times the serialization of 1,000 objects with four hyperlink fields,
+    with precompiled URL templates and with a reverse() call per URL.
+    """
+
+    def serialize(self, objects):
+        request = Request(APIRequestFactory().get(
+            '/', HTTP_HOST='testserver:8000'))
+        context = {'request': request, 'view': DummyView(cloud_pk='amazon')}
+        return BenchmarkSerializer(objects, many=True, context=context).data
+
+    def time(self, objects, runs=5):
+        timings = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            data = self.serialize(objects)
+            timings.append(time.perf_counter() - start)
+        return min(timings), data
+
+    def test_url_templates(self):
+        objects = [FakeObject('obj-%s' % i) for i in range(1000)]
+        templated, templated_data = self.time(objects)
+        # A lookup pattern that never matches forces a reverse() per URL
+        with mock.patch.object(drf_helpers.CustomHyperlinkedRelatedField,
+                               'template_safe_lookup_value',
+                               re.compile(r'(?!)')):
+            reversed_, reversed_data = self.time(objects)
+        self.assertEqual(templated_data, reversed_data)
+        print("\n1,000 objects x 4 hyperlink fields, best of 5 runs:\n"
+              "  reverse() per URL: %.1f ms\n"
+              "  URL templates:     %.1f ms" % (reversed_ * 1000,
+                                                templated * 1000))
+
+
+class FindableService(FakeService):
+
+    def __init__(self, count, supported=('name',)):
+        super(FindableService, self).__init__(count)
+        self.supported = supported
+        self.finds = []
+
+    def find(self, **kwargs):
+        if set(kwargs) - set(self.supported):
+            raise TypeError("Unrecognised parameters for search")
+        self.finds.append(kwargs)
+        return [obj for obj in self.objects
+                if all(getattr(obj, k) == v for k, v in kwargs.items())]
+
+
+class ProviderFilterTestCase(TestCase):
+
+    def list(self, url, **initkwargs):
+        initkwargs.setdefault('provider_filter_fields', ('name', 'state'))
+        view = FakeViewSet.as_view({'get': 'list'}, **initkwargs)
+        return [obj['id'] for obj in
+                view(APIRequestFactory().get(url)).data['results']]
+
+    def test_find_pushdown(self):
+        service = FindableService(5)
+        self.assertEqual(self.list('/objects/?name=object-3',
+                                   service=service), ['3'])
+        self.assertEqual(service.finds, [{'name': 'object-3'}])
+        self.assertEqual(service.calls, [])
+
+    def test_unsupported_find_filtered_in_memory(self):
+        service = FindableService(5, supported=())
+        self.assertEqual(self.list('/objects/?name=object-3&page_size=1',
+                                   service=service), ['3'])
+        self.assertEqual(service.calls, [(None, None)])
+
+    def test_state_filter(self):
+        objects = [FakeObject(str(i)) for i in range(4)]
+        objects[1].state = objects[2].state = 'running'
+        self.assertEqual(self.list('/objects/?state=running',
+                                   objects=objects), ['1', '2'])
+        objects[3].state = 'stopped'
+        self.assertEqual(
+            self.list('/objects/?state=running&state=stopped',
+                      objects=objects), ['1', '2', '3'])
+
+    def test_filter_on_missing_value(self):
+        objects = [FakeObject(str(i)) for i in range(3)]
+        objects[1].state = None
+        objects[2].state = 'running'
+        self.assertEqual(self.list('/objects/?state=None', objects=objects),
+                         [])
+        self.assertEqual(self.list('/objects/?state=', objects=objects), [])
+
+    def test_search(self):
+        objects = [FakeObject('abc'), FakeObject('xyz')]
+        self.assertEqual(self.list('/objects/?search=Y', objects=objects),
+                         ['xyz'])
+
+
+class BatchViewSet(FakeViewSet):
+
+    def retrieve_object(self):
+        pk = self.kwargs['pk']
+        if pk == 'error':
+            raise Exception("Provider error")
+        return next((obj for obj in self.objects if obj.id == pk), None)
+
+
+class BatchRetrieveTestCase(TestCase):
+
+    def setUp(self):
+        models.AWS.objects.create(name='Amazon', slug='amazon',
+                                  region_name='us-east-1')
+        self.objects = [FakeObject(str(i)) for i in range(5)]
+
+    @mock.patch('djcloudbridge.domain_model.get_cloud_provider')
+    def get(self, url, mock_get_provider):
+        view = BatchViewSet.as_view({'get': 'list'}, objects=self.objects)
+        response = view(APIRequestFactory().get(url), cloud_pk='amazon')
+        self.assertLessEqual(mock_get_provider.call_count, 1)
+        return response
+
+    def test_found_and_missing(self):
+        data = self.get('/objects/?ids=3,x,1,3,error&fields=id').data
+        self.assertEqual(data['results'], [{'id': '3'}, {'id': '1'}])
+        self.assertEqual(data['missing'], ['x'])
+        self.assertEqual(data['errors'], [{'id': 'error',
+                                           'error': 'Provider error'}])
+
+    def test_too_many_ids(self):
+        response = self.get('/objects/?ids=' + ','.join(
+            str(i) for i in range(101)))
+        self.assertEqual(response.status_code, 400)
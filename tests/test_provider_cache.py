@@ -0,0 +1,208 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_provider_cache
+------------
+
+Tests for `djcloudbridge` provider_cache module.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.management import call_command
+from django.test import RequestFactory
+from django.test import TestCase
+from django.test import override_settings
+
+from djcloudbridge import models
+from djcloudbridge import provider_cache
+from djcloudbridge import util
+
+
+class FakeVMType(object):
+
+    def __init__(self, id):
+        self.id = id
+        self.name = 'type-%s' % id
+        self.vcpus = 2
+        self.extra_data = {'a': 'b'}
+
+
+class DummyView(object):
+
+    def __init__(self, request, **kwargs):
+        self.request = request
+        self.kwargs = kwargs
+
+
+@override_settings(
+    DJCLOUDBRIDGE_CATALOG_CACHE_TTLS={'vm_types': 3600, 'zones': 3600})
+class CatalogCacheTestCase(TestCase):
+
+    def setUp(self):
+        models.AWS.objects.create(name='Amazon', slug='amazon',
+                                  region_name='us-east-1')
+        models.AWS.objects.create(name='Other', slug='other',
+                                  region_name='us-east-1')
+        util.get_cache().clear()
+        self.loads = 0
+
+    def get_view(self, cloud_pk='amazon', **headers):
+        request = RequestFactory().get('/', **headers)
+        request.user = AnonymousUser()
+        return DummyView(request, cloud_pk=cloud_pk)
+
+    def loader(self):
+        self.loads += 1
+        return [FakeVMType('1'), FakeVMType('2')]
+
+    def get_catalog(self, view=None):
+        return provider_cache.get_catalog(
+            view or self.get_view(), 'vm_types', self.loader)
+
+    def test_read_through(self):
+        first = self.get_catalog()
+        second = self.get_catalog()
+        self.assertEqual(self.loads, 1)
+        self.assertEqual([t.id for t in second], ['1', '2'])
+        self.assertEqual(second[0].name, 'type-1')
+        self.assertEqual(second[0].extra_data, {'a': 'b'})
+        self.assertIsNone(second[0].ram)
+        self.assertEqual(str(first[0]), 'type-1')
+        self.assertEqual(provider_cache.get_catalog_stats()['vm_types'],
+                         {'hits': 1, 'misses': 1})
+
+    def test_scoped_by_cloud_and_credentials(self):
+        self.get_catalog()
+        self.get_catalog(self.get_view(cloud_pk='other'))
+        self.get_catalog(self.get_view(HTTP_CL_AWS_ACCESS_KEY='key',
+                                       HTTP_CL_AWS_SECRET_KEY='secret'))
+        self.assertEqual(self.loads, 3)
+
+    def test_scoped_by_variant(self):
+        view = self.get_view()
+        provider_cache.get_catalog(view, 'zones', self.loader, 'region-1')
+        provider_cache.get_catalog(view, 'zones', self.loader, 'region-2')
+        self.assertEqual(self.loads, 2)
+
+    def test_purge_cloud(self):
+        self.get_catalog()
+        self.get_catalog(self.get_view(cloud_pk='other'))
+        provider_cache.purge_catalogs('amazon')
+        self.get_catalog()
+        self.get_catalog(self.get_view(cloud_pk='other'))
+        self.assertEqual(self.loads, 3)
+
+    def test_purge_all(self):
+        self.get_catalog()
+        provider_cache.purge_catalogs()
+        self.get_catalog()
+        self.assertEqual(self.loads, 2)
+
+    def test_purged_when_cloud_saved(self):
+        self.get_catalog()
+        models.AWS.objects.get(slug='amazon').save()
+        self.get_catalog()
+        self.assertEqual(self.loads, 2)
+
+    def test_ttl_settings(self):
+        self.assertEqual(provider_cache.get_catalog_ttl('vm_types'), 3600)
+        self.assertIsNone(provider_cache.get_catalog_ttl('images'))
+
+    @override_settings()
+    def test_disabled_by_default(self):
+        del settings.DJCLOUDBRIDGE_CATALOG_CACHE_TTLS
+        for resource_type in ('regions', 'zones', 'vm_types', 'images'):
+            self.assertFalse(provider_cache.get_catalog_ttl(resource_type))
+
+    def test_management_command(self):
+        self.get_catalog()
+        out = StringIO()
+        err = StringIO()
+        call_command('purge_catalog_cache', stdout=out, stderr=err)
+        self.assertIn('vm_types: 0 hits, 1 misses', out.getvalue())
+        # The test cache is a process-local LocMemCache
+        self.assertIn('local to this process', err.getvalue())
+        self.get_catalog()
+        self.assertEqual(self.loads, 2)
+
+
+@override_settings(DJCLOUDBRIDGE_LIST_CACHE_TTLS={'instances': (10, 60)})
+class StaleWhileRevalidateTestCase(TestCase):
+
+    def setUp(self):
+        models.AWS.objects.create(name='Amazon', slug='amazon',
+                                  region_name='us-east-1')
+        util.get_cache().clear()
+        self.computed = 0
+        self.refreshers = 0
+        self.view = self.get_view('/instances/')
+
+    def get_view(self, url):
+        request = RequestFactory().get(url)
+        request.user = AnonymousUser()
+        return DummyView(request, cloud_pk='amazon')
+
+    def compute(self):
+        self.computed += 1
+        return ['payload-%s' % self.computed]
+
+    def get_refresher(self):
+        self.refreshers += 1
+        return self.compute
+
+    def get_payload(self, view=None, now=1000):
+        with mock.patch('djcloudbridge.provider_cache.time') as mock_time:
+            mock_time.time.return_value = now
+            return provider_cache.get_list_payload(
+                view or self.view, 'instances', self.compute,
+                self.get_refresher)[:2]
+
+    def test_fresh(self):
+        self.assertEqual(self.get_payload(), (['payload-1'], 0))
+        self.assertEqual(self.get_payload(now=1005), (['payload-1'], 5))
+        self.assertEqual(self.computed, 1)
+
+    def test_digest_stored(self):
+        provider_cache.get_list_payload(self.view, 'instances', self.compute,
+                                        self.get_refresher)
+        payload, age, digest = provider_cache.get_list_payload(
+            self.view, 'instances', self.compute, self.get_refresher)
+        self.assertEqual(digest, provider_cache.get_payload_digest(payload))
+
+    def test_keyed_by_uri(self):
+        self.get_payload()
+        self.get_payload(self.get_view('/instances/?cursor=abc'))
+        self.assertEqual(self.computed, 2)
+
+    def test_stale_refreshed_in_background(self):
+        self.get_payload()
+        executor = ThreadPoolExecutor(max_workers=1)
+        with mock.patch('djcloudbridge.provider_cache.refresh_executor',
+                        executor), \
+                mock.patch('djcloudbridge.provider_cache.time') as mock_time:
+            mock_time.time.return_value = 1020
+            # Served stale, with only a single refresh scheduled
+            self.assertEqual(provider_cache.get_list_payload(
+                self.view, 'instances', self.compute,
+                self.get_refresher)[:2], (['payload-1'], 20))
+            provider_cache.get_list_payload(
+                self.view, 'instances', self.compute, self.get_refresher)
+            executor.shutdown(wait=True)
+        self.assertEqual(self.computed, 2)
+        self.assertEqual(self.refreshers, 1)
+        self.assertEqual(self.get_payload(now=1025), (['payload-2'], 5))
+
+    def test_expired(self):
+        self.get_payload()
+        self.assertEqual(self.get_payload(now=1061), (['payload-2'], 0))
+
+    def test_purge(self):
+        self.get_payload()
+        provider_cache.purge_list_payloads('amazon', 'instances')
+        self.get_payload()
+        self.assertEqual(self.computed, 2)
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_serializers
+------------
+
+Tests for `djcloudbridge` serializers module.
+"""
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+from fernet_fields import EncryptedField
+from rest_framework.test import APIRequestFactory
+
+from djcloudbridge import models
+from djcloudbridge import serializers
+
+
+class UserSerializerTestCase(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(username='alice')
+        self.profile = models.UserProfile.objects.create(user=self.user)
+        self.context = {'request': APIRequestFactory().get('/')}
+
+    def add_credentials(self, start, count):
+        for i in range(start, start + count):
+            aws = models.AWS.objects.create(
+                name='aws%s' % i, slug='aws%s' % i, region_name='us-east-1')
+            openstack = models.OpenStack.objects.create(
+                name='os%s' % i, slug='os%s' % i, auth_url='http://keystone',
+                region_name='RegionOne')
+            models.AWSCredentials.objects.create(
+                name='aws%s' % i, cloud=aws, user_profile=self.profile,
+                access_key='key', secret_key='secret')
+            models.OpenStackCredentials.objects.create(
+                name='os%s' % i, cloud=openstack, user_profile=self.profile,
+                username='alice', password='secret', project_name='alice')
+
+    def test_query_count_is_constant(self):
+        self.add_credentials(0, 1)
+        user = User.objects.get(pk=self.user.pk)
+        # One query each for the profile, the credentials and their clouds
+        with self.assertNumQueries(3):
+            data = serializers.UserSerializer(
+                user, context=self.context).data
+        self.assertEqual(len(data['aws_creds']), 1)
+        self.add_credentials(1, 5)
+        user = User.objects.get(pk=self.user.pk)
+        with self.assertNumQueries(3):
+            data = serializers.UserSerializer(
+                user, context=self.context).data
+        self.assertEqual(len(data['aws_creds']), 6)
+        self.assertEqual(len(data['openstack_creds']), 6)
+        self.assertEqual(data['gce_creds'], [])
+        self.assertEqual(data['openstack_creds'][0]['cloud']['extra_data'],
+                         {'auth_url': 'http://keystone',
+                          'region_name': 'RegionOne',
+                          'identity_api_version': None})
+        self.assertNotIn('password', data['openstack_creds'][0])
+
+    @mock.patch.object(EncryptedField, 'from_db_value', autospec=True)
+    def test_secrets_not_decrypted(self, mock_from_db_value):
+        self.add_credentials(0, 2)
+        user = User.objects.get(pk=self.user.pk)
+        data = serializers.UserSerializer(user, context=self.context).data
+        self.assertEqual(len(data['aws_creds']), 2)
+        self.assertNotIn('secret_key', data['aws_creds'][0])
+        mock_from_db_value.assert_not_called()
+
+    def test_sparse_fieldset_not_applied_to_credentials(self):
+        self.add_credentials(0, 1)
+        context = {'request': APIRequestFactory().get(
+            '/', {'fields': 'username,aws_creds'})}
+        data = serializers.UserSerializer(self.user, context=context).data
+        self.assertEqual(list(data), ['username', 'aws_creds'])
+        self.assertEqual(data['aws_creds'][0]['name'], 'aws0')
+        self.assertIn('cloud', data['aws_creds'][0])
+
+    def test_no_profile(self):
+        user = User.objects.create(username='bob')
+        data = serializers.UserSerializer(user, context=self.context).data
+        self.assertEqual(data['aws_creds'], "")
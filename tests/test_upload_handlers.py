@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_upload_handlers
+------------
+
+Tests for `djcloudbridge` upload_handlers module.
+"""
+import io
+from unittest import mock
+
+from django.core.files.uploadedfile import InMemoryUploadedFile
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.test import TestCase
+from django.test import override_settings
+
+from djcloudbridge import upload_handlers
+
+
+class FakeS3Client(object):
+
+    def __init__(self, failures=0, complete_error=None):
+        self.failures = failures
+        self.complete_error = complete_error
+        self.parts = {}
+        self.completed = None
+        self.aborted = False
+
+    def create_multipart_upload(self, Bucket, Key):
+        return {'UploadId': 'upload-1'}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        if PartNumber == 2 and self.failures:
+            self.failures -= 1
+            raise IOError("Connection reset")
+        self.parts[PartNumber] = Body
+        return {'ETag': 'etag-%s' % PartNumber}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId,
+                                  MultipartUpload):
+        if self.complete_error:
+            raise self.complete_error
+        self.completed = MultipartUpload['Parts']
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.aborted = True
+
+
+@override_settings(DJCLOUDBRIDGE_MULTIPART_THRESHOLD=10,
+                   DJCLOUDBRIDGE_MULTIPART_RETRIES=2,
+                   DJCLOUDBRIDGE_MULTIPART_RETRY_BACKOFF=0)
+@mock.patch('djcloudbridge.upload_handlers.get_multipart_part_size',
+            return_value=4)
+class MultipartUploadTestCase(TestCase):
+
+    def get_object(self, client):
+        obj = mock.Mock()
+        obj._provider.PROVIDER_ID = 'aws'
+        obj._obj.meta.client = client
+        obj._obj.bucket_name = 'bucket-1'
+        obj._obj.key = 'hello.txt'
+        return obj
+
+    def get_content(self, data):
+        content = TemporaryUploadedFile('hello.txt', 'text/plain',
+                                        len(data), None)
+        content.write(data)
+        content.flush()
+        self.addCleanup(content.close)
+        return content
+
+    def test_uploaded_in_parts(self, _):
+        client = FakeS3Client(failures=2)
+        obj = self.get_object(client)
+        with self.assertLogs('djcloudbridge.upload_handlers', 'WARNING'):
+            upload_handlers.upload_content(
+                obj, self.get_content(b'hello world'))
+        self.assertEqual(client.parts,
+                         {1: b'hell', 2: b'o wo', 3: b'rld'})
+        self.assertEqual([part['PartNumber'] for part in client.completed],
+                         [1, 2, 3])
+        self.assertEqual(client.completed[1]['ETag'], 'etag-2')
+        obj.upload_from_file.assert_not_called()
+
+    @override_settings(DJCLOUDBRIDGE_MULTIPART_RETRY_BACKOFF=1)
+    @mock.patch('djcloudbridge.upload_handlers.random.uniform',
+                return_value=1)
+    @mock.patch('djcloudbridge.upload_handlers.time.sleep')
+    def test_retries_back_off(self, mock_sleep, *_):
+        client = FakeS3Client(failures=2)
+        with self.assertLogs('djcloudbridge.upload_handlers', 'WARNING'):
+            upload_handlers.upload_content(
+                self.get_object(client), self.get_content(b'hello world'))
+        self.assertEqual(mock_sleep.call_args_list,
+                         [mock.call(1), mock.call(2)])
+
+    def test_aborted_when_retries_exhausted(self, _):
+        client = FakeS3Client(failures=3)
+        with self.assertRaises(IOError), \
+                self.assertLogs('djcloudbridge.upload_handlers', 'WARNING'):
+            upload_handlers.upload_content(
+                self.get_object(client), self.get_content(b'hello world'))
+        self.assertTrue(client.aborted)
+        self.assertIsNone(client.completed)
+
+    def test_aborted_when_completion_fails(self, _):
+        client = FakeS3Client(complete_error=IOError("Internal error"))
+        with self.assertRaises(IOError):
+            upload_handlers.upload_content(
+                self.get_object(client), self.get_content(b'hello world'))
+        self.assertEqual(len(client.parts), 3)
+        self.assertTrue(client.aborted)
+
+    def test_small_upload_is_serial(self, _):
+        client = FakeS3Client()
+        obj = self.get_object(client)
+        content = self.get_content(b'hello')
+        upload_handlers.upload_content(obj, content)
+        obj.upload_from_file.assert_called_once_with(
+            content.temporary_file_path())
+        self.assertEqual(client.parts, {})
+
+    def test_unsupported_provider_is_serial(self, _):
+        obj = mock.Mock(spec=['_provider', 'upload', 'upload_from_file'])
+        obj._provider.PROVIDER_ID = 'openstack'
+        content = self.get_content(b'hello world')
+        upload_handlers.upload_content(obj, content)
+        obj.upload_from_file.assert_called_once_with(
+            content.temporary_file_path())
+
+    def test_in_memory_upload(self, _):
+        obj = mock.Mock()
+        content = InMemoryUploadedFile(io.BytesIO(b'hello'), 'upload_content',
+                                       'hello.txt', 'text/plain', 5, None)
+        content.read()
+        upload_handlers.upload_content(obj, content)
+        # Passed as bytes, since some providers, such as Azure, cannot
+        # upload file objects
+        obj.upload.assert_called_once_with(b'hello')
+
+
+class MultipartPartSizeTestCase(TestCase):
+
+    @override_settings(DJCLOUDBRIDGE_MULTIPART_PART_SIZE=1024)
+    def test_raised_to_minimum(self):
+        self.assertEqual(upload_handlers.get_multipart_part_size(1024),
+                         upload_handlers.MIN_PART_SIZE)
+
+    def test_raised_to_stay_within_max_parts(self):
+        size = 100 * 1024 * 1024 * 1024 + 1
+        part_size = upload_handlers.get_multipart_part_size(size)
+        self.assertEqual(part_size, 10737419)
+        self.assertLessEqual(-(-size // part_size), upload_handlers.MAX_PARTS)
+        self.assertGreater(-(-size // (part_size - 1)),
+                           upload_handlers.MAX_PARTS)
+
+
+class RetryDelayTestCase(TestCase):
+
+    @override_settings(DJCLOUDBRIDGE_MULTIPART_RETRY_BACKOFF=2)
+    def test_exponential_with_jitter(self):
+        for attempt, (low, high) in enumerate([(1, 2), (2, 4), (4, 8)]):
+            delay = upload_handlers.get_retry_delay(attempt)
+            self.assertTrue(low <= delay <= high, delay)
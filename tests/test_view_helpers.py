@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_view_helpers
+------------
+
+Tests for `djcloudbridge` view_helpers module.
+"""
+from unittest import mock
+
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.auth.models import User
+from django.test import RequestFactory
+from django.test import TestCase
+
+from djcloudbridge import models
+from djcloudbridge import view_helpers
+
+
+class DummyView(object):
+
+    def __init__(self, request, **kwargs):
+        self.request = request
+        self.kwargs = kwargs
+
+
+class GetCloudProviderTestCase(TestCase):
+
+    def setUp(self):
+        models.AWS.objects.create(name='Amazon', slug='amazon',
+                                  region_name='us-east-1')
+        self.request = RequestFactory().get('/')
+        self.request.user = AnonymousUser()
+
+    @mock.patch('djcloudbridge.domain_model.get_cloud_provider')
+    def test_provider_memoized_per_request(self, mock_get_provider):
+        mock_get_provider.side_effect = lambda cloud, creds: object()
+        view = DummyView(self.request, cloud_pk='amazon')
+        provider = view_helpers.get_cloud_provider(view)
+        self.assertIs(provider, view_helpers.get_cloud_provider(view))
+        self.assertIs(provider, view_helpers.get_cloud_provider(
+            DummyView(self.request), cloud_id='amazon'))
+        self.assertEqual(mock_get_provider.call_count, 1)
+        cache = view_helpers.get_request_provider_cache(self.request)
+        self.assertEqual(cache.hits, 2)
+
+    @mock.patch('djcloudbridge.domain_model.get_cloud_provider')
+    def test_provider_not_shared_across_requests(self, mock_get_provider):
+        mock_get_provider.side_effect = lambda cloud, creds: object()
+        other_request = RequestFactory().get('/')
+        other_request.user = AnonymousUser()
+        provider = view_helpers.get_cloud_provider(
+            DummyView(self.request, cloud_pk='amazon'))
+        self.assertIsNot(provider, view_helpers.get_cloud_provider(
+            DummyView(other_request, cloud_pk='amazon')))
+        self.assertEqual(mock_get_provider.call_count, 2)
+
+
+class GetCredentialsTestCase(TestCase):
+
+    def setUp(self):
+        self.cloud = models.AWS.objects.create(
+            name='Amazon', slug='amazon', region_name='us-east-1')
+        user = User.objects.create(username='alice')
+        self.profile = models.UserProfile.objects.create(user=user)
+        self.request = RequestFactory().get('/')
+        self.request.user = user
+        view_helpers.credentials_cache.clear()
+
+    def tearDown(self):
+        view_helpers.credentials_cache.clear()
+
+    def add_credentials(self, name, default=False):
+        return models.AWSCredentials.objects.create(
+            name=name, cloud=self.cloud, user_profile=self.profile,
+            default=default, access_key=name, secret_key='secret')
+
+    def test_single_query_and_cached(self):
+        self.add_credentials('first')
+        with self.assertNumQueries(1):
+            creds = view_helpers.get_credentials_from_profile(
+                self.cloud, self.request)
+        self.assertEqual(creds['aws_access_key'], 'first')
+        self.assertEqual(creds['aws_secret_key'], 'secret')
+        with self.assertNumQueries(0):
+            view_helpers.get_credentials_from_profile(
+                self.cloud, self.request)
+
+    def test_default_preferred(self):
+        self.add_credentials('first')
+        self.add_credentials('second', default=True)
+        creds = view_helpers.get_credentials_from_profile(
+            self.cloud, self.request)
+        self.assertEqual(creds['aws_access_key'], 'second')
+
+    def test_too_many_credentials(self):
+        self.add_credentials('first')
+        self.add_credentials('second')
+        with self.assertRaises(ValueError):
+            view_helpers.get_credentials_from_profile(
+                self.cloud, self.request)
+
+    def test_cache_invalidated_on_save(self):
+        self.assertEqual(view_helpers.get_credentials_from_profile(
+            self.cloud, self.request), {})
+        self.add_credentials('first')
+        creds = view_helpers.get_credentials_from_profile(
+            self.cloud, self.request)
+        self.assertEqual(creds['aws_access_key'], 'first')
+
+    def test_credentials_by_id(self):
+        creds = self.add_credentials('first')
+        self.assertEqual(view_helpers.get_credentials_by_id(
+            self.cloud, self.request, creds.id)['name'], 'first')
+        self.assertEqual(view_helpers.get_credentials_by_id(
+            self.cloud, self.request, creds.id + 1), {})
+
+
+class CredentialsCacheTestCase(TestCase):
+
+    def test_oldest_evicted_when_full(self):
+        cache = view_helpers.CredentialsCache(max_size=2)
+        cache.set(('alice', 'amazon', None), {'name': 'a'})
+        cache.set(('bob', 'amazon', None), {'name': 'b'})
+        # Replacing an entry makes it the newest
+        cache.set(('alice', 'amazon', None), {'name': 'a2'})
+        cache.set(('carol', 'amazon', None), {'name': 'c'})
+        self.assertIsNone(cache.get(('bob', 'amazon', None)))
+        self.assertEqual(cache.get(('alice', 'amazon', None)), {'name': 'a2'})
+        self.assertEqual(cache.get(('carol', 'amazon', None)), {'name': 'c'})
@@ -0,0 +1,461 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_views
+------------
+
+Tests for `djcloudbridge` views module.
+"""
+import io
+from datetime import datetime
+from datetime import timezone
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase
+from django.test import override_settings
+from fernet_fields import EncryptedField
+from rest_framework.test import APIClient
+from rest_framework.test import APIRequestFactory
+from rest_framework.test import force_authenticate
+
+from djcloudbridge import domain_model
+from djcloudbridge import models
+from djcloudbridge import util
+from djcloudbridge import view_helpers
+from djcloudbridge import views
+
+
+class CloudViewSetTestCase(TestCase):
+
+    def setUp(self):
+        util.get_cache().clear()
+
+    def create_clouds(self, start, count):
+        for i in range(start, start + count):
+            models.AWS.objects.create(name='aws%s' % i, slug='aws%s' % i,
+                                      region_name='us-east-1')
+            models.OpenStack.objects.create(
+                name='os%s' % i, slug='os%s' % i, auth_url='http://keystone',
+                region_name='RegionOne')
+            domain_model.invalidate_cloud('aws%s' % i)
+            domain_model.invalidate_cloud('os%s' % i)
+
+    def test_list_query_count_is_constant(self):
+        client = APIClient()
+        self.create_clouds(0, 2)
+        # One query each for the last modification time, the last deletion,
+        # the count and the page of clouds
+        with self.assertNumQueries(4):
+            response = client.get('/clouds/')
+        self.assertEqual(response.data['count'], 4)
+        self.create_clouds(2, 10)
+        with self.assertNumQueries(4):
+            response = client.get('/clouds/')
+        self.assertEqual(response.data['count'], 24)
+        clouds = {cloud['slug']: cloud for cloud in response.data['results']}
+        self.assertEqual(clouds['aws0']['cloud_type'], 'aws')
+        self.assertEqual(clouds['os0']['extra_data']['auth_url'],
+                         'http://keystone')
+
+    def test_not_modified(self):
+        client = APIClient()
+        self.create_clouds(0, 1)
+        last_modified = client.get('/clouds/')['Last-Modified']
+        # Only the last modification and deletion times are queried
+        with self.assertNumQueries(2):
+            response = client.get('/clouds/',
+                                  HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['Last-Modified'], last_modified)
+        response = client.get('/clouds/aws0/',
+                              HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+    def test_modified_by_deletion(self):
+        client = APIClient()
+        self.create_clouds(0, 1)
+        with mock.patch('djcloudbridge.domain_model.datetime') as mock_dt:
+            mock_dt.now.return_value = datetime(2100, 1, 1, tzinfo=timezone.utc)
+            models.Cloud.objects.get(slug='os0').delete()
+        # Deletions are recorded durably, rather than in the cache
+        util.get_cache().clear()
+        response = client.get('/clouds/', HTTP_IF_MODIFIED_SINCE=client.get(
+            '/clouds/aws0/')['Last-Modified'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Last-Modified'],
+                         'Fri, 01 Jan 2100 00:00:00 GMT')
+
+
+class CredentialsViewSetTestCase(TestCase):
+
+    def setUp(self):
+        cloud = models.AWS.objects.create(name='Amazon', slug='amazon',
+                                          region_name='us-east-1')
+        self.user = User.objects.create(username='alice')
+        profile = models.UserProfile.objects.create(user=self.user)
+        for name in ('first', 'second'):
+            models.AWSCredentials.objects.create(
+                name=name, cloud=cloud, user_profile=profile,
+                access_key=name, secret_key='secret')
+
+    @mock.patch.object(EncryptedField, 'from_db_value', autospec=True)
+    def test_list_does_not_decrypt_secrets(self, mock_from_db_value):
+        request = APIRequestFactory().get('/')
+        force_authenticate(request, user=self.user)
+        view = views.AWSCredentialsViewSet.as_view({'get': 'list'})
+        response = view(request)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 2)
+        self.assertNotIn('secret_key', response.data['results'][0])
+        mock_from_db_value.assert_not_called()
+
+    def test_list_query_count_is_constant(self):
+        request = APIRequestFactory().get('/')
+        force_authenticate(request, user=self.user)
+        view = views.AWSCredentialsViewSet.as_view({'get': 'list'})
+        # Warm up the cloud cache used to serialize each nested cloud
+        view(request)
+        # Last modification and deletion times, count and page, with each
+        # page's clouds loaded through a join
+        with self.assertNumQueries(4):
+            self.assertEqual(len(view(request).data['results']), 2)
+
+    def test_modified_by_cloud(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        url = '/user/credentials/aws/'
+        last_modified = client.get(url)['Last-Modified']
+        models.AWS.objects.filter(slug='amazon').update(
+            updated=datetime(2100, 1, 1, tzinfo=timezone.utc))
+        response = client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Last-Modified'],
+                         'Fri, 01 Jan 2100 00:00:00 GMT')
+
+    def test_not_modified_without_deletions(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        url = '/user/credentials/aws/'
+        last_modified = client.get(url)['Last-Modified']
+        util.get_cache().clear()
+        response = client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+
+class FakeKeyPair(object):
+
+    def __init__(self, id):
+        self.id = id
+        self.name = id
+        self.material = None
+
+
+class AggregateListViewTestCase(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(username='alice')
+        profile = models.UserProfile.objects.create(user=self.user)
+        for slug in ('aws1', 'aws2', 'broken'):
+            cloud = models.AWS.objects.create(name=slug, slug=slug,
+                                              region_name='us-east-1')
+            models.AWSCredentials.objects.create(
+                name=slug, cloud=cloud, user_profile=profile,
+                access_key=slug, secret_key='secret')
+        models.AWS.objects.create(name='other', slug='other',
+                                  region_name='us-east-1')
+        view_helpers.credentials_cache.clear()
+
+    def get_provider(self, cloud, cred_dict):
+        if cloud.slug == 'broken':
+            raise Exception("Connection refused")
+        provider = mock.Mock()
+        provider.security.key_pairs.list.return_value = [
+            FakeKeyPair('%s-key' % cloud.slug)]
+        return provider
+
+    def list(self, url):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        with mock.patch('djcloudbridge.domain_model.get_cloud_provider',
+                        side_effect=self.get_provider):
+            return client.get(url)
+
+    def test_lists_all_clouds_with_credentials(self):
+        response = self.list('/aggregate/keypairs/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 2)
+        results = sorted(response.data['results'], key=lambda r: r['id'])
+        self.assertEqual([(r['cloud'], r['id']) for r in results],
+                         [('aws1', 'aws1-key'), ('aws2', 'aws2-key')])
+        self.assertTrue(results[0]['url'].endswith(
+            '/clouds/aws1/security/keypairs/aws1-key/'))
+        self.assertEqual(response.data['errors'], [
+            {'cloud': 'broken', 'error': 'Connection refused',
+             'timed_out': False}])
+
+    def test_restricted_to_requested_clouds(self):
+        response = self.list('/aggregate/keypairs/?clouds=aws2,other')
+        self.assertEqual([r['cloud'] for r in response.data['results']],
+                         ['aws2'])
+        self.assertEqual(response.data['errors'], [])
+
+    def test_unknown_resource(self):
+        self.assertEqual(self.list('/aggregate/unknown/').status_code, 404)
+
+
+class FakeVolume(object):
+
+    def __init__(self, id):
+        self.id = id
+        self.deleted = False
+
+    def delete(self):
+        if self.id == 'busy':
+            raise Exception("Volume is in use")
+        self.deleted = True
+
+
+class BulkOperationsTestCase(TestCase):
+
+    def setUp(self):
+        models.AWS.objects.create(name='Amazon', slug='amazon',
+                                  region_name='us-east-1')
+        self.user = User.objects.create(username='alice')
+        self.volumes = {pk: FakeVolume(pk) for pk in ('vol-1', 'busy')}
+        self.provider = mock.Mock()
+        self.provider.storage.volumes.get.side_effect = self.volumes.get
+
+    def post(self, url, data):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        with mock.patch('djcloudbridge.domain_model.get_cloud_provider',
+                        return_value=self.provider):
+            return client.post(url, data, format='json')
+
+    def test_bulk_delete(self):
+        response = self.post('/clouds/amazon/storage/volumes/bulk_delete/',
+                             {'ids': ['vol-1', 'missing', 'busy']})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'], [
+            {'id': 'vol-1', 'status': 'deleted'},
+            {'id': 'missing', 'status': 'not_found'},
+            {'id': 'busy', 'status': 'error', 'error': 'Volume is in use'}])
+        self.assertTrue(self.volumes['vol-1'].deleted)
+
+    def test_bulk_delete_requires_ids(self):
+        response = self.post('/clouds/amazon/storage/volumes/bulk_delete/',
+                             {'ids': []})
+        self.assertEqual(response.status_code, 400)
+
+    def test_bulk_create_reports_invalid_items(self):
+        response = self.post('/clouds/amazon/storage/volumes/bulk_create/',
+                             [{'size': 'not a number'}])
+        self.assertEqual(response.status_code, 200)
+        result = response.data['results'][0]
+        self.assertEqual(result['status'], 'invalid')
+        self.assertIn('size', result['errors'])
+
+
+class FakeBucketObject(object):
+
+    def __init__(self, name):
+        self.id = name
+        self.name = name
+        self.size = 11
+        self.last_modified = '2018-01-01T00:00:00'
+        self.uploaded = None
+        self._provider = mock.Mock(PROVIDER_ID='mock')
+
+    def iter_content(self):
+        return iter([b'hello', b' world'])
+
+    def generate_url(self, expires_in):
+        return 'https://signed.example.com/%s?expires=%s' % (self.name,
+                                                             expires_in)
+
+    def upload(self, data):
+        self.uploaded = data.read()
+
+    def upload_from_file(self, path):
+        with open(path, 'rb') as f:
+            self.uploaded = f.read()
+        self.uploaded_path = path
+
+
+class BucketObjectUploadTestCase(TestCase):
+
+    def setUp(self):
+        models.AWS.objects.create(name='Amazon', slug='amazon',
+                                  region_name='us-east-1')
+        self.user = User.objects.create(username='alice')
+        self.obj = FakeBucketObject('hello.txt')
+        self.provider = mock.Mock()
+        bucket = self.provider.storage.buckets.get.return_value
+        bucket.objects.create.return_value = self.obj
+
+    @override_settings(DJCLOUDBRIDGE_UPLOAD_CHUNK_SIZE=4)
+    def test_upload_streamed_from_disk(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        content = SimpleUploadedFile('hello.txt', b'hello world')
+        with mock.patch('djcloudbridge.domain_model.get_cloud_provider',
+                        return_value=self.provider):
+            response = client.post(
+                '/clouds/amazon/storage/buckets/bucket-1/objects/',
+                {'name': 'hello.txt', 'upload_content': content},
+                format='multipart')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.obj.uploaded, b'hello world')
+        # Small uploads are spooled to disk as well
+        self.assertTrue(hasattr(self.obj, 'uploaded_path'))
+
+
+class BucketObjectDownloadTestCase(TestCase):
+
+    url = '/clouds/amazon/storage/buckets/bucket-1/objects/hello.txt/'
+
+    def setUp(self):
+        models.AWS.objects.create(name='Amazon', slug='amazon',
+                                  region_name='us-east-1')
+        self.user = User.objects.create(username='alice')
+        self.provider = mock.Mock()
+        bucket = self.provider.storage.buckets.get.return_value
+        self.obj = FakeBucketObject('hello.txt')
+        bucket.objects.get.return_value = self.obj
+
+    def request(self, method='get', query='?format=binary', **headers):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        with mock.patch('djcloudbridge.domain_model.get_cloud_provider',
+                        return_value=self.provider):
+            return getattr(client, method)(self.url + query, **headers)
+
+    def test_full_download(self):
+        response = self.request()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content),
+                         b'hello world')
+        self.assertEqual(response['Content-Length'], '11')
+        self.assertEqual(response['Last-Modified'],
+                         'Mon, 01 Jan 2018 00:00:00 GMT')
+        # Ranges are served, but not advertised, without ranged reads
+        self.assertNotIn('Accept-Ranges', response)
+
+    def test_partial_download(self):
+        response = self.request(HTTP_RANGE='bytes=6-')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), b'world')
+        self.assertEqual(response['Content-Range'], 'bytes 6-10/11')
+        self.assertEqual(response['Content-Length'], '5')
+
+    def test_ranged_read(self):
+        self.obj._provider.PROVIDER_ID = 'aws'
+        self.obj._obj = mock.Mock()
+        self.obj._obj.get.return_value = {'Body': io.BytesIO(b'world')}
+        response = self.request(HTTP_RANGE='bytes=6-')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), b'world')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.obj._obj.get.assert_called_once_with(Range='bytes=6-10')
+
+    def test_range_not_satisfiable(self):
+        response = self.request(HTTP_RANGE='bytes=20-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */11')
+
+    def test_head(self):
+        response = self.request('head')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['Content-Length'], '11')
+        self.assertIn('Last-Modified', response)
+
+    @override_settings(DJCLOUDBRIDGE_DOWNLOAD_MODE='redirect',
+                       DJCLOUDBRIDGE_DOWNLOAD_URL_EXPIRY=60)
+    def test_redirect_mode(self):
+        response = self.request()
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response['Location'],
+                         'https://signed.example.com/hello.txt?expires=60')
+        # Metadata is still served by the application
+        self.assertEqual(self.request('head').status_code, 200)
+
+    @override_settings(DJCLOUDBRIDGE_DOWNLOAD_MODE='redirect')
+    def test_redirect_mode_falls_back_to_proxying(self):
+        self.obj.generate_url = mock.Mock(side_effect=NotImplementedError)
+        response = self.request()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content),
+                         b'hello world')
+
+    @override_settings(DJCLOUDBRIDGE_DOWNLOAD_MODE='redirect')
+    def test_never_signed_on_openstack(self):
+        models.OpenStack.objects.create(
+            name='OpenStack', slug='os', auth_url='http://keystone',
+            region_name='RegionOne')
+        self.url = self.url.replace('/amazon/', '/os/')
+        self.obj.generate_url = mock.Mock()
+        response = self.request()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content),
+                         b'hello world')
+        with override_settings(DJCLOUDBRIDGE_DOWNLOAD_MODE='url'):
+            response = self.request(query='')
+        self.assertTrue(response.data['download_url'].endswith(
+            self.url + '?format=binary'))
+        self.obj.generate_url.assert_not_called()
+
+    def test_download_url(self):
+        response = self.request(query='')
+        self.assertTrue(response.data['download_url'].endswith(
+            self.url + '?format=binary'))
+
+    @override_settings(DJCLOUDBRIDGE_DOWNLOAD_MODE='url')
+    def test_url_mode(self):
+        response = self.request(query='')
+        self.assertEqual(response.data['download_url'],
+                         'https://signed.example.com/hello.txt?expires=300')
+
+
+class BucketObjectListTestCase(TestCase):
+
+    url = '/clouds/amazon/storage/buckets/bucket-1/objects/'
+
+    def setUp(self):
+        models.AWS.objects.create(name='Amazon', slug='amazon',
+                                  region_name='us-east-1')
+        self.user = User.objects.create(username='alice')
+        self.provider = mock.Mock()
+        bucket = mock.Mock(spec=['_provider', 'objects'])
+        bucket._provider.PROVIDER_ID = 'mock'
+        bucket.objects.list.return_value = [
+            FakeBucketObject(name) for name in
+            ('a.txt', 'docs/a', 'docs/b', 'img/x', 'z.txt')]
+        self.provider.storage.buckets.get.return_value = bucket
+
+    def list(self, url):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        with mock.patch('djcloudbridge.domain_model.get_cloud_provider',
+                        return_value=self.provider):
+            return client.get(url)
+
+    def test_browse_by_delimiter(self):
+        response = self.list(self.url + '?delimiter=/&page_size=2')
+        self.assertEqual([obj['name'] for obj in response.data['results']],
+                         ['a.txt'])
+        self.assertEqual(response.data['common_prefixes'], ['docs/'])
+        response = self.list(response.data['next'])
+        self.assertEqual([obj['name'] for obj in response.data['results']],
+                         ['z.txt'])
+        self.assertEqual(response.data['common_prefixes'], ['img/'])
+        self.assertIsNone(response.data['next'])
+
+    def test_prefix(self):
+        response = self.list(self.url + '?prefix=docs/')
+        self.assertEqual([obj['name'] for obj in response.data['results']],
+                         ['docs/a', 'docs/b'])
+        self.assertNotIn('common_prefixes', response.data)
@@ -8,6 +8,7 @@ urlpatterns = [
     url(r'admin/', admin.site.urls),
     url(r'^', include('djcloudbridge.urls',
                       namespace='djcloudbridge')),
+    url(r'^', include('djcloudbridge.profile.urls')),
     url(r'^api-auth/', include('rest_framework.urls',
                                namespace='rest_framework'))
 